@@ -1,477 +1,610 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-from pandas.tseries.offsets import MonthEnd
-from db_utils import get_connection
-from io import BytesIO
-
-st.set_page_config(page_title="Visão Geral e Análise Anual", layout="wide")
-st.title("Visão Geral e Análise Anual")
-
-# --- Mapeamentos ---
-EMPRESAS = {
-    "Plugtech Brasil": [
-        'BB PLUG BRASIL RF', 'BNB PLUG BRASIL 8299', 'BNB ES FI PLUG BRASI',
-        'BB PLUG BRASIL', 'BNB RS FI PLUG BRASI', 'BNB PLUG BRASIL13815',
-        'BNB PLUG BRASIL13910', 'CEF PLUG BRASIL', 'CEF AP PLUG BRASIL',
-        'ADM PLUG BRASIL', 'PERDA CONT PLUG BRAS', 'PJBANK PLUGTECH BRAS',
-        'CARTAO 9412 PLUG BRA', 'F RESERVA P BRASIL'
-    ],
-    "Plugtech Gestão": [
-        'BB PLUG GESTAO RF', 'BB PLUG GESTAO', 'SICRED CAPITAL GESTA',
-        'ADM PLUG GESTAO', 'BNB PLUG GESTAO32495', 'PJBANK PLUGTECH GEST',
-        'SICRED PLUG GESTAO'
-    ],
-    "Plugtech Serviços": [
-        'BB PLUG SERVICOS RF', 'BB PLUG SERVICOS', 'BNB PLUG SERV 26551',
-        'BNB PLUG SERVIC28454', 'BNB FI AT PLUG SERVI', 'CEF PLUG SERVICOS',
-        'CEF AP PLUG SERVICOS', 'TESOURARIA PLUG SERV', 'ADM PLUG SERVICOS',
-        'PERDA CONT PLUG SERV', 'CARTAO 3948 PLUG SER', 'PJBANK PLUGTECG SERV',
-        'F RESERVA P SERVICOS'
-    ]
-}
-EQUIPMENT_CATEGORIES_MAP = {
-    "Impressoras Coloridas": "{col} LIKE '%COLOR%'",
-    "Impressoras Monocromáticas": "({col} LIKE '%MONO%' AND {col} NOT LIKE '%COLOR%')",
-    "Desktop": "({col} LIKE '%DESKTOP%' OR {col} LIKE '%CPU%')",
-    "Monitor": "{col} LIKE '%MONITOR%'",
-    "Notebook": "{col} LIKE '%NOTEBOOK%'",
-    "Outros": "({col} NOT LIKE '%COLOR%' AND {col} NOT LIKE '%MONO%' AND {col} NOT LIKE '%DESKTOP%' AND {col} NOT LIKE '%CPU%' AND {col} NOT LIKE '%MONITOR%' AND {col} NOT LIKE '%NOTEBOOK%')"
-}
-SITUACAO_MAP = { 'AB': 'Aberto', 'BL': 'Bloqueado', 'CA': 'Cancelado' }
-MESES_ABREV = { 1: 'JAN', 2: 'FEV', 3: 'MAR', 4: 'ABR', 5: 'MAI', 6: 'JUN', 7: 'JUL', 8: 'AGO', 9: 'SET', 10: 'OUT', 11: 'NOV', 12: 'DEZ' }
-
-# --- Conexão e Funções Auxiliares ---
-conn = get_connection()
-
-def fetch_data_safely(conn, query, params=(), expected_columns=None):
-    try:
-        df = pd.read_sql_query(query, conn, params=params)
-        if df.empty and expected_columns:
-            return pd.DataFrame(columns=expected_columns)
-        return df
-    except Exception as e:
-        st.error(f"Erro ao executar a query: {e}")
-        st.code(query)
-        if expected_columns:
-            return pd.DataFrame(columns=expected_columns)
-        return pd.DataFrame()
-
-@st.cache_data
-def to_excel(dfs_dict):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet_name, df in dfs_dict.items():
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-    return output.getvalue()
-
-# --- Sidebar ---
-st.sidebar.header("Filtros")
-empresas_selecionadas = st.sidebar.multiselect("Selecione a(s) Empresa(s)", options=list(EMPRESAS.keys()), default=list(EMPRESAS.keys()))
-equip_selecionados = st.sidebar.multiselect("Selecione o(s) Equipamento(s)", options=list(EQUIPMENT_CATEGORIES_MAP.keys()), default=list(EQUIPMENT_CATEGORIES_MAP.keys()))
-situacoes_selecionadas = st.sidebar.multiselect("Selecione o Tipo de Contrato", options=list(SITUACAO_MAP.keys()), format_func=lambda x: SITUACAO_MAP[x], default=['AB'])
-
-data_hoje = datetime.now()
-ano_atual = data_hoje.year
-ano_selecionado = st.sidebar.number_input("Ano", min_value=2010, max_value=ano_atual + 5, value=ano_atual)
-
-# --- Funções de busca de dados ---
-@st.cache_data(ttl=3600)
-def get_product_ids_by_category(categories):
-    if not categories or len(categories) == len(EQUIPMENT_CATEGORIES_MAP): return []
-    where_clauses = [EQUIPMENT_CATEGORIES_MAP.get(cat, "").format(col='DESCRICAO_PRODUTO') for cat in categories]
-    where_clauses = [clause for clause in where_clauses if clause]
-    if not where_clauses: return []
-    query = f"SELECT IDPRODUTO FROM PRODUTOS WHERE {' OR '.join(where_clauses)}"
-    df = fetch_data_safely(conn, query)
-    return df['IDPRODUTO'].tolist() if not df.empty else []
-
-def build_where_and_params(empresas, situacoes, product_ids=None, table_alias_map=None):
-    params, where_clauses, joins = [], [], []
-    if table_alias_map is None: table_alias_map = {}
-    conta_alias = table_alias_map.get('conta', 'c')
-    contrato_alias = table_alias_map.get('contrato', 'c')
-    if empresas:
-        contas = [conta for emp in empresas for conta in EMPRESAS.get(emp, [])]
-        if contas:
-            placeholders = ', '.join('?' for _ in contas)
-            joins.append(f"JOIN CONTAS_CORRENTE cc ON {conta_alias}.IDLOJA = cc.IDLOJA")
-            where_clauses.append(f"cc.NOME_CONTA IN ({placeholders})")
-            params.extend(contas)
-    if situacoes:
-        placeholders = ', '.join('?' for _ in situacoes)
-        where_clauses.append(f"{contrato_alias}.SITUACAO IN ({placeholders})")
-        params.extend(situacoes)
-    if product_ids:
-        joins.append(f"JOIN CONTRATOS_EQUIPAMENTO ce ON {contrato_alias}.IDCONTRATO = ce.IDCONTRATO")
-        joins.append("JOIN EQUIPAMENTOS_ITENS ei ON ce.IDEQUIPAMENTO_ITEM = ei.IDEQUIPAMENTO_ITEM")
-        placeholders = ', '.join('?' for _ in product_ids)
-        where_clauses.append(f"ei.IDPRODUTO IN ({placeholders})")
-        params.extend(product_ids)
-    return params, where_clauses, list(dict.fromkeys(joins))
-
-def get_faturamento(year, empresas, situacoes):
-    base_query = "SELECT SUM(v.VALOR_VENDA) AS VALOR FROM VENDAS v JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO"
-    params, where, joins = build_where_and_params(empresas, situacoes, table_alias_map={'conta': 'v', 'contrato': 'c'})
-    where.append("v.DATA_CANCELAMENTO IS NULL")
-    if year:
-        where.append("EXTRACT(YEAR FROM v.DATA_VENDA) = ?")
-        params.append(year)
-    query = base_query + " " + " ".join(joins) + " WHERE " + " AND ".join(where)
-    df = fetch_data_safely(conn, query, tuple(params))
-    return df['VALOR'].iloc[0] if not df.empty and pd.notna(df['VALOR'].iloc[0]) else 0
-
-def get_faturamento_mensal(year, empresas, situacoes):
-    query = "SELECT EXTRACT(MONTH FROM v.DATA_VENDA) AS MES, SUM(CASE WHEN EXTRACT(YEAR FROM v.DATA_VENDA) = ? THEN v.VALOR_VENDA ELSE 0 END) AS FAT_ATUAL, SUM(CASE WHEN EXTRACT(YEAR FROM v.DATA_VENDA) = ? THEN v.VALOR_VENDA ELSE 0 END) AS FAT_ANTERIOR FROM VENDAS v JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO"
-    params, where, joins = build_where_and_params(empresas, situacoes, table_alias_map={'conta': 'v', 'contrato': 'c'})
-    params_final = [year, year - 1] + params
-    where.append("v.DATA_CANCELAMENTO IS NULL")
-    query += " " + " ".join(joins) + " WHERE " + " AND ".join(where)
-    query += " GROUP BY MES ORDER BY MES"
-    return fetch_data_safely(conn, query, tuple(params_final), expected_columns=['MES', 'FAT_ATUAL', 'FAT_ANTERIOR'])
-
-def calcular_variacao(atual, anterior):
-    if anterior is None or anterior == 0: return 0.0
-    if atual is None: return -100.0
-    return ((atual - anterior) / anterior) * 100
-
-# --- Lógica Principal e de Faturamento ---
-ids_produto_selecionados = get_product_ids_by_category(equip_selecionados)
-faturamento_ano_inteiro_anterior = get_faturamento(ano_selecionado - 1, empresas_selecionadas, situacoes_selecionadas)
-faturamento_acumulado_ano_selecionado = get_faturamento(ano_selecionado, empresas_selecionadas, situacoes_selecionadas)
-df_fat_mensal = get_faturamento_mensal(ano_selecionado, empresas_selecionadas, situacoes_selecionadas)
-
-meses_df = pd.DataFrame({'MES': range(1, 13)})
-df_fat_mensal = pd.merge(meses_df, df_fat_mensal, on='MES', how='left').fillna(0)
-df_fat_mensal['MES_ABREV'] = df_fat_mensal['MES'].map(MESES_ABREV)
-
-if data_hoje.date() < (data_hoje.replace(day=1) + MonthEnd(1)).date():
-    meses_fechados = data_hoje.month - 1
-else:
-    meses_fechados = data_hoje.month
-
-tendencia_fim_ano, media_mensal_realizada = faturamento_acumulado_ano_selecionado, 0
-if ano_selecionado == ano_atual and meses_fechados > 0:
-    faturamento_meses_fechados = df_fat_mensal[df_fat_mensal['MES'] <= meses_fechados]['FAT_ATUAL'].sum()
-    media_mensal_realizada = faturamento_meses_fechados / meses_fechados
-    tendencia_fim_ano = faturamento_meses_fechados + (media_mensal_realizada * (12 - meses_fechados))
-
-faturamento_acumulado_pytd = 0
-if meses_fechados > 0:
-    faturamento_acumulado_pytd = df_fat_mensal[df_fat_mensal['MES'] <= meses_fechados]['FAT_ANTERIOR'].sum()
-
-faturamento_mes_anterior, faturamento_mes_anterior_py = 0, 0
-mes_anterior = meses_fechados
-if mes_anterior > 0:
-    faturamento_mes_anterior = df_fat_mensal[df_fat_mensal['MES'] == mes_anterior]['FAT_ATUAL'].iloc[0]
-    faturamento_mes_anterior_py = df_fat_mensal[df_fat_mensal['MES'] == mes_anterior]['FAT_ANTERIOR'].iloc[0]
-
-# --- Função para formatar valores em k, M, B ---
-def formatar_valor_abreviado(valor):
-    if abs(valor) >= 1_000_000_000:
-        return f"{valor/1_000_000_000:.1f}B"
-    elif abs(valor) >= 1_000_000:
-        return f"{valor/1_000_000:.1f}M"
-    elif abs(valor) >= 1_000:
-        return f"{valor/1_000:.0f}k"
-    else:
-        return f"{valor:.0f}"
-
-# --- Layout e Gráficos de Faturamento ---
-st.subheader(f"Análise de Faturamento: {ano_selecionado}")
-kpi1, kpi2, kpi3 = st.columns(3)
-
-kpi1.metric(
-    label=f"Faturamento Acumulado {ano_selecionado}",
-    value=f"R$ {formatar_valor_abreviado(faturamento_acumulado_ano_selecionado)}",
-    delta=f"{calcular_variacao(faturamento_acumulado_ano_selecionado, faturamento_acumulado_pytd):.1f}% vs mesmo período de {ano_selecionado-1}"
-)
-
-if mes_anterior > 0:
-    kpi2.metric(
-        label=f"Faturamento {MESES_ABREV[mes_anterior].capitalize()} {ano_selecionado}",
-        value=f"R$ {formatar_valor_abreviado(faturamento_mes_anterior)}",
-        delta=f"{calcular_variacao(faturamento_mes_anterior, faturamento_mes_anterior_py):.1f}% vs {MESES_ABREV[mes_anterior].capitalize()} {ano_selecionado-1}"
-    )
-else:
-    kpi2.metric(label="Faturamento Mês Anterior", value="N/A", delta="Aguardando fechamento do primeiro mês.")
-
-kpi3.metric(
-    label="Tendência até fim de ano",
-    value=f"R$ {formatar_valor_abreviado(tendencia_fim_ano)}",
-    delta=f"{calcular_variacao(tendencia_fim_ano, faturamento_ano_inteiro_anterior):.1f}% vs total de {ano_selecionado-1}"
-)
-
-col_graph_total, col_graph_mensal = st.columns([1, 2])
-with col_graph_total:
-    variacao_tendencia = calcular_variacao(tendencia_fim_ano, faturamento_ano_inteiro_anterior)
-    cor_tendencia = 'green' if variacao_tendencia >= 0 else 'red'
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=['Comparativo'],
-        y=[faturamento_ano_inteiro_anterior],
-        name=f"{ano_selecionado - 1}",
-        text=[f"R$ {formatar_valor_abreviado(faturamento_ano_inteiro_anterior)}"],
-        textposition="outside",
-        marker_color='lightslategray'
-    ))
-    fig.add_trace(go.Bar(
-        x=['Comparativo'],
-        y=[tendencia_fim_ano],
-        name=f"{ano_selecionado} (Tendência)",
-        text=[f"R$ {formatar_valor_abreviado(tendencia_fim_ano)}"],
-        textposition="outside",
-        marker_color=cor_tendencia
-    ))
-    if faturamento_ano_inteiro_anterior > 0 or tendencia_fim_ano > 0:
-        fig.add_annotation(
-            x='Comparativo',
-            y=max(tendencia_fim_ano, faturamento_ano_inteiro_anterior) * 1.2,
-            text=f"Variação: {variacao_tendencia:.1f}%",
-            showarrow=False,
-            font=dict(size=14, color=cor_tendencia)
-        )
-    fig.update_layout(
-        title="Comparativo Anual",
-        yaxis_title="Faturamento (R$)",
-        xaxis_title="",
-        barmode='group',
-        showlegend=True,
-        xaxis=dict(tickvals=[])
-    )
-    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
-
-with col_graph_mensal:
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        name=f'{ano_selecionado - 1}',
-        x=df_fat_mensal['MES_ABREV'],
-        y=df_fat_mensal['FAT_ANTERIOR'],
-        marker_color='lightslategray',
-        text=df_fat_mensal['FAT_ANTERIOR'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
-        textposition='outside'
-    ))
-
-    if ano_selecionado == ano_atual:
-        df_fat_mensal['FAT_EXIBICAO'] = df_fat_mensal.apply(
-            lambda row: media_mensal_realizada if row['MES'] > meses_fechados else row['FAT_ATUAL'], axis=1
-        )
-        colors = ['cornflowerblue'] * meses_fechados + ['lightskyblue'] * (12 - meses_fechados)
-        fig.add_trace(go.Bar(
-            name=f'{ano_selecionado}',
-            x=df_fat_mensal['MES_ABREV'],
-            y=df_fat_mensal['FAT_EXIBICAO'],
-            marker_color=colors,
-            text=df_fat_mensal['FAT_EXIBICAO'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
-            textposition='outside'
-        ))
-    else:
-        fig.add_trace(go.Bar(
-            name=f'{ano_selecionado}',
-            x=df_fat_mensal['MES_ABREV'],
-            y=df_fat_mensal['FAT_ATUAL'],
-            marker_color='cornflowerblue',
-            text=df_fat_mensal['FAT_ATUAL'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
-            textposition='outside'
-        ))
-
-    fig.update_layout(
-        barmode='group',
-        xaxis_title='Mês',
-        yaxis_title='Faturamento (R$)',
-        title="Faturamento Mensal Comparativo"
-    )
-    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
-
-    if ano_selecionado == ano_atual:
-        st.info("As barras mais claras representam uma tendência baseada na média dos meses fechados.")
-
-st.markdown("---")
-
-
-# --- Novos Gráficos de Pizza ---
-st.subheader("Análise Detalhada por Setor e Equipamento")
-mes_pizza = st.selectbox("Selecione o Mês para Análise", options=[0] + list(range(1, 13)), format_func=lambda x: 'Ano Inteiro' if x == 0 else MESES_ABREV[x])
-
-def get_faturamento_por_setor(year, month, empresas, situacoes):
-    query = "SELECT CASE p.IDGRUPO_PESSOA WHEN 8 THEN 'Público' WHEN 9 THEN 'Privado' ELSE 'Outros' END AS SETOR, SUM(v.VALOR_VENDA) AS FATURAMENTO FROM VENDAS v JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO JOIN PESSOAS p ON c.IDPESSOA = p.IDPESSOA"
-    params, where, joins = build_where_and_params(empresas, situacoes, table_alias_map={'conta': 'v', 'contrato': 'c'})
-    where.append("v.DATA_CANCELAMENTO IS NULL")
-    where.append("EXTRACT(YEAR FROM v.DATA_VENDA) = ?"); params.append(year)
-    if month != 0: where.append("EXTRACT(MONTH FROM v.DATA_VENDA) = ?"); params.append(month)
-    query += " " + " ".join(joins) + " WHERE " + " AND ".join(where) + " GROUP BY SETOR"
-    return fetch_data_safely(conn, query, tuple(params))
-
-# --- CORREÇÃO APLICADA AQUI ---
-def get_faturamento_por_equipamento(year, month, empresas, situacoes, product_ids):
-    case_clauses = " ".join([f"WHEN {cond.format(col='p.DESCRICAO_PRODUTO')} THEN '{cat}'" for cat, cond in EQUIPMENT_CATEGORIES_MAP.items()])
-    group_by_expression = f"CASE {case_clauses} END"
-    
-    # Query base agora contém apenas as JOINs essenciais e fixas
-    query = f"SELECT {group_by_expression} AS CATEGORIA, SUM(v.VALOR_VENDA) AS FATURAMENTO FROM VENDAS v JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO JOIN CONTRATOS_EQUIPAMENTO ce ON c.IDCONTRATO = ce.IDCONTRATO JOIN EQUIPAMENTOS_ITENS ei ON ce.IDEQUIPAMENTO_ITEM = ei.IDEQUIPAMENTO_ITEM JOIN PRODUTOS p ON ei.IDPRODUTO = p.IDPRODUTO"
-    
-    params, where, joins_from_helper = build_where_and_params(empresas, situacoes, product_ids, table_alias_map={'conta': 'v', 'contrato': 'c'})
-    
-    # Filtra as JOINs que já estão na query base para evitar duplicidade
-    joins_to_add = [
-        j for j in joins_from_helper 
-        if "JOIN CONTRATOS_EQUIPAMENTO ce" not in j and "JOIN EQUIPAMENTOS_ITENS ei" not in j
-    ]
-
-    query += " " + " ".join(joins_to_add)
-    
-    where.append("v.DATA_CANCELAMENTO IS NULL")
-    where.append("EXTRACT(YEAR FROM v.DATA_VENDA) = ?"); params.append(year)
-    if month != 0: where.append("EXTRACT(MONTH FROM v.DATA_VENDA) = ?"); params.append(month)
-    
-    if where: query += " WHERE " + " AND ".join(where)
-    
-    query += f" GROUP BY {group_by_expression} HAVING {group_by_expression} IS NOT NULL"
-    return fetch_data_safely(conn, query, tuple(params))
-
-
-df_setor = get_faturamento_por_setor(ano_selecionado, mes_pizza, empresas_selecionadas, situacoes_selecionadas)
-df_equip = get_faturamento_por_equipamento(ano_selecionado, mes_pizza, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-
-col_pie1, col_pie2 = st.columns(2)
-with col_pie1:
-    if not df_setor.empty:
-        fig_setor = px.pie(df_setor, names='SETOR', values='FATURAMENTO', title=f'Faturamento por Setor ({MESES_ABREV.get(mes_pizza, "Ano Inteiro")})', hole=.3)
-        st.plotly_chart(fig_setor, use_container_width=True)
-    else: st.warning("Não há dados de faturamento por setor para os filtros selecionados.")
-with col_pie2:
-    if not df_equip.empty:
-        fig_equip = px.pie(df_equip, names='CATEGORIA', values='FATURAMENTO', title=f'Faturamento por Equipamento ({MESES_ABREV.get(mes_pizza, "Ano Inteiro")})', hole=.3)
-        st.plotly_chart(fig_equip, use_container_width=True)
-    else: st.warning("Não há dados de faturamento por equipamento para os filtros selecionados.")
-
-st.markdown("---")
-
-# --- Gráficos de Clientes e Equipamentos ---
-def get_cumulative_clients(year, empresas, situacoes, product_ids):
-    query = "SELECT c.IDPESSOA, c.DATA_INICIO FROM CONTRATOS c"
-    params, where, joins = build_where_and_params(empresas, situacoes, product_ids, table_alias_map={'conta': 'c', 'contrato': 'c'})
-    query += " " + " ".join(joins)
-    if where: query += " WHERE " + " AND ".join(where)
-    df = fetch_data_safely(conn, query, tuple(params))
-    if df.empty: return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0]*12})
-    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
-    start_of_year = pd.to_datetime(f'{year}-01-01')
-    base_count = df[df['DATA_INICIO'] < start_of_year]['IDPESSOA'].nunique()
-    monthly_totals = []
-    for month in range(1, 13):
-        end_of_month = pd.to_datetime(f'{year}-{month}-01') + MonthEnd(0)
-        new_in_year = df[(df['DATA_INICIO'] >= start_of_year) & (df['DATA_INICIO'] <= end_of_month)]
-        total_at_month_end = base_count + new_in_year['IDPESSOA'].nunique()
-        monthly_totals.append(total_at_month_end)
-    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
-
-def get_historical_equipment(year, empresas, situacoes, product_ids):
-    query = "SELECT ce.IDCONTRATO_EQUIPAMENTO, c.DATA_INICIO, ce.DATA_RETIRADA FROM CONTRATOS_EQUIPAMENTO ce JOIN CONTRATOS c ON ce.IDCONTRATO = c.IDCONTRATO"
-    params, where, joins_from_helper = build_where_and_params(empresas, situacoes, product_ids, table_alias_map={'conta': 'c', 'contrato': 'c'})
-    joins_to_add = [j for j in joins_from_helper if "JOIN CONTRATOS_EQUIPAMENTO ce" not in j]
-    query += " " + " ".join(joins_to_add)
-    if where: query += " WHERE " + " AND ".join(where)
-    df = fetch_data_safely(conn, query, tuple(params))
-    if df.empty: return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0]*12})
-    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
-    df['DATA_RETIRADA'] = pd.to_datetime(df['DATA_RETIRADA'], errors='coerce')
-    monthly_totals = []
-    for month in range(1, 13):
-        end_of_month = pd.to_datetime(f'{year}-{month}-01') + MonthEnd(0)
-        active_df = df[(df['DATA_INICIO'] <= end_of_month) & ((df['DATA_RETIRADA'].isnull()) | (df['DATA_RETIRADA'] > end_of_month))]
-        count = active_df['IDCONTRATO_EQUIPAMENTO'].nunique()
-        monthly_totals.append(count)
-    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
-
-def get_cumulative_contracts(year, empresas, situacoes, product_ids):
-    query = "SELECT c.IDCONTRATO, c.DATA_INICIO FROM CONTRATOS c"
-    params, where, joins = build_where_and_params(
-        empresas, situacoes, product_ids,
-        table_alias_map={'conta': 'c', 'contrato': 'c'}
-    )
-    query += " " + " ".join(joins)
-    if where:
-        query += " WHERE " + " AND ".join(where)
-
-    df = fetch_data_safely(conn, query, tuple(params))
-    if df.empty:
-        return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0] * 12})
-
-    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
-
-    start_of_year = pd.to_datetime(f'{year}-01-01')
-
-    # contratos anteriores ao início do ano
-    base_count = len(df[df['DATA_INICIO'] < start_of_year])
-
-    monthly_totals = []
-    for month in range(1, 13):
-        end_of_month = pd.to_datetime(f'{year}-{month}-01') + MonthEnd(0)
-        # novos contratos iniciados até o fim do mês
-        new_in_year = df[(df['DATA_INICIO'] >= start_of_year) & (df['DATA_INICIO'] <= end_of_month)]
-        total_at_month_end = base_count + len(new_in_year)
-        monthly_totals.append(total_at_month_end)
-
-    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
-
-def plot_cumulative_chart(df_atual, df_anterior, title, yaxis_title):
-    df_merged = pd.merge(df_atual.rename(columns={'TOTAL': 'ATUAL'}), df_anterior.rename(columns={'TOTAL': 'ANTERIOR'}), on='MES')
-    df_merged['MES_ABREV'] = df_merged['MES'].map(MESES_ABREV)
-    fig = go.Figure()
-    fig.add_trace(go.Bar(name=f'{ano_selecionado - 1}', x=df_merged['MES_ABREV'], y=df_merged['ANTERIOR'], marker_color='lightslategray', text=df_merged['ANTERIOR'], textposition='outside'))
-    if ano_selecionado == ano_atual:
-        df_real = df_merged[df_merged['MES'] <= meses_fechados] if meses_fechados > 0 else df_merged[df_merged['MES'] <= data_hoje.month]
-        crescimento_medio = (df_real['ATUAL'].iloc[-1] - df_real['ATUAL'].iloc[0]) / (len(df_real) - 1) if len(df_real) > 1 else (df_real['ATUAL'].iloc[0] if not df_real.empty else 0)
-        valores_tendencia = list(df_merged['ATUAL'])
-        if not df_real.empty:
-            ultimo_valor_real = df_real['ATUAL'].iloc[-1]
-            for i in range(meses_fechados, 12):
-                ultimo_valor_real += crescimento_medio
-                valores_tendencia[i] = ultimo_valor_real
-        colors = ['cornflowerblue'] * meses_fechados + ['lightskyblue'] * (12 - meses_fechados)
-        fig.add_trace(go.Bar(name=f'{ano_selecionado}', x=df_merged['MES_ABREV'], y=valores_tendencia, marker_color=colors, text=[f'{int(v):,}' for v in valores_tendencia], textposition='outside'))
-    else:
-        fig.add_trace(go.Bar(name=f'{ano_selecionado}', x=df_merged['MES_ABREV'], y=df_merged['ATUAL'], marker_color='cornflowerblue', text=df_merged['ATUAL'], textposition='outside'))
-    fig.update_layout(barmode='group', title=title, xaxis_title='Mês', yaxis_title=yaxis_title)
-    st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
-    if ano_selecionado == ano_atual:
-        st.info("As barras mais claras representam uma tendência baseada no crescimento médio dos meses passados.")
-
-st.subheader("Total de Clientes Ativos")
-df_cli_atual = get_cumulative_clients(ano_selecionado, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-df_cli_anterior = get_cumulative_clients(ano_selecionado - 1, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-plot_cumulative_chart(df_cli_atual, df_cli_anterior, "Total de Clientes Ativos ao Final de Cada Mês", "Total de Clientes")
-
-st.subheader("Total de Equipamentos Ativos")
-df_equip_atual = get_historical_equipment(ano_selecionado, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-df_equip_anterior = get_historical_equipment(ano_selecionado - 1, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-plot_cumulative_chart(df_equip_atual, df_equip_anterior, "Total de Equipamentos Ativos ao Final de Cada Mês", "Total de Equipamentos")
-
-st.subheader("Total de Contratos Ativos")
-df_contr_atual = get_cumulative_contracts(ano_selecionado, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-df_contr_anterior = get_cumulative_contracts(ano_selecionado - 1, empresas_selecionadas, situacoes_selecionadas, ids_produto_selecionados)
-plot_cumulative_chart(df_contr_atual, df_contr_anterior, "Total de Contratos Ativos ao Final de Cada Mês", "Total de Contratos")
-
-# --- Botão de Exportação ---
-st.header("Exportar Dados")
-if st.button("Gerar Relatório em Excel"):
-    with st.spinner("Preparando arquivo..."):
-        df_cli_merged = pd.merge(df_cli_atual.rename(columns={'TOTAL': f'CLIENTES_{ano_selecionado}'}), df_cli_anterior.rename(columns={'TOTAL': f'CLIENTES_{ano_selecionado-1}'}), on='MES')
-        df_equip_merged = pd.merge(df_equip_atual.rename(columns={'TOTAL': f'EQUIP_{ano_selecionado}'}), df_equip_anterior.rename(columns={'TOTAL': f'EQUIP_{ano_selecionado-1}'}), on='MES')
-        dataframes_to_export = {
-            "Faturamento_Mensal": df_fat_mensal,
-            "Faturamento_por_Setor": df_setor,
-            "Faturamento_por_Equipamento": df_equip,
-            "Clientes_Ativos_Mensal": df_cli_merged,
-            "Equipamentos_Ativos_Mensal": df_equip_merged,
-        }
-        excel_data = to_excel(dataframes_to_export)
-        st.download_button(
-            label="Clique aqui para baixar o Excel",
-            data=excel_data,
-            file_name=f"relatorio_geral_{ano_selecionado}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+import streamlit as st
+import inicializacao  # antes dos demais: dispara a pré-carga do processo
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from datetime import datetime, timedelta
+from pandas.tseries.offsets import MonthEnd
+import comparativo
+import graficos
+import indice_clientes
+import instrumentacao
+import metricas
+import query_cache
+import tendencia
+from constantes import CASE_CATEGORIA_EQUIPAMENTO, EMPRESAS, EQUIPMENT_CATEGORIES_MAP, MESES_ABREV, SITUACAO_MAP
+from db_utils import ERROS_BANCO, get_connection, run_query
+from io import BytesIO
+
+st.set_page_config(page_title="Visão Geral e Análise Anual", layout="wide")
+st.title("Visão Geral e Análise Anual")
+
+# --- Conexão e Funções Auxiliares ---
+conn = get_connection()
+
+def fetch_data_safely(conn, query, params=(), expected_columns=None, formato="pandas", classe=None):
+    try:
+        df = run_query(conn, query, params=params, formato=formato, classe=classe)
+        if df.empty and expected_columns:
+            return pd.DataFrame(columns=expected_columns)
+        return df
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao executar a query: {e}")
+        st.code(query)
+        if expected_columns:
+            return pd.DataFrame(columns=expected_columns)
+        return pd.DataFrame()
+
+@query_cache.em_cache(ttl=600, aquecer=False)
+def to_excel(dfs_dict):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        for sheet_name, df in dfs_dict.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return output.getvalue()
+
+# --- Sidebar ---
+st.sidebar.header("Filtros")
+empresas_selecionadas = st.sidebar.multiselect("Selecione a(s) Empresa(s)", options=list(EMPRESAS.keys()), default=list(EMPRESAS.keys()))
+equip_selecionados = st.sidebar.multiselect("Selecione o(s) Equipamento(s)", options=list(EQUIPMENT_CATEGORIES_MAP.keys()), default=list(EQUIPMENT_CATEGORIES_MAP.keys()))
+situacoes_selecionadas = st.sidebar.multiselect("Selecione o Tipo de Contrato", options=list(SITUACAO_MAP.keys()), format_func=lambda x: SITUACAO_MAP[x], default=['AB'])
+
+data_hoje = datetime.now()
+ano_atual = data_hoje.year
+ano_selecionado = st.sidebar.number_input("Ano", min_value=2010, max_value=ano_atual + 5, value=ano_atual)
+comparar_empresas = st.sidebar.toggle("Comparar empresas", help="Todas as empresas lado a lado, calculadas em uma única passada (o filtro de empresas é ignorado).")
+modo_tendencia = st.sidebar.toggle("Tendência plurianual", help="Séries mensais de vários anos até o último mês fechado, com soma móvel de 12 meses e variação anual (o ano selecionado é ignorado).")
+if modo_tendencia:
+    meses_tendencia = st.sidebar.select_slider("Meses da tendência", options=[24, 36, 48, 60, 84, 120], value=36)
+inicializacao.indicador()
+
+# --- Funções de busca de dados ---
+@query_cache.em_cache(ttl=3600)
+def get_product_ids_by_category(equipamentos):
+    if not equipamentos or len(equipamentos) == len(EQUIPMENT_CATEGORIES_MAP): return []
+    where_clauses = [EQUIPMENT_CATEGORIES_MAP.get(cat, "").format(col='DESCRICAO_PRODUTO') for cat in equipamentos]
+    where_clauses = [clause for clause in where_clauses if clause]
+    if not where_clauses: return []
+    query = f"SELECT IDPRODUTO FROM PRODUTOS WHERE {' OR '.join(where_clauses)}"
+    df = fetch_data_safely(conn, query)
+    return df['IDPRODUTO'].tolist() if not df.empty else []
+
+def build_where_and_params(empresas, situacoes, product_ids=None, table_alias_map=None):
+    params, where_clauses, joins = [], [], []
+    if table_alias_map is None: table_alias_map = {}
+    conta_alias = table_alias_map.get('conta', 'c')
+    contrato_alias = table_alias_map.get('contrato', 'c')
+    if empresas:
+        contas = [conta for emp in empresas for conta in EMPRESAS.get(emp, [])]
+        if contas:
+            placeholders = ', '.join('?' for _ in contas)
+            joins.append(f"JOIN CONTAS_CORRENTE cc ON {conta_alias}.IDLOJA = cc.IDLOJA")
+            where_clauses.append(f"cc.NOME_CONTA IN ({placeholders})")
+            params.extend(contas)
+    if situacoes:
+        placeholders = ', '.join('?' for _ in situacoes)
+        where_clauses.append(f"{contrato_alias}.SITUACAO IN ({placeholders})")
+        params.extend(situacoes)
+    if product_ids:
+        joins.append(f"JOIN CONTRATOS_EQUIPAMENTO ce ON {contrato_alias}.IDCONTRATO = ce.IDCONTRATO")
+        joins.append("JOIN EQUIPAMENTOS_ITENS ei ON ce.IDEQUIPAMENTO_ITEM = ei.IDEQUIPAMENTO_ITEM")
+        placeholders = ', '.join('?' for _ in product_ids)
+        where_clauses.append(f"ei.IDPRODUTO IN ({placeholders})")
+        params.extend(product_ids)
+    return params, where_clauses, list(dict.fromkeys(joins))
+
+# Faturamento vem da camada de métricas (metricas.py): uma base por loja × mês × situação × setor,
+# compartilhada com a Inadimplência, fatiada aqui por ano, empresas e situações do contrato
+def get_faturamento(ano, empresas, situacoes):
+    filtros = {"COM_CONTRATO": 1, "SITUACAO": situacoes or None, "ANO": ano or None}
+    return metricas.fetch_metrica(conn, "faturamento", empresas, filtros, por=[])
+
+def get_faturamento_mensal_ano(ano, empresas, situacoes):
+    filtros = {"COM_CONTRATO": 1, "SITUACAO": situacoes or None, "ANO": ano}
+    return metricas.fetch_metrica(conn, "faturamento", empresas, filtros, por=["MES"]).rename(columns={"VALOR": "FATURAMENTO"})
+
+def get_faturamento_mensal(ano, empresas, situacoes):
+    df_atual = get_faturamento_mensal_ano(ano, empresas, situacoes).rename(columns={'FATURAMENTO': 'FAT_ATUAL'})
+    df_anterior = get_faturamento_mensal_ano(ano - 1, empresas, situacoes).rename(columns={'FATURAMENTO': 'FAT_ANTERIOR'})
+    return pd.merge(df_atual, df_anterior, on='MES', how='outer').fillna(0)
+
+def get_faturamento_por_setor(ano, mes, empresas, situacoes):
+    filtros = {"COM_CONTRATO": 1, "SITUACAO": situacoes or None, "ANO": ano, "MES": mes or None}
+    return metricas.fetch_metrica(conn, "faturamento", empresas, filtros, por=["SETOR"]).rename(columns={"VALOR": "FATURAMENTO"})
+
+# --- CORREÇÃO APLICADA AQUI ---
+@query_cache.em_cache(ttl=3600)
+def get_faturamento_por_equipamento(ano, mes, empresas, situacoes, ids_produto):
+    group_by_expression = CASE_CATEGORIA_EQUIPAMENTO
+    
+    # Query base agora contém apenas as JOINs essenciais e fixas
+    query = f"SELECT {group_by_expression} AS CATEGORIA, SUM(v.VALOR_VENDA) AS FATURAMENTO FROM VENDAS v JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO JOIN CONTRATOS_EQUIPAMENTO ce ON c.IDCONTRATO = ce.IDCONTRATO JOIN EQUIPAMENTOS_ITENS ei ON ce.IDEQUIPAMENTO_ITEM = ei.IDEQUIPAMENTO_ITEM JOIN PRODUTOS p ON ei.IDPRODUTO = p.IDPRODUTO"
+    
+    params, where, joins_from_helper = build_where_and_params(empresas, situacoes, ids_produto, table_alias_map={'conta': 'v', 'contrato': 'c'})
+    
+    # Filtra as JOINs que já estão na query base para evitar duplicidade
+    joins_to_add = [
+        j for j in joins_from_helper 
+        if "JOIN CONTRATOS_EQUIPAMENTO ce" not in j and "JOIN EQUIPAMENTOS_ITENS ei" not in j
+    ]
+
+    query += " " + " ".join(joins_to_add)
+    
+    where.append("v.DATA_CANCELAMENTO IS NULL")
+    where.append("EXTRACT(YEAR FROM v.DATA_VENDA) = ?"); params.append(ano)
+    if mes != 0: where.append("EXTRACT(MONTH FROM v.DATA_VENDA) = ?"); params.append(mes)
+    
+    if where: query += " WHERE " + " AND ".join(where)
+    
+    query += f" GROUP BY {group_by_expression} HAVING {group_by_expression} IS NOT NULL"
+    return fetch_data_safely(conn, query, tuple(params))
+
+
+# Bases dos gráficos acumulados: não dependem do ano, então são buscadas uma vez e servem
+# ao ano selecionado, ao anterior e à navegação entre anos (só o cálculo mensal é refeito)
+@query_cache.em_cache(ttl=3600)
+def get_contratos_base(empresas, situacoes, ids_produto):
+    query = "SELECT c.IDCONTRATO, c.IDPESSOA, c.DATA_INICIO FROM CONTRATOS c"
+    params, where, joins = build_where_and_params(empresas, situacoes, ids_produto, table_alias_map={'conta': 'c', 'contrato': 'c'})
+    query += " " + " ".join(joins)
+    if where: query += " WHERE " + " AND ".join(where)
+    return fetch_data_safely(conn, query, tuple(params), formato="arrow", classe="analitica")
+
+@query_cache.em_cache(ttl=3600)
+def get_equipamentos_base(empresas, situacoes, ids_produto):
+    query = "SELECT ce.IDCONTRATO_EQUIPAMENTO, c.DATA_INICIO, ce.DATA_RETIRADA FROM CONTRATOS_EQUIPAMENTO ce JOIN CONTRATOS c ON ce.IDCONTRATO = c.IDCONTRATO"
+    params, where, joins_from_helper = build_where_and_params(empresas, situacoes, ids_produto, table_alias_map={'conta': 'c', 'contrato': 'c'})
+    joins_to_add = [j for j in joins_from_helper if "JOIN CONTRATOS_EQUIPAMENTO ce" not in j]
+    query += " " + " ".join(joins_to_add)
+    if where: query += " WHERE " + " AND ".join(where)
+    return fetch_data_safely(conn, query, tuple(params), formato="arrow", classe="analitica")
+
+# Clientes distintos até cada fim de mês: sem filtro de equipamento saem do índice de bitmaps
+# (indice_clientes); o filtro de equipamento é por contrato e continua pela base em DataFrame
+def get_cumulative_clients(ano, empresas, situacoes, ids_produto):
+    if not ids_produto and conn is not None:
+        try:
+            return indice_clientes.contagens_mensais(conn, indice_clientes.metricas_contratos(situacoes), ano, empresas, acumulado=True)
+        except ERROS_BANCO:
+            instrumentacao.incrementar("indice_clientes.alternativas")  # a base em DataFrame exibe o erro do banco
+    return get_cumulative_clients_base(ano, empresas, situacoes, ids_produto)
+
+@query_cache.em_cache(ttl=3600)
+def get_cumulative_clients_base(ano, empresas, situacoes, ids_produto):
+    df = get_contratos_base(empresas, situacoes, ids_produto)
+    if df.empty: return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0]*12})
+    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
+    monthly_totals = []
+    for mes in range(1, 13):
+        end_of_month = pd.to_datetime(f'{ano}-{mes}-01') + MonthEnd(0)
+        monthly_totals.append(df[df['DATA_INICIO'] <= end_of_month]['IDPESSOA'].nunique())
+    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
+
+@query_cache.em_cache(ttl=3600)
+def get_historical_equipment(ano, empresas, situacoes, ids_produto):
+    df = get_equipamentos_base(empresas, situacoes, ids_produto)
+    if df.empty: return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0]*12})
+    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
+    df['DATA_RETIRADA'] = pd.to_datetime(df['DATA_RETIRADA'], errors='coerce')
+    monthly_totals = []
+    for mes in range(1, 13):
+        end_of_month = pd.to_datetime(f'{ano}-{mes}-01') + MonthEnd(0)
+        active_df = df[(df['DATA_INICIO'] <= end_of_month) & ((df['DATA_RETIRADA'].isnull()) | (df['DATA_RETIRADA'] > end_of_month))]
+        count = active_df['IDCONTRATO_EQUIPAMENTO'].nunique()
+        monthly_totals.append(count)
+    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
+
+@query_cache.em_cache(ttl=3600)
+def get_cumulative_contracts(ano, empresas, situacoes, ids_produto):
+    df = get_contratos_base(empresas, situacoes, ids_produto)
+    if df.empty:
+        return pd.DataFrame({'MES': range(1, 13), 'TOTAL': [0] * 12})
+
+    df['DATA_INICIO'] = pd.to_datetime(df['DATA_INICIO'])
+
+    start_of_year = pd.to_datetime(f'{ano}-01-01')
+
+    # contratos anteriores ao início do ano
+    base_count = len(df[df['DATA_INICIO'] < start_of_year])
+
+    monthly_totals = []
+    for mes in range(1, 13):
+        end_of_month = pd.to_datetime(f'{ano}-{mes}-01') + MonthEnd(0)
+        # novos contratos iniciados até o fim do mês
+        new_in_year = df[(df['DATA_INICIO'] >= start_of_year) & (df['DATA_INICIO'] <= end_of_month)]
+        total_at_month_end = base_count + len(new_in_year)
+        monthly_totals.append(total_at_month_end)
+
+    return pd.DataFrame({'MES': range(1, 13), 'TOTAL': monthly_totals})
+
+# --- Função para formatar valores em k, M, B ---
+def formatar_valor_abreviado(valor):
+    if abs(valor) >= 1_000_000_000:
+        return f"{valor/1_000_000_000:.1f}B"
+    elif abs(valor) >= 1_000_000:
+        return f"{valor/1_000_000:.1f}M"
+    elif abs(valor) >= 1_000:
+        return f"{valor/1_000:.0f}k"
+    else:
+        return f"{valor:.0f}"
+
+def calcular_variacao(atual, anterior):
+    if anterior is None or anterior == 0: return 0.0
+    if atual is None: return -100.0
+    return ((atual - anterior) / anterior) * 100
+
+# --- Mapa de dependências: entrada (widget ou valor derivado) -> loaders que a recebem ---
+# Cada loader é cacheado pelos seus argumentos e recebe apenas as entradas listadas aqui, então
+# trocar um widget só reexecuta os loaders que dependem dele. `mes` é o seletor dos gráficos de
+# pizza, que fica num fragmento e por isso não reexecuta o restante da página.
+LOADERS_FATURAMENTO = ["faturamento", "faturamento_mensal", "faturamento_por_setor", "faturamento_por_equipamento"]
+LOADERS_ACUMULADOS = ["clientes_ativos", "equipamentos_ativos", "contratos_ativos"]
+DEPENDENCIAS = {
+    "empresas": LOADERS_FATURAMENTO + LOADERS_ACUMULADOS,
+    "situacoes": LOADERS_FATURAMENTO + LOADERS_ACUMULADOS,
+    "ano": LOADERS_FATURAMENTO + LOADERS_ACUMULADOS,
+    "equipamentos": ["ids_produto"],
+    "ids_produto": ["faturamento_por_equipamento"] + LOADERS_ACUMULADOS,
+    "mes": ["faturamento_por_setor", "faturamento_por_equipamento"],
+}
+LOADERS = {
+    "ids_produto": get_product_ids_by_category,
+    "faturamento": get_faturamento,
+    "faturamento_mensal": get_faturamento_mensal,
+    "faturamento_por_setor": get_faturamento_por_setor,
+    "faturamento_por_equipamento": get_faturamento_por_equipamento,
+    "clientes_ativos": get_cumulative_clients,
+    "equipamentos_ativos": get_historical_equipment,
+    "contratos_ativos": get_cumulative_contracts,
+}
+
+def carregar(loader, **entradas):
+    """Chama o loader só com as entradas de que ele depende; `entradas` sobrescreve valores (ex.: ano anterior)."""
+    valores = {**valores_entradas, **entradas}
+    argumentos = {nome: valores[nome] for nome, loaders in DEPENDENCIAS.items() if loader in loaders}
+    return LOADERS[loader](**argumentos)
+
+valores_entradas = {
+    "empresas": empresas_selecionadas,
+    "situacoes": situacoes_selecionadas,
+    "ano": ano_selecionado,
+    "equipamentos": equip_selecionados,
+}
+valores_entradas["ids_produto"] = carregar("ids_produto")
+
+# --- Modo de comparação: todas as empresas agrupadas em uma passada (comparativo.py) ---
+def figura_comparativo_empresas(serie, ano):
+    serie = serie.assign(MES_ABREV=serie['MES'].map(MESES_ABREV))
+    fig = px.bar(serie, x='MES_ABREV', y='VALOR', color='EMPRESA', barmode='group', title=f"Faturamento Mensal por Empresa ({ano})", labels={'MES_ABREV': 'Mês', 'VALOR': 'Faturamento (R$)', 'EMPRESA': 'Empresa'})
+    fig.update_xaxes(categoryorder='array', categoryarray=list(MESES_ABREV.values()))
+    return fig
+
+if comparar_empresas:
+    st.subheader(f"Comparativo entre Empresas: {ano_selecionado}")
+    try:
+        kpis_empresas, serie_empresas = comparativo.visao_geral(conn, ano_selecionado, situacoes_selecionadas, valores_entradas["ids_produto"], data_hoje.date())
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao calcular o comparativo entre empresas: {e}")
+        st.stop()
+    for coluna, (empresa, kpi) in zip(st.columns(len(kpis_empresas)), kpis_empresas.iterrows()):
+        coluna.markdown(f"**{empresa}**")
+        coluna.metric(f"Faturamento Acumulado {ano_selecionado}", f"R$ {formatar_valor_abreviado(kpi['FATURAMENTO'])}", f"{kpi['VARIACAO']:.1f}% vs mesmo período de {ano_selecionado-1}")
+        coluna.metric("Tendência até fim de ano", f"R$ {formatar_valor_abreviado(kpi['TENDENCIA'])}")
+        coluna.metric("Clientes Ativos", f"{int(kpi['CLIENTES_ATIVOS'])}")
+        coluna.metric("Contratos Ativos", f"{int(kpi['CONTRATOS_ATIVOS'])}")
+        coluna.metric("Equipamentos Ativos", f"{int(kpi['EQUIPAMENTOS_ATIVOS'])}")
+    graficos.exibir(figura_comparativo_empresas, {"serie": serie_empresas, "ano": ano_selecionado}, use_container_width=True, config={'displayModeBar': False})
+    st.stop()
+
+# --- Modo tendência: N meses até o último mês fechado, cada série de uma passada (tendencia.py) ---
+def figura_tendencia_faturamento(df):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(name='Mensal', x=df['PERIODO'], y=df['FATURAMENTO'], marker_color='cornflowerblue'))
+    fig.add_trace(go.Scatter(
+        name='Soma móvel 12 meses', x=df['PERIODO'], y=df['FATURAMENTO_12M'], yaxis='y2', mode='lines', line=dict(color='darkorange'),
+        customdata=df['FATURAMENTO_12M_VAR_ANUAL'], hovertemplate='R$ %{y:,.0f}<br>%{customdata:.1f}% vs 12 meses antes<extra></extra>',
+    ))
+    fig.update_layout(
+        title="Faturamento Mensal e Soma Móvel de 12 Meses", xaxis_title='Mês', yaxis_title='Faturamento Mensal (R$)',
+        yaxis2=dict(title='Soma 12 Meses (R$)', overlaying='y', side='right', tickmode='sync'),
+        xaxis=dict(tickformat='%b %Y'), legend=dict(orientation='h', y=-0.2),
+    )
+    return fig
+
+def figura_tendencia_ativos(df, coluna, titulo):
+    fig = go.Figure(go.Scatter(
+        x=df['PERIODO'], y=df[coluna], mode='lines', line=dict(color='cornflowerblue'),
+        customdata=df[f'{coluna}_VAR_ANUAL'], hovertemplate='%{y:,}<br>%{customdata:.1f}% vs mesmo mês do ano anterior<extra></extra>',
+    ))
+    fig.update_layout(title=titulo, xaxis_title='Mês', yaxis_title='Total', xaxis=dict(tickformat='%b %Y'))
+    return fig
+
+def formatar_variacao_anual(variacao):
+    return None if pd.isna(variacao) else f"{variacao:.1f}% em 12 meses"
+
+if modo_tendencia:
+    fim_tendencia = (data_hoje + timedelta(days=1)).replace(day=1) - timedelta(days=1)  # último mês fechado
+    st.subheader(f"Tendência dos Últimos {meses_tendencia} Meses (até {MESES_ABREV[fim_tendencia.month]} {fim_tendencia.year})")
+    try:
+        df_tendencia = tendencia.series(conn, fim_tendencia.year, fim_tendencia.month, meses_tendencia, empresas_selecionadas, situacoes_selecionadas, valores_entradas["ids_produto"])
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao calcular a tendência: {e}")
+        st.stop()
+    ultimo = df_tendencia.iloc[-1]
+    kpi1, kpi2, kpi3, kpi4 = st.columns(4)
+    kpi1.metric("Faturamento 12 Meses", f"R$ {formatar_valor_abreviado(ultimo['FATURAMENTO_12M'])}", formatar_variacao_anual(ultimo['FATURAMENTO_12M_VAR_ANUAL']))
+    for coluna_kpi, coluna in zip((kpi2, kpi3, kpi4), ["CLIENTES_ATIVOS", "EQUIPAMENTOS_ATIVOS", "CONTRATOS_ATIVOS"]):
+        coluna_kpi.metric(tendencia.SERIES[coluna], f"{int(ultimo[coluna]):,}".replace(",", "."), formatar_variacao_anual(ultimo[f'{coluna}_VAR_ANUAL']))
+    graficos.exibir(figura_tendencia_faturamento, {"df": df_tendencia}, use_container_width=True, config={'displayModeBar': False})
+    for coluna in ["CLIENTES_ATIVOS", "EQUIPAMENTOS_ATIVOS", "CONTRATOS_ATIVOS"]:
+        graficos.exibir(figura_tendencia_ativos, {"df": df_tendencia, "coluna": coluna, "titulo": f"{tendencia.SERIES[coluna]} ao Final de Cada Mês"}, use_container_width=True, config={'displayModeBar': False})
+    st.download_button(
+        label="Baixar séries em Excel",
+        data=to_excel({"Tendencia": df_tendencia.assign(PERIODO=df_tendencia['PERIODO'].dt.strftime('%Y-%m'))}),
+        file_name=f"tendencia_{meses_tendencia}_meses.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    st.stop()
+
+# --- Lógica Principal e de Faturamento (depende de empresas, situações e ano) ---
+faturamento_ano_inteiro_anterior = carregar("faturamento", ano=ano_selecionado - 1)
+faturamento_acumulado_ano_selecionado = carregar("faturamento")
+df_fat_mensal = carregar("faturamento_mensal")
+
+meses_df = pd.DataFrame({'MES': range(1, 13)})
+df_fat_mensal = pd.merge(meses_df, df_fat_mensal, on='MES', how='left').fillna(0)
+df_fat_mensal['MES_ABREV'] = df_fat_mensal['MES'].map(MESES_ABREV)
+
+if data_hoje.date() < (data_hoje.replace(day=1) + MonthEnd(1)).date():
+    meses_fechados = data_hoje.month - 1
+else:
+    meses_fechados = data_hoje.month
+
+tendencia_fim_ano, media_mensal_realizada = faturamento_acumulado_ano_selecionado, 0
+if ano_selecionado == ano_atual and meses_fechados > 0:
+    faturamento_meses_fechados = df_fat_mensal[df_fat_mensal['MES'] <= meses_fechados]['FAT_ATUAL'].sum()
+    media_mensal_realizada = faturamento_meses_fechados / meses_fechados
+    tendencia_fim_ano = faturamento_meses_fechados + (media_mensal_realizada * (12 - meses_fechados))
+
+faturamento_acumulado_pytd = 0
+if meses_fechados > 0:
+    faturamento_acumulado_pytd = df_fat_mensal[df_fat_mensal['MES'] <= meses_fechados]['FAT_ANTERIOR'].sum()
+
+faturamento_mes_anterior, faturamento_mes_anterior_py = 0, 0
+mes_anterior = meses_fechados
+if mes_anterior > 0:
+    faturamento_mes_anterior = df_fat_mensal[df_fat_mensal['MES'] == mes_anterior]['FAT_ATUAL'].iloc[0]
+    faturamento_mes_anterior_py = df_fat_mensal[df_fat_mensal['MES'] == mes_anterior]['FAT_ANTERIOR'].iloc[0]
+
+# --- Layout e Gráficos de Faturamento ---
+st.subheader(f"Análise de Faturamento: {ano_selecionado}")
+kpi1, kpi2, kpi3 = st.columns(3)
+
+kpi1.metric(
+    label=f"Faturamento Acumulado {ano_selecionado}",
+    value=f"R$ {formatar_valor_abreviado(faturamento_acumulado_ano_selecionado)}",
+    delta=f"{calcular_variacao(faturamento_acumulado_ano_selecionado, faturamento_acumulado_pytd):.1f}% vs mesmo período de {ano_selecionado-1}"
+)
+
+if mes_anterior > 0:
+    kpi2.metric(
+        label=f"Faturamento {MESES_ABREV[mes_anterior].capitalize()} {ano_selecionado}",
+        value=f"R$ {formatar_valor_abreviado(faturamento_mes_anterior)}",
+        delta=f"{calcular_variacao(faturamento_mes_anterior, faturamento_mes_anterior_py):.1f}% vs {MESES_ABREV[mes_anterior].capitalize()} {ano_selecionado-1}"
+    )
+else:
+    kpi2.metric(label="Faturamento Mês Anterior", value="N/A", delta="Aguardando fechamento do primeiro mês.")
+
+kpi3.metric(
+    label="Tendência até fim de ano",
+    value=f"R$ {formatar_valor_abreviado(tendencia_fim_ano)}",
+    delta=f"{calcular_variacao(tendencia_fim_ano, faturamento_ano_inteiro_anterior):.1f}% vs total de {ano_selecionado-1}"
+)
+
+# Figuras montadas a partir dos argumentos; graficos.exibir reaproveita o JSON quando não mudam
+def figura_comparativo_anual(faturamento_anterior, tendencia, ano):
+    variacao_tendencia = calcular_variacao(tendencia, faturamento_anterior)
+    cor_tendencia = 'green' if variacao_tendencia >= 0 else 'red'
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=['Comparativo'],
+        y=[faturamento_anterior],
+        name=f"{ano - 1}",
+        text=[f"R$ {formatar_valor_abreviado(faturamento_anterior)}"],
+        textposition="outside",
+        marker_color='lightslategray'
+    ))
+    fig.add_trace(go.Bar(
+        x=['Comparativo'],
+        y=[tendencia],
+        name=f"{ano} (Tendência)",
+        text=[f"R$ {formatar_valor_abreviado(tendencia)}"],
+        textposition="outside",
+        marker_color=cor_tendencia
+    ))
+    if faturamento_anterior > 0 or tendencia > 0:
+        fig.add_annotation(
+            x='Comparativo',
+            y=max(tendencia, faturamento_anterior) * 1.2,
+            text=f"Variação: {variacao_tendencia:.1f}%",
+            showarrow=False,
+            font=dict(size=14, color=cor_tendencia)
+        )
+    fig.update_layout(
+        title="Comparativo Anual",
+        yaxis_title="Faturamento (R$)",
+        xaxis_title="",
+        barmode='group',
+        showlegend=True,
+        xaxis=dict(tickvals=[])
+    )
+    return fig
+
+def figura_faturamento_mensal(df_fat_mensal, ano, com_tendencia, meses_fechados):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        name=f'{ano - 1}',
+        x=df_fat_mensal['MES_ABREV'],
+        y=df_fat_mensal['FAT_ANTERIOR'],
+        marker_color='lightslategray',
+        text=df_fat_mensal['FAT_ANTERIOR'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
+        textposition='outside'
+    ))
+
+    if com_tendencia:
+        colors = ['cornflowerblue'] * meses_fechados + ['lightskyblue'] * (12 - meses_fechados)
+        fig.add_trace(go.Bar(
+            name=f'{ano}',
+            x=df_fat_mensal['MES_ABREV'],
+            y=df_fat_mensal['FAT_EXIBICAO'],
+            marker_color=colors,
+            text=df_fat_mensal['FAT_EXIBICAO'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
+            textposition='outside'
+        ))
+    else:
+        fig.add_trace(go.Bar(
+            name=f'{ano}',
+            x=df_fat_mensal['MES_ABREV'],
+            y=df_fat_mensal['FAT_ATUAL'],
+            marker_color='cornflowerblue',
+            text=df_fat_mensal['FAT_ATUAL'].apply(lambda x: f'R$ {formatar_valor_abreviado(x)}' if x > 0 else ''),
+            textposition='outside'
+        ))
+
+    fig.update_layout(
+        barmode='group',
+        xaxis_title='Mês',
+        yaxis_title='Faturamento (R$)',
+        title="Faturamento Mensal Comparativo"
+    )
+    return fig
+
+col_graph_total, col_graph_mensal = st.columns([1, 2])
+with col_graph_total:
+    graficos.exibir(
+        figura_comparativo_anual,
+        {"faturamento_anterior": faturamento_ano_inteiro_anterior, "tendencia": tendencia_fim_ano, "ano": ano_selecionado},
+        use_container_width=True, config={'displayModeBar': False},
+    )
+
+with col_graph_mensal:
+    if ano_selecionado == ano_atual:
+        df_fat_mensal['FAT_EXIBICAO'] = df_fat_mensal.apply(
+            lambda row: media_mensal_realizada if row['MES'] > meses_fechados else row['FAT_ATUAL'], axis=1
+        )
+    graficos.exibir(
+        figura_faturamento_mensal,
+        {"df_fat_mensal": df_fat_mensal, "ano": ano_selecionado, "com_tendencia": ano_selecionado == ano_atual, "meses_fechados": meses_fechados},
+        use_container_width=True, config={'displayModeBar': False},
+    )
+
+    if ano_selecionado == ano_atual:
+        st.info("As barras mais claras representam uma tendência baseada na média dos meses fechados.")
+
+st.markdown("---")
+
+# --- Novos Gráficos de Pizza ---
+st.subheader("Análise Detalhada por Setor e Equipamento")
+
+def figura_pizza(df, nomes, titulo):
+    return px.pie(df, names=nomes, values='FATURAMENTO', title=titulo, hole=.3)
+
+@st.fragment
+def secao_pizza():
+    """Gráficos de pizza: trocar o mês reexecuta apenas este fragmento."""
+    mes_pizza = st.selectbox("Selecione o Mês para Análise", options=[0] + list(range(1, 13)), format_func=lambda x: 'Ano Inteiro' if x == 0 else MESES_ABREV[x], key="mes_pizza")
+    df_setor = carregar("faturamento_por_setor", mes=mes_pizza)
+    df_equip = carregar("faturamento_por_equipamento", mes=mes_pizza)
+
+    col_pie1, col_pie2 = st.columns(2)
+    with col_pie1:
+        if not df_setor.empty:
+            graficos.exibir(figura_pizza, {"df": df_setor, "nomes": 'SETOR', "titulo": f'Faturamento por Setor ({MESES_ABREV.get(mes_pizza, "Ano Inteiro")})'}, use_container_width=True)
+        else: st.warning("Não há dados de faturamento por setor para os filtros selecionados.")
+    with col_pie2:
+        if not df_equip.empty:
+            graficos.exibir(figura_pizza, {"df": df_equip, "nomes": 'CATEGORIA', "titulo": f'Faturamento por Equipamento ({MESES_ABREV.get(mes_pizza, "Ano Inteiro")})'}, use_container_width=True)
+        else: st.warning("Não há dados de faturamento por equipamento para os filtros selecionados.")
+
+secao_pizza()
+st.markdown("---")
+
+def figura_acumulada(df_atual, df_anterior, title, yaxis_title, ano, com_tendencia, meses_fechados, mes_hoje):
+    df_merged = pd.merge(df_atual.rename(columns={'TOTAL': 'ATUAL'}), df_anterior.rename(columns={'TOTAL': 'ANTERIOR'}), on='MES')
+    df_merged['MES_ABREV'] = df_merged['MES'].map(MESES_ABREV)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(name=f'{ano - 1}', x=df_merged['MES_ABREV'], y=df_merged['ANTERIOR'], marker_color='lightslategray', text=df_merged['ANTERIOR'], textposition='outside'))
+    if com_tendencia:
+        df_real = df_merged[df_merged['MES'] <= meses_fechados] if meses_fechados > 0 else df_merged[df_merged['MES'] <= mes_hoje]
+        crescimento_medio = (df_real['ATUAL'].iloc[-1] - df_real['ATUAL'].iloc[0]) / (len(df_real) - 1) if len(df_real) > 1 else (df_real['ATUAL'].iloc[0] if not df_real.empty else 0)
+        valores_tendencia = list(df_merged['ATUAL'])
+        if not df_real.empty:
+            ultimo_valor_real = df_real['ATUAL'].iloc[-1]
+            for i in range(meses_fechados, 12):
+                ultimo_valor_real += crescimento_medio
+                valores_tendencia[i] = ultimo_valor_real
+        colors = ['cornflowerblue'] * meses_fechados + ['lightskyblue'] * (12 - meses_fechados)
+        fig.add_trace(go.Bar(name=f'{ano}', x=df_merged['MES_ABREV'], y=valores_tendencia, marker_color=colors, text=[f'{int(v):,}' for v in valores_tendencia], textposition='outside'))
+    else:
+        fig.add_trace(go.Bar(name=f'{ano}', x=df_merged['MES_ABREV'], y=df_merged['ATUAL'], marker_color='cornflowerblue', text=df_merged['ATUAL'], textposition='outside'))
+    fig.update_layout(barmode='group', title=title, xaxis_title='Mês', yaxis_title=yaxis_title)
+    return fig
+
+def plot_cumulative_chart(df_atual, df_anterior, title, yaxis_title):
+    argumentos = {
+        "df_atual": df_atual, "df_anterior": df_anterior, "title": title, "yaxis_title": yaxis_title, "ano": ano_selecionado,
+        "com_tendencia": ano_selecionado == ano_atual, "meses_fechados": meses_fechados, "mes_hoje": data_hoje.month,
+    }
+    graficos.exibir(figura_acumulada, argumentos, use_container_width=True, config={'displayModeBar': False})
+    if ano_selecionado == ano_atual:
+        st.info("As barras mais claras representam uma tendência baseada no crescimento médio dos meses passados.")
+
+# --- Gráficos de Clientes e Equipamentos ---
+st.subheader("Total de Clientes Ativos")
+df_cli_atual = carregar("clientes_ativos")
+df_cli_anterior = carregar("clientes_ativos", ano=ano_selecionado - 1)
+plot_cumulative_chart(df_cli_atual, df_cli_anterior, "Total de Clientes Ativos ao Final de Cada Mês", "Total de Clientes")
+
+st.subheader("Total de Equipamentos Ativos")
+df_equip_atual = carregar("equipamentos_ativos")
+df_equip_anterior = carregar("equipamentos_ativos", ano=ano_selecionado - 1)
+plot_cumulative_chart(df_equip_atual, df_equip_anterior, "Total de Equipamentos Ativos ao Final de Cada Mês", "Total de Equipamentos")
+
+st.subheader("Total de Contratos Ativos")
+df_contr_atual = carregar("contratos_ativos")
+df_contr_anterior = carregar("contratos_ativos", ano=ano_selecionado - 1)
+plot_cumulative_chart(df_contr_atual, df_contr_anterior, "Total de Contratos Ativos ao Final de Cada Mês", "Total de Contratos")
+
+# --- Botão de Exportação ---
+st.header("Exportar Dados")
+
+@st.fragment
+def secao_exportacao():
+    """Exportação em fragmento: clicar no botão não reexecuta os gráficos da página."""
+    if st.button("Gerar Relatório em Excel"):
+        with st.spinner("Preparando arquivo..."):
+            # Loaders em cache: reaproveita os resultados já exibidos nos gráficos de pizza
+            mes_pizza = st.session_state.get("mes_pizza", 0)
+            df_setor = carregar("faturamento_por_setor", mes=mes_pizza)
+            df_equip = carregar("faturamento_por_equipamento", mes=mes_pizza)
+            df_cli_merged = pd.merge(df_cli_atual.rename(columns={'TOTAL': f'CLIENTES_{ano_selecionado}'}), df_cli_anterior.rename(columns={'TOTAL': f'CLIENTES_{ano_selecionado-1}'}), on='MES')
+            df_equip_merged = pd.merge(df_equip_atual.rename(columns={'TOTAL': f'EQUIP_{ano_selecionado}'}), df_equip_anterior.rename(columns={'TOTAL': f'EQUIP_{ano_selecionado-1}'}), on='MES')
+            dataframes_to_export = {
+                "Faturamento_Mensal": df_fat_mensal,
+                "Faturamento_por_Setor": df_setor,
+                "Faturamento_por_Equipamento": df_equip,
+                "Clientes_Ativos_Mensal": df_cli_merged,
+                "Equipamentos_Ativos_Mensal": df_equip_merged,
+            }
+            excel_data = to_excel(dataframes_to_export)
+            st.download_button(
+                label="Clique aqui para baixar o Excel",
+                data=excel_data,
+                file_name=f"relatorio_geral_{ano_selecionado}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+secao_exportacao()
@@ -0,0 +1,179 @@
+"""
+Aquecimento do cache de resultados para as combinações de filtros mais usadas.
+
+Cada chamada de uma função em cache (query_cache.em_cache) é uma combinação de filtros de uma
+página: empresa, situação, ano/mês, período, status jurídico... O query_cache conta o uso de cada
+combinação; este módulo recalcula as TOP_K mais usadas que não estão no cache, periodicamente e
+logo depois de cada invalidação por evento do banco, respeitando um limite de concorrência, um
+orçamento de tempo de banco por ciclo e cedendo a vez quando os usuários já ocupam o banco.
+
+Períodos relativos a hoje (ex.: "últimos 30 dias") são deslocados para a data atual ao reaquecer.
+O uso das funções importáveis (ex.: db_utils._consultar) é gravado em disco para sobreviver a deploys.
+"""
+import importlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import instrumentacao
+import query_cache
+from constantes import DIRETORIO_CACHE
+
+CONFIG_PADRAO = {
+    "top_k": 50,                   # combinações mantidas quentes
+    "intervalo": 900,              # segundos entre ciclos agendados
+    "espera_apos_evento": 5,       # agrupa rajadas de eventos do banco em um único ciclo
+    "concorrencia": 2,             # recálculos simultâneos
+    "orcamento_segundos": 60,      # tempo máximo de recálculo por ciclo
+    "limite_queries_usuarios": 4,  # não aquece enquanto houver tantas queries em execução
+    "arquivo_usos": os.path.join(DIRETORIO_CACHE, "cache_warmer_usos.pkl"),
+}
+
+# Argumentos "_" não entram na chave nem no arquivo de usos: são obtidos de novo ao reaquecer
+RESOLVEDORES = {"_conn": lambda: importlib.import_module("db_utils").get_connection()}
+
+_lock = threading.Lock()
+_estado = {"thread": None, "config": dict(CONFIG_PADRAO), "ultimo_ciclo": None}
+_acordar = threading.Event()
+
+# --- Seleção das combinações ---
+def _datas(valor):
+    if isinstance(valor, (date, datetime)):
+        yield valor
+    elif isinstance(valor, (list, tuple)):
+        for v in valor:
+            yield from _datas(v)
+    elif isinstance(valor, dict):
+        for v in valor.values():
+            yield from _datas(v)
+
+def _deslocar(valor, dias):
+    if isinstance(valor, (date, datetime)):
+        return valor + timedelta(days=dias)
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(_deslocar(v, dias) for v in valor)
+    if isinstance(valor, dict):
+        return {k: _deslocar(v, dias) for k, v in valor.items()}
+    return valor
+
+def atualizar_periodo(argumentos, ultimo_uso, hoje=None):
+    """Janelas que terminavam no dia do uso (relativas a hoje) são trazidas para hoje."""
+    hoje = hoje or date.today()
+    dia_uso = datetime.fromtimestamp(ultimo_uso).date()
+    datas = [d.date() if isinstance(d, datetime) else d for d in _datas(argumentos)]
+    if not datas or max(datas) != dia_uso or dia_uso == hoje:
+        return argumentos
+    return _deslocar(argumentos, (hoje - dia_uso).days)
+
+def selecionar(top_k, agora=None):
+    """As top_k combinações por uso (com decaimento), já com o período atualizado."""
+    agora = agora or time.time()
+    ranking = sorted(query_cache.usos().values(), key=lambda u: -query_cache.pontuacao_uso(u, agora))
+    return [(u["func"], atualizar_periodo(u["argumentos"], u["ultimo"])) for u in ranking[:top_k]]
+
+# --- Execução ---
+def _banco_ocupado(limite):
+    return instrumentacao.snapshot()["em_uso"].get("db.queries_em_execucao", 0) >= limite
+
+def _aquecer(func, argumentos, config, prazo):
+    while _banco_ocupado(config["limite_queries_usuarios"]):
+        if time.monotonic() > prazo:
+            return False
+        time.sleep(1)
+    if time.monotonic() > prazo:
+        return False
+    argumentos = {k: (RESOLVEDORES[k]() if k in RESOLVEDORES else v) for k, v in argumentos.items()}
+    query_cache.aquecendo(True)
+    try:
+        with instrumentacao.medir("cache.aquecimento"):
+            func(**argumentos)
+        instrumentacao.incrementar("cache.aquecidas")
+        return True
+    except Exception:
+        instrumentacao.incrementar("cache.falhas_aquecimento")
+        return False
+    finally:
+        query_cache.aquecendo(False)
+
+def ciclo(config=None):
+    """Recalcula as combinações populares fora do cache; retorna quantas foram aquecidas."""
+    config = {**_estado["config"], **(config or {})}
+    prazo = time.monotonic() + config["orcamento_segundos"]
+    pendentes = [(func, argumentos) for func, argumentos in selecionar(config["top_k"]) if not _em_cache(func, argumentos)]
+    with ThreadPoolExecutor(max_workers=config["concorrencia"]) as pool:
+        aquecidas = sum(pool.map(lambda p: _aquecer(p[0], p[1], config, prazo), pendentes))
+    _estado["ultimo_ciclo"] = {"quando": time.time(), "pendentes": len(pendentes), "aquecidas": aquecidas}
+    salvar_usos(config["arquivo_usos"])
+    return aquecidas
+
+def _em_cache(func, argumentos):
+    chave = getattr(func, "chave_cache", None)
+    return chave is not None and query_cache.contem(chave(argumentos))
+
+# --- Persistência dos usos ---
+def salvar_usos(caminho):
+    importaveis = []
+    for chave, uso in query_cache.usos().items():
+        func = uso["func"]
+        if func.__module__ == "__main__":
+            continue  # funções definidas nas páginas só existem depois que a página roda
+        argumentos = {k: v for k, v in uso["argumentos"].items() if not k.startswith("_")}
+        importaveis.append({"modulo": func.__module__, "nome": func.__qualname__, "argumentos": argumentos, "contagem": uso["contagem"], "ultimo": uso["ultimo"]})
+    try:
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        with open(caminho + ".tmp", "wb") as f:
+            pickle.dump(importaveis, f)
+        os.replace(caminho + ".tmp", caminho)
+    except OSError:
+        pass
+
+def carregar_usos(caminho):
+    """Restaura os usos gravados por salvar_usos (ex.: após um deploy)."""
+    try:
+        with open(caminho, "rb") as f:
+            importaveis = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return 0
+    for uso in importaveis:
+        try:
+            func = importlib.import_module(uso["modulo"])
+            for parte in uso["nome"].split("."):
+                func = getattr(func, parte)
+        except (ImportError, AttributeError):
+            continue
+        if not hasattr(func, "chave_cache"):
+            continue  # função que deixou de usar o query_cache
+        argumentos = dict(uso["argumentos"])
+        for nome in inspect.signature(func).parameters:
+            if nome.startswith("_"):
+                argumentos[nome] = None  # preenchido por RESOLVEDORES ao reaquecer
+        query_cache.restaurar_uso(func, argumentos, uso["contagem"], uso["ultimo"])
+    return len(importaveis)
+
+# --- Agendamento ---
+def _agendador():
+    config = _estado["config"]
+    carregar_usos(config["arquivo_usos"])
+    while True:
+        if _acordar.wait(config["intervalo"]):
+            # Dados mudaram: espera a rajada de eventos terminar antes de recalcular
+            time.sleep(config["espera_apos_evento"])
+            _acordar.clear()
+        try:
+            ciclo()
+        except Exception:
+            instrumentacao.incrementar("cache.falhas_aquecimento")
+
+def iniciar(config=None):
+    """Inicia (uma vez por processo) o aquecimento agendado e após cada atualização de dados."""
+    with _lock:
+        if _estado["thread"] is not None:
+            return
+        _estado["config"].update(config or {})
+        query_cache.ao_invalidar(lambda tabelas: _acordar.set())
+        _estado["thread"] = threading.Thread(target=_agendador, name="cache_warmer", daemon=True)
+    _estado["thread"].start()
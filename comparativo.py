@@ -0,0 +1,132 @@
+"""
+Modo de comparação entre empresas: KPIs e séries das páginas para todas as empresas de
+constantes.EMPRESAS em uma única passada agrupada por empresa.
+
+Comparar Plugtech Brasil, Gestão e Serviços exigia três reruns, cada um com as suas queries
+filtradas pela lista de contas da empresa. Aqui a empresa é uma dimensão de agrupamento:
+
+- bases de metricas.py: `por=["EMPRESA", ...]` (loja -> empresa por dimensoes.empresas_por_loja);
+- clientes distintos: indice_clientes.contar_por_empresa (os bitmaps já são por empresa);
+- contas correntes: uma query com a empresa de cada conta (constantes.CASE_EMPRESA_CONTA).
+
+Cada função devolve (kpis, serie): kpis indexado por EMPRESA, uma coluna por KPI, e a série em
+formato longo (EMPRESA, eixo, valor) para os gráficos agrupados.
+"""
+from datetime import date, timedelta
+
+import pandas as pd
+
+import indice_clientes
+import metricas
+import query_cache
+import saldo_diario
+from constantes import CASE_EMPRESA_CONTA, EMPRESAS
+from db_utils import run_query
+
+QUERY_SALDOS_CONTAS = f"""
+SELECT cc.IDCONTA_CORRENTE, {CASE_EMPRESA_CONTA} AS EMPRESA,
+       COALESCE(cc.SALDO_FECHAMENTO, 0) + COALESCE(cc.SALDO_DINHEIRO, 0) + COALESCE(cc.SALDO_CHEQUE, 0) AS SALDO
+FROM CONTAS_CORRENTE cc
+WHERE cc.IDCONTA_CORRENTE <> 32 AND cc.IDCONTA_CORRENTE <> 33
+"""
+
+def _por_empresa(serie, nome):
+    """Série indexada por empresa (todas as de EMPRESAS, 0 para as ausentes) como coluna `nome`."""
+    return serie.reindex(list(EMPRESAS), fill_value=0).astype("float64").rename(nome).rename_axis("EMPRESA")
+
+def _soma(df, coluna, nome):
+    return _por_empresa(df.groupby("EMPRESA")[coluna].sum(), nome)
+
+def _percentual(valor, total):
+    return (valor / total.where(total != 0) * 100).fillna(0.0)
+
+def _meses_fechados(hoje):
+    """Mesma regra da Visão Geral: o mês corrente só conta fechado no seu último dia."""
+    return hoje.month if (hoje + timedelta(days=1)).month != hoje.month else hoje.month - 1
+
+# --- Visão Geral ---
+@query_cache.em_cache(ttl=3600)
+def visao_geral(_conn, ano, situacoes, ids_produto, hoje):
+    meses_fechados = _meses_fechados(hoje)
+    faturamento = metricas.fatiar(
+        _conn, "faturamento", filtros={"COM_CONTRATO": 1, "SITUACAO": situacoes or None, "ANO": [ano - 1, ano]},
+        por=["EMPRESA", "ANO", "MES"],
+    )
+    do_ano = faturamento[faturamento["ANO"] == ano]
+    fechados = do_ano[do_ano["MES"] <= meses_fechados]
+    acumulado = _soma(do_ano, "VALOR", "FATURAMENTO")
+    anterior = _soma(faturamento[(faturamento["ANO"] == ano - 1) & (faturamento["MES"] <= meses_fechados)], "VALOR", "FATURAMENTO_ANTERIOR")
+    tendencia = acumulado.rename("TENDENCIA")
+    if ano == hoje.year and meses_fechados > 0:
+        realizado = _soma(fechados, "VALOR", "TENDENCIA")
+        tendencia = realizado + realizado / meses_fechados * (12 - meses_fechados)
+
+    # Ativos na data de referência: hoje no ano corrente, fim do ano nos demais
+    referencia = hoje if ano == hoje.year else date(ano, 12, 31)
+    filtro_contratos, filtro_equipamentos = metricas.filtros_ativos(_conn, situacoes, ids_produto)
+    filtro_equipamentos["DATA_RETIRADA"] = lambda retirada: retirada.isna() | (retirada > pd.Timestamp(referencia))
+    iniciados = {"DATA_INICIO": (None, referencia)}
+    contratos = metricas.fatiar(_conn, "contratos", filtros=filtro_contratos, intervalos=iniciados, por=["EMPRESA", "IDPESSOA"])
+    equipamentos = metricas.fatiar(_conn, "equipamentos", filtros=filtro_equipamentos, intervalos=iniciados, por=["EMPRESA"])
+
+    kpis = pd.concat([
+        acumulado, anterior, _percentual(acumulado - anterior, anterior).rename("VARIACAO"), tendencia.rename("TENDENCIA"),
+        _por_empresa(contratos.groupby("EMPRESA")["IDPESSOA"].nunique(), "CLIENTES_ATIVOS"),
+        _soma(contratos, "QUANTIDADE", "CONTRATOS_ATIVOS"),
+        _soma(equipamentos, "QUANTIDADE", "EQUIPAMENTOS_ATIVOS"),
+    ], axis=1)
+    serie = do_ano[["EMPRESA", "MES", "VALOR"]].sort_values(["EMPRESA", "MES"], ignore_index=True)
+    return kpis, serie
+
+# --- Fluxo de Caixa ---
+@query_cache.em_cache(ttl=3600)
+def saldos_contas(_conn):
+    """Saldo atual de cada conta corrente com a empresa da conta (uma query para todas)."""
+    df = run_query(_conn, QUERY_SALDOS_CONTAS)
+    return df.assign(SALDO=pd.to_numeric(df["SALDO"]).astype("float64"))
+
+@query_cache.em_cache(ttl=3600)
+def fluxo_caixa(_conn, data_inicio, data_fim, status_juridico, hoje):
+    contas = saldos_contas(_conn).dropna(subset=["EMPRESA"])
+    titulos = metricas.fatiar(
+        _conn, "titulos_abertos",
+        filtros={"TIPO_CONTA": ["RE", "RP", "PA"], "JURIDICO": metricas.JURIDICO_POR_STATUS[status_juridico], "VALOR_PENDENTE": lambda valor: valor > 0},
+        intervalos={"DATA_VENCIMENTO": (data_inicio, data_fim)},
+        por=["EMPRESA", "TIPO_CONTA"],
+    )
+    saldo = _soma(contas, "SALDO", "SALDO")
+    receber = _soma(titulos[titulos["TIPO_CONTA"].isin(["RE", "RP"])], "VALOR_PENDENTE", "RECEBER")
+    pagar = _soma(titulos[titulos["TIPO_CONTA"] == "PA"], "VALOR_PENDENTE", "PAGAR")
+    kpis = pd.concat([saldo, receber, pagar, (saldo + receber - pagar).rename("SALDO_OPERACIONAL")], axis=1)
+
+    # Saldo diário: a série de movimentos por conta já está em memória (saldo_diario), só muda o conjunto de contas
+    series = []
+    for empresa, contas_empresa in contas.groupby("EMPRESA"):
+        serie = saldo_diario.serie_saldo(_conn, dict(zip(contas_empresa["IDCONTA_CORRENTE"], contas_empresa["SALDO"])), data_inicio, min(data_fim, hoje))
+        series.append(serie.assign(EMPRESA=empresa))
+    serie = pd.concat(series, ignore_index=True) if series else pd.DataFrame(columns=["DATA", "SALDO", "EMPRESA"])
+    return kpis, serie[["EMPRESA", "DATA", "SALDO"]]
+
+# --- Inadimplência ---
+@query_cache.em_cache(ttl=3600)
+def inadimplencia(_conn, ano, mes, status_juridico, limite_atraso):
+    faturado = _soma(metricas.fatiar(_conn, "faturamento", filtros={"ANO": ano, "MES": mes}, por=["EMPRESA"]), "VALOR", "FATURADO")
+    vencidos = metricas.fatiar(
+        _conn, "titulos_abertos",
+        filtros={"TIPO_CONTA": ["RE", "RP"], "JURIDICO": metricas.JURIDICO_POR_STATUS[status_juridico], "IDPESSOA": lambda pessoa: pessoa.notna()},
+        intervalos={"DATA_VENCIMENTO": (None, limite_atraso - timedelta(days=1))},
+        por=["EMPRESA", "DATA_VENCIMENTO"],
+    )
+    vencimento = pd.to_datetime(vencidos["DATA_VENCIMENTO"])
+    no_mes = _soma(vencidos[(vencimento.dt.year == ano) & (vencimento.dt.month == mes)], "VALOR_PENDENTE", "INADIMPLENCIA_MES")
+    metricas_inadimplencia = indice_clientes.METRICAS_INADIMPLENCIA[status_juridico]
+    kpis = pd.concat([
+        faturado, no_mes, _percentual(no_mes, faturado).rename("PERCENTUAL_FATURADO"),
+        _soma(vencidos, "VALOR_PENDENTE", "INADIMPLENCIA_ACUMULADA"),
+        _por_empresa(pd.Series(indice_clientes.contar_por_empresa(_conn, "vendas", [(ano, mes)])), "CLIENTES_MES"),
+        _por_empresa(pd.Series(indice_clientes.contar_por_empresa(_conn, metricas_inadimplencia, [(ano, mes)])), "INADIMPLENTES_MES"),
+        _por_empresa(pd.Series(indice_clientes.contar_por_empresa(_conn, metricas_inadimplencia)), "INADIMPLENTES_ACUMULADO"),
+    ], axis=1)
+    do_ano = vencidos[vencimento.dt.year == ano].assign(MES=vencimento.dt.month)
+    serie = do_ano.groupby(["EMPRESA", "MES"], as_index=False)["VALOR_PENDENTE"].sum()
+    return kpis, serie
@@ -0,0 +1,58 @@
+"""Constantes compartilhadas pelas páginas e módulos de dados."""
+import os
+
+# --- Arquivos de cache em disco (séries incrementais e usos do aquecimento) ---
+# Ao lado do app, e não no diretório de trabalho do processo; PLUGTECH_CACHE_DIR muda o local
+DIRETORIO_CACHE = os.environ.get("PLUGTECH_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+# --- Mapeamento de Empresas e suas contas correntes (CONTAS_CORRENTE.NOME_CONTA) ---
+EMPRESAS = {
+    "Plugtech Brasil": [
+        'BB PLUG BRASIL RF', 'BNB PLUG BRASIL 8299', 'BNB ES FI PLUG BRASI',
+        'BB PLUG BRASIL', 'BNB RS FI PLUG BRASI', 'BNB PLUG BRASIL13815',
+        'BNB PLUG BRASIL13910', 'CEF PLUG BRASIL', 'CEF AP PLUG BRASIL',
+        'ADM PLUG BRASIL', 'PERDA CONT PLUG BRAS', 'PJBANK PLUGTECH BRAS',
+        'CARTAO 9412 PLUG BRA', 'F RESERVA P BRASIL'
+    ],
+    "Plugtech Gestão": [
+        'BB PLUG GESTAO RF', 'BB PLUG GESTAO', 'SICRED CAPITAL GESTA',
+        'ADM PLUG GESTAO', 'BNB PLUG GESTAO32495', 'PJBANK PLUGTECH GEST',
+        'SICRED PLUG GESTAO'
+    ],
+    "Plugtech Serviços": [
+        'BB PLUG SERVICOS RF', 'BB PLUG SERVICOS', 'BNB PLUG SERV 26551',
+        'BNB PLUG SERVIC28454', 'BNB FI AT PLUG SERVI', 'CEF PLUG SERVICOS',
+        'CEF AP PLUG SERVICOS', 'TESOURARIA PLUG SERV', 'ADM PLUG SERVICOS',
+        'PERDA CONT PLUG SERV', 'CARTAO 3948 PLUG SER', 'PJBANK PLUGTECG SERV',
+        'F RESERVA P SERVICOS'
+    ]
+}
+
+
+# Conta corrente -> empresa (inverso de EMPRESAS), para agrupar por empresa em uma única passada
+EMPRESA_POR_CONTA = {conta: empresa for empresa, contas in EMPRESAS.items() for conta in contas}
+
+# --- Mapeamentos das páginas (montados uma vez por processo, não a cada execução da página) ---
+# Categoria do equipamento pela descrição do produto; {col} é a coluna DESCRICAO_PRODUTO da query
+EQUIPMENT_CATEGORIES_MAP = {
+    "Impressoras Coloridas": "{col} LIKE '%COLOR%'",
+    "Impressoras Monocromáticas": "({col} LIKE '%MONO%' AND {col} NOT LIKE '%COLOR%')",
+    "Desktop": "({col} LIKE '%DESKTOP%' OR {col} LIKE '%CPU%')",
+    "Monitor": "{col} LIKE '%MONITOR%'",
+    "Notebook": "{col} LIKE '%NOTEBOOK%'",
+    "Outros": "({col} NOT LIKE '%COLOR%' AND {col} NOT LIKE '%MONO%' AND {col} NOT LIKE '%DESKTOP%' AND {col} NOT LIKE '%CPU%' AND {col} NOT LIKE '%MONITOR%' AND {col} NOT LIKE '%NOTEBOOK%')"
+}
+SITUACAO_MAP = { 'AB': 'Aberto', 'BL': 'Bloqueado', 'CA': 'Cancelado' }
+MESES_ABREV = { 1: 'JAN', 2: 'FEV', 3: 'MAR', 4: 'ABR', 5: 'MAI', 6: 'JUN', 7: 'JUL', 8: 'AGO', 9: 'SET', 10: 'OUT', 11: 'NOV', 12: 'DEZ' }
+
+# --- Expressões SQL (CASE) ---
+# Categoria do equipamento para PRODUTOS p
+CASE_CATEGORIA_EQUIPAMENTO = "CASE " + " ".join(
+    f"WHEN {cond.format(col='p.DESCRICAO_PRODUTO')} THEN '{cat}'" for cat, cond in EQUIPMENT_CATEGORIES_MAP.items()
+) + " END"
+# Empresa da conta corrente (CONTAS_CORRENTE cc); NULL para contas fora de EMPRESAS
+CASE_EMPRESA_CONTA = "CASE " + " ".join(
+    "WHEN cc.NOME_CONTA IN (" + ", ".join(f"'{conta}'" for conta in contas) + f") THEN '{empresa}'" for empresa, contas in EMPRESAS.items()
+) + " END"
+# Setor do cliente pelo grupo de PESSOAS p
+CASE_SETOR = "CASE p.IDGRUPO_PESSOA WHEN 8 THEN 'Público' WHEN 9 THEN 'Privado' ELSE 'Outros' END"
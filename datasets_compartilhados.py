@@ -0,0 +1,177 @@
+"""
+Datasets compartilhados entre os processos do Streamlit no mesmo host.
+
+Cada processo guardava a sua cópia das mesmas bases (títulos em aberto, faturamento...). Aqui cada
+dataset é materializado uma vez por host como arquivo Arrow IPC em memória compartilhada
+(/dev/shm) e os processos o abrem com mmap: o DataFrame de cada processo aponta para as mesmas
+páginas de memória (colunas numéricas, datas e textos sem cópia).
+
+- Atualização uma vez por host: quem encontra a versão vencida pega a trava do dataset (flock) e
+  recarrega; os demais esperam a trava e anexam a versão nova em vez de repetir a query.
+- Versões: cada carga grava um arquivo novo e troca o ponteiro `<nome>.atual` atomicamente. As
+  versões antigas são apagadas na hora; quem ainda as tem mapeadas continua lendo (o kernel mantém
+  a memória até o último mmap ser fechado), e o processo troca de versão no próximo acesso.
+- Invalidação: um evento do banco (query_cache) em uma tabela lida pelo dataset grava a marca
+  `<nome>.invalidado`, e a próxima leitura em qualquer processo recarrega.
+
+Sem `configurar` (ex.: testes sem banco) ou sem suporte a flock, os datasets ficam só no processo.
+Com PLUGTECH_SEM_ARMAZENAMENTO=1 (ferramentas como query_plans.py) os armazenamentos entre processos
+(este e os pickles de saldo_diario/perfil_clientes) são ignorados e toda carga executa as queries.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+import instrumentacao
+import query_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+RAIZ = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+INTERVALO_VERIFICACAO = 2  # segundos entre consultas ao ponteiro da versão atual
+VARIAVEL_SEM_ARMAZENAMENTO = "PLUGTECH_SEM_ARMAZENAMENTO"
+
+_estado = {"diretorio": None}
+_lock = threading.Lock()
+_locks_dataset = {}
+_anexados = {}   # nome -> {"versao", "df", "criado", "verificado", "sujo"}
+_tabelas = {}    # nome -> tabelas lidas pelo carregamento
+
+def configurar(banco):
+    """Ativa o compartilhamento, com um diretório por banco (ex.: produção e banco sintético)."""
+    diretorio = os.path.join(RAIZ, "plugtech_" + hashlib.sha1(banco.encode()).hexdigest()[:12])
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+    except OSError:
+        return  # sem diretório compartilhado: continua por processo
+    if fcntl is not None:
+        _estado["diretorio"] = diretorio
+
+def _invalidar(tabelas):
+    agora = time.time()
+    for nome, lidas in list(_tabelas.items()):
+        if lidas & set(tabelas):
+            if nome in _anexados:
+                _anexados[nome]["sujo"] = True
+            if _estado["diretorio"] is not None:
+                _gravar_json(_caminho(nome, "invalidado"), {"quando": agora})
+
+query_cache.ao_invalidar(_invalidar)
+
+def armazenamento_ignorado():
+    """Verdadeiro quando os dados guardados por outros processos (ou execuções) não devem ser usados."""
+    return os.environ.get(VARIAVEL_SEM_ARMAZENAMENTO) == "1"
+
+# --- Arquivos ---
+def _caminho(nome, sufixo):
+    return os.path.join(_estado["diretorio"], f"{nome}.{sufixo}")
+
+def _gravar_json(caminho, dados):
+    with open(caminho + f".{os.getpid()}.tmp", "w") as f:
+        json.dump(dados, f)
+    os.replace(caminho + f".{os.getpid()}.tmp", caminho)
+
+def _ler_json(caminho):
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def _trava(nome):
+    with open(_caminho(nome, "trava"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _valida(nome, atual, ttl):
+    if atual is None or time.time() - atual["criado"] > ttl:
+        return False
+    invalidado = _ler_json(_caminho(nome, "invalidado"))
+    return invalidado is None or atual["criado"] >= invalidado["quando"]
+
+def _publicar(nome, carregar):
+    """Carrega o dataset, grava uma versão nova e aponta o ponteiro para ela."""
+    criado = time.time()  # antes da query: alteração durante a carga invalida esta versão
+    tabela = pa.Table.from_pandas(carregar(), preserve_index=False)
+    versao = f"{int(criado * 1000)}-{os.getpid()}"
+    arquivo = _caminho(nome, f"{versao}.arrow")
+    with pa.OSFile(arquivo + ".tmp", "wb") as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+        escritor.write_table(tabela)  # sem compressão: o mmap lê os buffers direto do arquivo
+    os.replace(arquivo + ".tmp", arquivo)
+    atual = {"versao": versao, "criado": criado}
+    _gravar_json(_caminho(nome, "atual"), atual)
+    for antigo in os.listdir(_estado["diretorio"]):
+        if antigo.startswith(f"{nome}.") and antigo.endswith(".arrow") and antigo != os.path.basename(arquivo):
+            try:
+                os.remove(os.path.join(_estado["diretorio"], antigo))
+            except OSError:
+                pass
+    instrumentacao.incrementar("datasets.cargas")
+    return atual
+
+def _anexar(nome, atual):
+    anexado = _anexados.get(nome)
+    if anexado is None or anexado["versao"] != atual["versao"]:
+        mapa = pa.memory_map(_caminho(nome, f"{atual['versao']}.arrow"))
+        df = pa.ipc.open_file(mapa).read_all().to_pandas(split_blocks=True)
+        anexado = _anexados[nome] = {"versao": atual["versao"], "df": df, "criado": atual["criado"], "sujo": False}
+        instrumentacao.incrementar("datasets.anexados")
+    anexado.update(verificado=time.monotonic(), sujo=False)
+    return anexado["df"]
+
+# --- Consulta ---
+def obter(nome, carregar, tabelas, ttl=3600):
+    """
+    DataFrame do dataset `nome` (somente leitura: não altere in place), recarregado com
+    `carregar()` quando vence o `ttl` ou quando alguma das `tabelas` muda no banco.
+    """
+    _tabelas[nome] = frozenset(tabelas)
+    query_cache.registrar_leitura(tabelas)  # funções em cache que usam o dataset dependem das tabelas
+    anexado = _anexados.get(nome)
+    if (anexado is not None and not anexado["sujo"] and time.time() - anexado["criado"] <= ttl
+            and time.monotonic() - anexado["verificado"] < INTERVALO_VERIFICACAO):
+        return anexado["df"]
+    with _lock:
+        lock_dataset = _locks_dataset.setdefault(nome, threading.Lock())
+    with lock_dataset:
+        if _estado["diretorio"] is None or armazenamento_ignorado():
+            return _local(nome, carregar, ttl)
+        for _ in range(3):
+            atual = _ler_json(_caminho(nome, "atual"))
+            if not _valida(nome, atual, ttl):
+                with _trava(nome):
+                    atual = _ler_json(_caminho(nome, "atual"))
+                    if not _valida(nome, atual, ttl):
+                        atual = _publicar(nome, carregar)
+            try:
+                return _anexar(nome, atual)
+            except FileNotFoundError:
+                continue  # outro processo publicou uma versão mais nova entre a leitura e o mmap
+        return _local(nome, carregar, ttl, forcar=True)
+
+def _local(nome, carregar, ttl, forcar=False):
+    anexado = _anexados.get(nome)
+    if forcar or anexado is None or anexado["sujo"] or time.time() - anexado["criado"] > ttl:
+        criado = time.time()
+        anexado = _anexados[nome] = {"versao": None, "df": carregar(), "criado": criado, "sujo": False}
+    anexado["verificado"] = time.monotonic()
+    return anexado["df"]
+
+def descartar(nome=None):
+    """Solta a versão anexada neste processo (ou todas); o próximo acesso anexa de novo."""
+    with _lock:
+        for chave in ([nome] if nome else list(_anexados)):
+            _anexados.pop(chave, None)
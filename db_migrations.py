@@ -0,0 +1,202 @@
+"""
+Migrações versionadas do banco para os dashboards: índices dos caminhos de acesso e triggers
+que avisam o app (POST_EVENT) quando tabelas transacionais mudam (ver query_cache.py), além da
+tabela de batimento usada para medir o atraso da réplica de leitura (ver db_utils.py).
+
+Cada migração cria (ou remove) um objeto; a existência é conferida em RDB$INDICES/RDB$TRIGGERS/RDB$RELATIONS,
+então `up` e `down` são idempotentes e podem ser reexecutados. Com `--dry-run` apenas o DDL é impresso.
+Com `--medir`, todas as formas de query das quatro páginas (ver query_plans.py) são medidas
+no banco de benchmark antes e depois da migração, gerando o relatório para aprovação do DBA.
+
+Uso:
+    python db_migrations.py status --secrets .streamlit/secrets_benchmark.toml
+    python db_migrations.py up --secrets ... --dry-run
+    python db_migrations.py up --secrets ... --medir --relatorio relatorio_indices.md
+    python db_migrations.py down --secrets ... --ate 3
+"""
+import argparse
+
+import headless
+import query_plans
+
+# --- Migrações (versão, objeto e DDL). Nunca altere uma versão já aplicada: crie outra. ---
+MIGRACOES = [
+    {
+        "versao": 1, "objeto": "IDX_PLUG_CF_TIPO_SIT_VENC",
+        "motivo": "Contas a receber/pagar em aberto por vencimento (Fluxo de Caixa, Inadimplência, Automações)",
+        "criar": "CREATE INDEX IDX_PLUG_CF_TIPO_SIT_VENC ON CONTAS_FINANCEIRA (TIPO_CONTA, SITUACAO_CONTA, DATA_VENCIMENTO)",
+    },
+    {
+        "versao": 2, "objeto": "IDX_PLUG_CF_TIPO_VENC",
+        "motivo": "Tabelas detalhadas do Fluxo de Caixa (filtram tipo e vencimento, sem situação)",
+        "criar": "CREATE INDEX IDX_PLUG_CF_TIPO_VENC ON CONTAS_FINANCEIRA (TIPO_CONTA, DATA_VENCIMENTO)",
+    },
+    {
+        "versao": 3, "objeto": "IDX_PLUG_CF_CENTRO_CUSTO",
+        "motivo": "Filtro 'Apenas Negativados' (COD_CENTRO_CUSTO = 4240340)",
+        "criar": "CREATE INDEX IDX_PLUG_CF_CENTRO_CUSTO ON CONTAS_FINANCEIRA (COD_CENTRO_CUSTO)",
+    },
+    {
+        "versao": 4, "objeto": "IDX_PLUG_CF_LOJA_VENC",
+        "motivo": "Join por IDLOJA a partir das contas da empresa, já restrito pelo vencimento",
+        "criar": "CREATE INDEX IDX_PLUG_CF_LOJA_VENC ON CONTAS_FINANCEIRA (IDLOJA, DATA_VENCIMENTO)",
+    },
+    {
+        "versao": 5, "objeto": "IDX_PLUG_VENDAS_CANC_DATA",
+        "motivo": "Vendas não canceladas por período (IS NULL casa com o primeiro segmento)",
+        "criar": "CREATE INDEX IDX_PLUG_VENDAS_CANC_DATA ON VENDAS (DATA_CANCELAMENTO, DATA_VENDA)",
+    },
+    {
+        "versao": 6, "objeto": "IDX_PLUG_VENDAS_ANO",
+        "motivo": "Visão Geral filtra EXTRACT(YEAR FROM DATA_VENDA) = ?; só um índice de expressão evita o NATURAL",
+        "criar": "CREATE INDEX IDX_PLUG_VENDAS_ANO ON VENDAS COMPUTED BY (EXTRACT(YEAR FROM DATA_VENDA))",
+    },
+    {
+        "versao": 7, "objeto": "IDX_PLUG_VENDAS_LOJA_DATA",
+        "motivo": "Join por IDLOJA (empresa) já restrito pelo período da venda",
+        "criar": "CREATE INDEX IDX_PLUG_VENDAS_LOJA_DATA ON VENDAS (IDLOJA, DATA_VENDA)",
+    },
+    {
+        "versao": 8, "objeto": "IDX_PLUG_LB_DATA",
+        "motivo": "Balanço de entradas e saídas por período (Fluxo de Caixa)",
+        "criar": "CREATE INDEX IDX_PLUG_LB_DATA ON LANCAMENTOS_BANCARIO (DATA_OPERACAO)",
+    },
+    {
+        "versao": 9, "objeto": "IDX_PLUG_LB_LOJA_DATA",
+        "motivo": "Balanço filtrado por empresa (join por IDLOJA + período)",
+        "criar": "CREATE INDEX IDX_PLUG_LB_LOJA_DATA ON LANCAMENTOS_BANCARIO (IDLOJA, DATA_OPERACAO)",
+    },
+    {
+        "versao": 10, "objeto": "IDX_PLUG_CC_NOME_CONTA",
+        "motivo": "Filtro de empresa (NOME_CONTA IN (...)) em todas as páginas",
+        "criar": "CREATE INDEX IDX_PLUG_CC_NOME_CONTA ON CONTAS_CORRENTE (NOME_CONTA)",
+    },
+    {
+        "versao": 11, "objeto": "IDX_PLUG_CONTRATOS_LOJA_SIT",
+        "motivo": "Contratos por empresa e situação (clientes/contratos acumulados da Visão Geral)",
+        "criar": "CREATE INDEX IDX_PLUG_CONTRATOS_LOJA_SIT ON CONTRATOS (IDLOJA, SITUACAO)",
+    },
+    # Triggers de invalidação do cache: o evento só é entregue após o commit da transação
+    {
+        "versao": 12, "objeto": "TRG_PLUG_EVT_VENDAS",
+        "motivo": "Invalida no app o cache que leu VENDAS (Visão Geral (faturamento))",
+        "criar": "CREATE TRIGGER TRG_PLUG_EVT_VENDAS FOR VENDAS ACTIVE AFTER INSERT OR UPDATE OR DELETE POSITION 100 AS BEGIN POST_EVENT 'PLUG_ALTERACAO_VENDAS'; END",
+    },
+    {
+        "versao": 13, "objeto": "TRG_PLUG_EVT_CONTAS_FIN",
+        "motivo": "Invalida no app o cache que leu CONTAS_FINANCEIRA (Fluxo de Caixa, Inadimplência e Automações)",
+        "criar": "CREATE TRIGGER TRG_PLUG_EVT_CONTAS_FIN FOR CONTAS_FINANCEIRA ACTIVE AFTER INSERT OR UPDATE OR DELETE POSITION 100 AS BEGIN POST_EVENT 'PLUG_ALTERACAO_CONTAS_FINANCEIRA'; END",
+    },
+    {
+        "versao": 14, "objeto": "TRG_PLUG_EVT_LANC_BANC",
+        "motivo": "Invalida no app o cache que leu LANCAMENTOS_BANCARIO (balanço do Fluxo de Caixa)",
+        "criar": "CREATE TRIGGER TRG_PLUG_EVT_LANC_BANC FOR LANCAMENTOS_BANCARIO ACTIVE AFTER INSERT OR UPDATE OR DELETE POSITION 100 AS BEGIN POST_EVENT 'PLUG_ALTERACAO_LANCAMENTOS_BANCARIO'; END",
+    },
+    {
+        "versao": 15, "objeto": "TRG_PLUG_EVT_CONTRATOS",
+        "motivo": "Invalida no app o cache que leu CONTRATOS (Visão Geral (clientes e contratos ativos))",
+        "criar": "CREATE TRIGGER TRG_PLUG_EVT_CONTRATOS FOR CONTRATOS ACTIVE AFTER INSERT OR UPDATE OR DELETE POSITION 100 AS BEGIN POST_EVENT 'PLUG_ALTERACAO_CONTRATOS'; END",
+    },
+    # Batimento para medir o atraso da réplica de leitura (ver db_utils.medir_atraso); chega à réplica junto com os dados
+    {
+        "versao": 16, "objeto": "PLUG_REPLICACAO",
+        "motivo": "Atraso da réplica de leitura: um processo designado (gravar_batimento) grava a hora no principal, os demais leem na réplica",
+        "criar": "CREATE TABLE PLUG_REPLICACAO (ID INTEGER NOT NULL PRIMARY KEY, MOMENTO TIMESTAMP NOT NULL)",
+    },
+]
+
+def tipo_objeto(migracao):
+    """INDEX, TRIGGER ou TABLE, a partir do DDL de criação."""
+    return migracao["criar"].split()[1].upper()
+
+def objetos_existentes(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT TRIM(RDB$INDEX_NAME) FROM RDB$INDICES WHERE RDB$INDEX_NAME STARTING WITH 'IDX_PLUG_' "
+        "UNION SELECT TRIM(RDB$TRIGGER_NAME) FROM RDB$TRIGGERS WHERE RDB$TRIGGER_NAME STARTING WITH 'TRG_PLUG_' "
+        "UNION SELECT TRIM(RDB$RELATION_NAME) FROM RDB$RELATIONS WHERE RDB$RELATION_NAME STARTING WITH 'PLUG_'"
+    )
+    existentes = {linha[0] for linha in cur.fetchall()}
+    cur.close()
+    return existentes
+
+def selecionar(acao, ate=None):
+    """Migrações na ordem de aplicação: crescente no `up` e decrescente no `down`."""
+    if acao == "up":
+        return [m for m in MIGRACOES if ate is None or m["versao"] <= ate]
+    return [m for m in reversed(MIGRACOES) if ate is None or m["versao"] >= ate]
+
+def executar(conn, acao, migracoes, dry_run=False):
+    """Aplica (ou só imprime, em dry-run) o DDL pendente; retorna os comandos considerados."""
+    existentes = objetos_existentes(conn)
+    comandos = []
+    for m in migracoes:
+        if acao == "up" and m["objeto"] not in existentes:
+            ddl = m["criar"]
+        elif acao == "down" and m["objeto"] in existentes:
+            ddl = f"DROP {tipo_objeto(m)} {m['objeto']}"
+        else:
+            print(f"  v{m['versao']:>3} {m['objeto']}: nada a fazer")
+            continue
+        print(f"  v{m['versao']:>3} {'[dry-run] ' if dry_run else ''}{ddl}")
+        comandos.append(ddl)
+        if not dry_run:
+            conn.execute_immediate(ddl)
+            conn.commit()
+    return comandos
+
+def relatorio_comparativo(antes, depois, tabelas_grandes=query_plans.TABELAS_GRANDES):
+    """Tabela markdown com o custo de cada forma de query antes e depois da migração."""
+    linhas = [
+        "| forma | tempo antes (s) | tempo depois (s) | fetches antes | fetches depois | NATURAL antes | NATURAL depois |",
+        "|---|---:|---:|---:|---:|---|---|",
+    ]
+    for chave in sorted(antes, key=lambda c: -antes[c].get("custo", {}).get("tempo_s", 0)):
+        a, d = antes[chave], depois.get(chave, {})
+        ca, cd = a.get("custo", {}), d.get("custo", {})
+        nat_a = ", ".join(sorted(set(a.get("naturais", [])) & tabelas_grandes)) or "-"
+        nat_d = ", ".join(sorted(set(d.get("naturais", [])) & tabelas_grandes)) or "-"
+        linhas.append(f"| {chave} | {ca.get('tempo_s', 0):.3f} | {cd.get('tempo_s', 0):.3f} | {ca.get('fetches', 0)} | {cd.get('fetches', 0)} | {nat_a} | {nat_d} |")
+    linhas.append("")
+    linhas.append("## Queries")
+    for chave, entrada in sorted(antes.items()):
+        linhas.append(f"- `{chave}`: `{entrada['sql']}`")
+        linhas.append(f"  - plano antes: `{entrada.get('plano', entrada.get('erro'))}`")
+        linhas.append(f"  - plano depois: `{depois.get(chave, {}).get('plano', depois.get(chave, {}).get('erro'))}`")
+    return "\n".join(linhas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrações de índices e triggers dos dashboards.")
+    parser.add_argument("acao", choices=["status", "up", "down"])
+    parser.add_argument("--secrets", required=True, help="secrets.toml do banco alvo")
+    parser.add_argument("--ate", type=int, help="up: aplica até esta versão; down: remove até esta versão (inclusive)")
+    parser.add_argument("--dry-run", action="store_true", help="apenas imprime o DDL")
+    parser.add_argument("--medir", action="store_true", help="mede todas as queries das páginas antes e depois")
+    parser.add_argument("--relatorio", default="relatorio_indices.md", help="arquivo do relatório antes/depois")
+    args = parser.parse_args()
+
+    secrets = headless.carregar_secrets(args.secrets)
+    conn = query_plans.conectar(secrets)
+    try:
+        if args.acao == "status":
+            existentes = objetos_existentes(conn)
+            for m in MIGRACOES:
+                print(f"  v{m['versao']:>3} {'aplicada' if m['objeto'] in existentes else 'pendente':<9} {m['objeto']}: {m['motivo']}")
+            return
+
+        formas = antes = None
+        if args.medir and not args.dry_run:
+            formas = query_plans.coletar_formas(secrets)
+            antes = query_plans.capturar(secrets, formas)
+        comandos = executar(conn, args.acao, selecionar(args.acao, args.ate), args.dry_run)
+        if antes is not None and comandos:
+            depois = query_plans.capturar(secrets, formas)
+            with open(args.relatorio, "w", encoding="utf-8") as f:
+                f.write(f"# Migrações: {args.acao}\n\n" + "\n".join(f"- `{c}`" for c in comandos) + "\n\n")
+                f.write(relatorio_comparativo(antes, depois))
+            print(f"Relatório antes/depois gravado em {args.relatorio}.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,504 @@
-import streamlit as st
-import pandas as pd
-from firebird.driver import connect, driver_config
-
-@st.cache_resource(ttl=600)
-def get_connection():
-    """Estabelece e retorna uma conexão com o banco de dados Firebird."""
-    try:
-        conn = connect(
-            database=f"{st.secrets.database.host}:{st.secrets.database.path}",
-            user=st.secrets.database.user,
-            password=st.secrets.database.password,
-            charset=st.secrets.database.charset
-        )
-        return conn
-    except Exception as e:
-        st.error(f"Erro ao conectar ao banco de dados: {e}")
-        return None
-
-@st.cache_data(ttl=300)
-def fetch_data(_conn, query, params=None):
-    """
-    Executa uma query no banco de dados e retorna o resultado como um DataFrame do Pandas.
-    O _conn é um argumento "dummy" para garantir que o cache seja invalidado se a conexão mudar.
-    """
-    if _conn is None:
-        return pd.DataFrame()
-    try:
-        df = pd.read_sql(query, _conn, params=params)
-        return df
-    except Exception as e:
-        st.error(f"Erro ao executar a query: {e}")
-        st.code(query, language="sql")
-        return pd.DataFrame()
\ No newline at end of file
+import contextlib
+import datetime
+import decimal
+import re
+import threading
+import time
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+from firebird.driver import Connection, DatabaseError, connect, driver_config
+from firebird.driver.types import CancelType
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData, ScriptRequests, ScriptRequestType
+import cache_warmer
+import datasets_compartilhados
+import instrumentacao
+import query_cache
+
+# Formas de query (texto normalizado) já emitidas pelo app, com os últimos parâmetros vistos.
+# Usado pelas ferramentas de diagnóstico (ex.: captura de planos em query_plans.py).
+_formas_query = {}
+_formas_lock = threading.Lock()
+
+# Single-flight: sessões que pedem a mesma query (mesma forma e parâmetros) enquanto ela ainda
+# está em execução esperam essa execução e recebem o mesmo resultado, em vez de repetir a query.
+TIMEOUT_COALESCENCIA = 120  # segundos que uma chamada espera pela execução em andamento
+_em_voo = {}
+_em_voo_lock = threading.Lock()
+
+# Cancelamento: cada query roda em uma conexão própria do pool, porque o cancelamento do Firebird
+# (fb_cancel_operation) vale para a conexão inteira. Um vigia cancela no servidor as queries cuja
+# execução do script foi substituída por um rerun (filtro trocado no meio do carregamento) e as que
+# passam de TIMEOUT_QUERY; no Firebird 4+ o mesmo limite também vai como statement timeout.
+TAMANHO_POOL = 8        # conexões simultâneas no banco ([database] pool no secrets.toml)
+TIMEOUT_QUERY = 300     # segundos por query ([database] timeout_query no secrets.toml)
+INTERVALO_VIGIA = 0.25  # segundos entre verificações do vigia
+_pools = {}  # destino ("principal" ou "leitura") -> {"parametros", "livres", "criadas", "tamanho", "cond"}
+_pools_lock = threading.Lock()
+_vigia = {"thread": None, "timeout": TIMEOUT_QUERY}
+_em_execucao = {}
+_em_execucao_lock = threading.Lock()
+
+# Leitura em réplica ([database_leitura] no secrets.toml): cópia do banco (replicação, nbackup ou
+# arquivo atualizado periodicamente) que atende as queries analíticas sem disputar com o ERP.
+# O atraso é medido por batimento: a hora atual é gravada em PLUG_REPLICACAO no principal
+# (migração 16) e cada processo lê, só na réplica, o último valor que já chegou lá. A gravação é
+# opcional e deve ficar com um único processo designado ([database_leitura] gravar_batimento =
+# true) ou com um job externo: o dashboard não escreve no banco do ERP por padrão. Sem batimento
+# novo o atraso medido cresce e a réplica sai de uso (leitura segura no principal).
+# Cada classe de query tem um atraso máximo aceito; acima dele (ou sem medição recente) a classe
+# volta a ler do principal.
+ATRASO_MAXIMO = {        # segundos por classe ([database_leitura] atraso_<classe> ajusta)
+    "analitica": 3600,   # bases agregadas e varreduras históricas (faturamento, contratos, índices)
+    "relatorio": 300,    # títulos em aberto (exportações de Automações, KPIs do Fluxo de Caixa)
+}
+INTERVALO_ATRASO = 30    # segundos entre medições do atraso
+TABELA_REPLICA = "<REPLICA>"  # pseudo-tabela: resultado lido da réplica não fica coberto pelos eventos
+QUERY_BATIMENTO = "UPDATE OR INSERT INTO PLUG_REPLICACAO (ID, MOMENTO) VALUES (1, ?) MATCHING (ID)"
+_replica = {"atraso": None, "medido": 0.0, "erro": None, "limites": dict(ATRASO_MAXIMO), "gravar_batimento": False, "thread": None}
+
+# Leitura colunar (formato "arrow"/"tabela"): os lotes do cursor viram arrays Arrow com o tipo
+# declarado pela coluna no banco, sem a inferência de tipos do pandas sobre objetos linha a linha.
+# NUMERIC/DECIMAL chegam como float64, DATE/TIMESTAMP como datetime64 e textos como string.
+TAMANHO_LOTE = 10_000  # linhas por fetchmany
+
+class QueryCancelada(Exception):
+    """Query interrompida no servidor: rerun da página ("superada") ou limite de tempo ("timeout")."""
+    def __init__(self, motivo, timeout=None):
+        self.motivo = motivo
+        if motivo == "timeout":
+            super().__init__(f"Query cancelada após {timeout}s (limite por query).")
+        else:
+            super().__init__("Query cancelada: a página foi reexecutada antes de terminar.")
+
+# Falhas do banco (driver, pd.read_sql, cancelamento, espera da coalescência): quem tem um caminho
+# alternativo (ex.: índice de clientes -> query) cai nele só com estas, não com erros de programação
+ERROS_BANCO = (DatabaseError, pd.errors.DatabaseError, QueryCancelada, TimeoutError)
+
+# Sem TTL: o pool é dono da vida das conexões (uma conexão que falha no rollback sai do pool e é
+# fechada). Um TTL aqui abria uma conexão nova a cada expiração que configurar_pool ignorava.
+@st.cache_resource
+def get_connection():
+    """Estabelece e retorna uma conexão com o banco de dados Firebird."""
+    try:
+        parametros = {
+            "database": f"{st.secrets.database.host}:{st.secrets.database.path}",
+            "user": st.secrets.database.user,
+            "password": st.secrets.database.password,
+            "charset": st.secrets.database.charset,
+        }
+        conn = connect(**parametros)
+        instrumentacao.incrementar("db.conexoes_abertas")
+        # A conexão principal é a primeira do pool usado por run_query
+        configurar_pool(parametros, conn, int(st.secrets.database.get("pool", TAMANHO_POOL)), int(st.secrets.database.get("timeout_query", TIMEOUT_QUERY)))
+        if "database_leitura" in st.secrets:
+            # Campos ausentes (usuário, senha, charset) vêm de [database]
+            leitura = {**st.secrets.database.to_dict(), **st.secrets.database_leitura.to_dict()}
+            configurar_leitura(
+                {"database": f"{leitura['host']}:{leitura['path']}", "user": leitura["user"], "password": leitura["password"], "charset": leitura["charset"]},
+                int(leitura.get("pool", TAMANHO_POOL)),
+                {classe: float(leitura.get(f"atraso_{classe}", limite)) for classe, limite in ATRASO_MAXIMO.items()},
+                bool(leitura.get("gravar_batimento", False)),
+            )
+        # Bases das métricas em memória compartilhada entre os processos do host
+        datasets_compartilhados.configurar(parametros["database"])
+        # Invalidação do cache por eventos do banco (conexão própria, uma por processo)
+        query_cache.iniciar_ouvinte(parametros)
+        # Orçamento de memória do cache de resultados ([query_cache] no secrets.toml ajusta)
+        query_cache.configurar(dict(st.secrets.get("query_cache", {})))
+        # Mantém quentes as combinações de filtros mais usadas ([cache_warmer] no secrets.toml ajusta)
+        cache_warmer.iniciar(dict(st.secrets.get("cache_warmer", {})))
+        return conn
+    except Exception as e:
+        st.error(f"Erro ao conectar ao banco de dados: {e}")
+        return None
+
+def normalizar_query(query):
+    """Forma canônica da query: espaços e quebras de linha colapsados, comentários removidos."""
+    query = re.sub(r"--[^\n]*", "", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+def formas_registradas():
+    """Cópia do registro {query normalizada: parâmetros de exemplo}."""
+    with _formas_lock:
+        return dict(_formas_query)
+
+def chave_query(query, params=None):
+    """Chave canônica de uma execução: query normalizada + parâmetros."""
+    return normalizar_query(query), tuple(params or ())
+
+# --- Pool de conexões e cancelamento ---
+def configurar_pool(parametros, conexao_inicial=None, tamanho=TAMANHO_POOL, timeout_query=TIMEOUT_QUERY, destino="principal"):
+    """Ativa o pool do destino (uma vez por processo) e o vigia de cancelamento."""
+    with _pools_lock:
+        if destino in _pools:
+            return
+        _vigia["timeout"] = timeout_query
+        if conexao_inicial is not None:
+            _preparar(conexao_inicial)
+        _pools[destino] = {
+            "parametros": parametros, "tamanho": tamanho, "cond": threading.Condition(),
+            "livres": [conexao_inicial] if conexao_inicial is not None else [], "criadas": int(conexao_inicial is not None),
+        }
+        iniciar = _vigia["thread"] is None
+        if iniciar:
+            _vigia["thread"] = threading.Thread(target=_vigiar, name="db_vigia", daemon=True)
+    if iniciar:
+        _vigia["thread"].start()
+
+def _preparar(conexao):
+    try:
+        conexao._att.set_statement_timeout(_vigia["timeout"] * 1000)
+    except Exception:
+        pass  # Firebird < 4: só o vigia aplica o limite
+
+@contextlib.contextmanager
+def _conexao_do_pool(padrao, destino="principal"):
+    """Conexão exclusiva durante a query; sem pool configurado (ex.: testes), usa `padrao`."""
+    pool = _pools.get(destino)
+    if pool is None:
+        yield padrao, False
+        return
+    with pool["cond"]:
+        while not pool["livres"] and pool["criadas"] >= pool["tamanho"]:
+            pool["cond"].wait()
+        conexao = pool["livres"].pop() if pool["livres"] else None
+        if conexao is None:
+            pool["criadas"] += 1
+    if conexao is None:
+        try:
+            conexao = connect(**pool["parametros"])
+        except Exception:
+            with pool["cond"]:
+                pool["criadas"] -= 1
+                pool["cond"].notify()
+            raise
+        instrumentacao.incrementar("db.conexoes_abertas")
+        _preparar(conexao)
+    saudavel = True
+    try:
+        yield conexao, True
+    finally:
+        try:
+            conexao.rollback()  # encerra a transação de leitura: a próxima query vê dados atuais
+        except Exception:
+            saudavel = False
+        with pool["cond"]:
+            if saudavel:
+                pool["livres"].append(conexao)
+            else:
+                pool["criadas"] -= 1
+            pool["cond"].notify()
+        if not saudavel:
+            with contextlib.suppress(Exception):
+                conexao.close()
+
+def preabrir_pool(quantidade, destino="principal"):
+    """Abre conexões ociosas até o pool do destino ter `quantidade` livres; retorna quantas abriu."""
+    pool = _pools.get(destino)
+    abertas = 0
+    while pool is not None:
+        with pool["cond"]:
+            if len(pool["livres"]) >= quantidade or pool["criadas"] >= pool["tamanho"]:
+                break
+            pool["criadas"] += 1
+        try:
+            conexao = connect(**pool["parametros"])
+        except Exception:
+            with pool["cond"]:
+                pool["criadas"] -= 1
+                pool["cond"].notify()
+            raise
+        instrumentacao.incrementar("db.conexoes_abertas")
+        _preparar(conexao)
+        with pool["cond"]:
+            pool["livres"].append(conexao)
+            pool["cond"].notify()
+        abertas += 1
+    return abertas
+
+def _requisicoes_da_sessao():
+    """Canal de pedidos (rerun/stop) da execução do script atual; None fora de uma sessão."""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.script_requests if ctx is not None else None
+
+def _superacao_suportada():
+    """
+    O cancelamento por rerun lê o estado interno do canal de pedidos do Streamlit: enquanto a query
+    bloqueia a thread do script, o rerun pedido ainda não começou, então nada público (ex.: um
+    contador em st.session_state no topo da página) muda. A versão testada está fixada em
+    requirements.txt; numa versão sem esses atributos o cancelamento fica desligado, com aviso.
+    """
+    requisicoes, dados = ScriptRequests(), RerunData()
+    return (hasattr(requisicoes, "_state") and hasattr(requisicoes, "_rerun_data")
+            and hasattr(dados, "fragment_id_queue") and hasattr(dados, "is_fragment_scoped_rerun"))
+
+SUPERACAO_SUPORTADA = _superacao_suportada()
+if not SUPERACAO_SUPORTADA:
+    print("AVISO: esta versão do Streamlit não expõe o estado de rerun usado pelo cancelamento de "
+          "queries superadas; só o limite de tempo (TIMEOUT_QUERY) cancela queries.", flush=True)
+
+def _superada(requisicoes):
+    """
+    A execução do script foi substituída por um rerun ou parada (estado interno do Streamlit).
+    Fora de uma sessão (None: pré-busca, aquecimento, pré-carga) nunca: só o limite de tempo cancela.
+    """
+    if requisicoes is None:
+        return False
+    if not SUPERACAO_SUPORTADA:
+        instrumentacao.incrementar("db.superacao_indisponivel")
+        return False
+    estado = requisicoes._state
+    if estado is ScriptRequestType.STOP:
+        return True
+    if estado is ScriptRequestType.RERUN:
+        dados = requisicoes._rerun_data
+        # Reexecução disparada por fragmento não interrompe o script em andamento
+        return not (dados.fragment_id_queue and not dados.is_fragment_scoped_rerun)
+    return False
+
+def _vigiar():
+    while True:
+        time.sleep(INTERVALO_VIGIA)
+        try:
+            _verificar_execucoes(time.monotonic())
+        except Exception:
+            # Uma falha numa passada não pode parar o vigia (sem ele não há cancelamento nem limite)
+            instrumentacao.incrementar("db.falhas_vigia")
+
+def _verificar_execucoes(agora):
+    with _em_execucao_lock:
+        execucoes = list(_em_execucao.values())
+    for execucao in execucoes:
+        if execucao["motivo"] is not None:
+            continue
+        if agora - execucao["inicio"] > _vigia["timeout"]:
+            motivo = "timeout"
+        elif execucao["interessados"] and all(_superada(r) for r in execucao["interessados"]):
+            # Um interessado fora de sessão (None) nunca é superado: a query segue até o limite
+            motivo = "superada"
+        else:
+            continue
+        execucao["motivo"] = motivo
+        try:
+            execucao["conexao"]._att.cancel_operation(CancelType.RAISE)
+            instrumentacao.incrementar(f"db.queries_canceladas_{motivo}")
+        except Exception:
+            instrumentacao.incrementar("db.falhas_cancelamento")
+
+# --- Réplica de leitura ---
+def configurar_leitura(parametros, tamanho=TAMANHO_POOL, limites=None, gravar_batimento=False):
+    """
+    Ativa o pool da réplica e a medição periódica do atraso (uma vez por processo).
+    gravar_batimento: só no processo designado; os demais apenas leem o batimento na réplica.
+    """
+    configurar_pool(parametros, None, tamanho, _vigia["timeout"], destino="leitura")
+    with _pools_lock:
+        _replica["limites"].update(limites or {})
+        _replica["gravar_batimento"] = gravar_batimento
+        iniciar = _replica["thread"] is None
+        if iniciar:
+            _replica["thread"] = threading.Thread(target=_monitorar_atraso, name="db_atraso_replica", daemon=True)
+    if iniciar:
+        _replica["thread"].start()
+
+def medir_atraso():
+    """
+    Há quantos segundos a réplica recebeu o último batimento (somente leitura). No processo
+    designado (gravar_batimento), grava antes o batimento no principal.
+    """
+    if _replica["gravar_batimento"]:
+        gravar_batimento()
+    with _conexao_do_pool(None, "leitura") as (conexao, _):
+        cursor = conexao.cursor()
+        cursor.execute("SELECT MOMENTO FROM PLUG_REPLICACAO WHERE ID = 1")
+        linha = cursor.fetchone()
+        cursor.close()
+    if linha is None:
+        raise LookupError("PLUG_REPLICACAO sem batimento na réplica")
+    return max(0.0, (datetime.datetime.now() - linha[0]).total_seconds())
+
+def gravar_batimento():
+    """Grava a hora atual em PLUG_REPLICACAO no principal (um único escritor por instalação)."""
+    try:
+        with _conexao_do_pool(None, "principal") as (conexao, _):
+            cursor = conexao.cursor()
+            cursor.execute(QUERY_BATIMENTO, [datetime.datetime.now()])
+            cursor.close()
+            conexao.commit()
+    except Exception:
+        # Usuário sem escrita no principal: vale o último batimento gravado (atraso cresce e a réplica sai de uso)
+        instrumentacao.incrementar("db.falhas_batimento")
+
+def _monitorar_atraso():
+    while True:
+        try:
+            _replica.update(atraso=medir_atraso(), medido=time.time(), erro=None)
+        except Exception as e:
+            _replica.update(atraso=None, erro=str(e))
+            instrumentacao.incrementar("db.falhas_atraso")
+        time.sleep(INTERVALO_ATRASO)
+
+def atraso_replica():
+    """(atraso em segundos ou None, erro da última medição); None também quando não há réplica."""
+    return _replica["atraso"], _replica["erro"]
+
+def _destino(classe):
+    """Réplica para a classe quando o atraso medido recentemente está dentro do limite dela."""
+    if classe is None or "leitura" not in _pools:
+        return "principal"
+    atraso = _replica["atraso"]
+    if atraso is not None and time.time() - _replica["medido"] < 3 * INTERVALO_ATRASO and atraso <= _replica["limites"].get(classe, 0):
+        instrumentacao.incrementar("db.queries_replica")
+        return "leitura"
+    instrumentacao.incrementar(f"db.queries_replica_evitadas_{classe}")
+    return "principal"
+
+# --- Leitura colunar (Arrow) ---
+def _tipo_arrow(descricao):
+    """Tipo Arrow da coluna a partir de cursor.description; None deixa o pyarrow inferir."""
+    _, tipo, _, _, _, escala, _ = descricao
+    if tipo is decimal.Decimal:
+        return pa.decimal128(38, -escala)  # escala do Firebird é negativa
+    if tipo is datetime.datetime:
+        return pa.timestamp("us")
+    return {str: pa.string(), int: pa.int64(), float: pa.float64(), bool: pa.bool_(), bytes: pa.binary(),
+            datetime.date: pa.date32(), datetime.time: pa.time64("us")}.get(tipo)
+
+def _ler_arrow(conexao, query, params):
+    """Executa a query lendo o cursor em lotes direto para uma pa.Table com schema declarado."""
+    if not isinstance(conexao, Connection):
+        # Conexões que não são do driver (ex.: testes com pd.read_sql substituído)
+        return pa.Table.from_pandas(pd.read_sql(query, conexao, params=params), preserve_index=False)
+    cursor = conexao.cursor()
+    try:
+        cursor.execute(query, params or None)
+        nomes = [d[0] for d in cursor.description]
+        tipos = [_tipo_arrow(d) for d in cursor.description]
+        lotes = []
+        while linhas := cursor.fetchmany(TAMANHO_LOTE):
+            colunas = []
+            for valores, tipo in zip(zip(*linhas), tipos):
+                coluna = pa.array(valores, type=tipo)
+                colunas.append(coluna.cast(pa.float64()) if pa.types.is_decimal(coluna.type) else coluna)
+            lotes.append(pa.RecordBatch.from_arrays(colunas, names=nomes))
+        if not lotes:
+            schema = pa.schema([(n, pa.float64() if t is None or pa.types.is_decimal(t) else t) for n, t in zip(nomes, tipos)])
+            return schema.empty_table()
+        return pa.Table.from_batches(lotes)
+    finally:
+        cursor.close()
+
+def _para_pandas(tabela):
+    # Colunas numéricas sem nulos viram views dos buffers Arrow; datas como datetime64
+    return tabela.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+
+def _ler(conexao, query, params, formato):
+    if formato == "pandas":
+        return pd.read_sql(query, conexao, params=params)
+    tabela = _ler_arrow(conexao, query, params)
+    if formato == "tabela":
+        # Textos como dicionário: colunas repetitivas (tipo, situação, nome) ocupam um valor por categoria
+        return pa.table({nome: coluna.dictionary_encode() if pa.types.is_string(coluna.type) else coluna
+                         for nome, coluna in zip(tabela.column_names, tabela.columns)})
+    return _para_pandas(tabela)
+
+def _executar(conn, query, params, interessados=(), formato="pandas", destino="principal"):
+    instrumentacao.incrementar("db.queries")
+    with _formas_lock:
+        _formas_query[normalizar_query(query)] = tuple(params or ())
+    with _conexao_do_pool(conn, destino) as (conexao, cancelavel):
+        # interessados: sessões esperando o resultado; só é cancelada se todas tiverem sido superadas
+        execucao = {"conexao": conexao, "inicio": time.monotonic(), "interessados": interessados, "motivo": None}
+        if cancelavel:
+            with _em_execucao_lock:
+                _em_execucao[id(execucao)] = execucao
+        try:
+            with instrumentacao.em_uso("db.queries_em_execucao"), instrumentacao.medir("db.query"):
+                return _ler(conexao, query, params, formato)
+        except Exception as e:
+            if execucao["motivo"] is not None:
+                raise QueryCancelada(execucao["motivo"], _vigia["timeout"]) from e
+            raise
+        finally:
+            with _em_execucao_lock:
+                _em_execucao.pop(id(execucao), None)
+
+def run_query(conn, query, params=None, timeout=TIMEOUT_COALESCENCIA, formato="pandas", classe=None):
+    """
+    Executa a query e retorna um DataFrame, sem tratamento de erro (quem chama decide como exibir).
+    formato "pandas" usa pd.read_sql; "arrow" lê o cursor em lotes Arrow (ver _ler_arrow) e devolve
+    o DataFrame com tipos já numéricos/datas, bem mais barato em consultas grandes; "tabela"
+    devolve a pa.Table, com textos como dicionário.
+    classe (chave de ATRASO_MAXIMO) permite ler da réplica quando o atraso dela está no limite da
+    classe; sem classe a query vai sempre ao principal.
+    É o ponto único de execução no banco, onde ficam as métricas de queries em execução e duração.
+    Chamadas simultâneas com a mesma chave são coalescidas: a primeira executa e as demais esperam
+    até `timeout` segundos, recebendo uma cópia do DataFrame ou a mesma exceção.
+    A query roda em uma conexão do pool e é cancelada no servidor (QueryCancelada) quando todas as
+    sessões que esperam por ela foram reexecutadas ou quando passa do limite TIMEOUT_QUERY.
+    """
+    chave = chave_query(query, params)
+    query_cache.registrar_leitura(query_cache.tabelas_da_query(chave[0]))
+    destino = _destino(classe)
+    if destino == "leitura":
+        # Um evento do principal pode chegar antes do dado na réplica: o cache usa o ttl da função
+        query_cache.registrar_leitura({TABELA_REPLICA})
+    requisicoes = _requisicoes_da_sessao()
+    with _em_voo_lock:
+        voo = _em_voo.get((chave, formato, destino))
+        lider = voo is None
+        if lider:
+            voo = _em_voo[(chave, formato, destino)] = {"pronto": threading.Event(), "resultado": None, "erro": None, "interessados": []}
+        voo["interessados"].append(requisicoes)
+
+    if not lider:
+        instrumentacao.incrementar("db.queries_coalescidas")
+        prazo = time.monotonic() + timeout
+        while not voo["pronto"].wait(INTERVALO_VIGIA):
+            if _superada(requisicoes):
+                raise QueryCancelada("superada")
+            if time.monotonic() > prazo:
+                raise TimeoutError(f"Query idêntica em execução há mais de {timeout}s; tente novamente.")
+        if voo["erro"] is not None:
+            raise voo["erro"]
+        # pa.Table é imutável e pode ser compartilhada; DataFrame é copiado
+        return voo["resultado"] if formato == "tabela" else voo["resultado"].copy()
+
+    try:
+        voo["resultado"] = _executar(conn, query, params, voo["interessados"], formato, destino)
+        return voo["resultado"]
+    except Exception as e:
+        voo["erro"] = e
+        raise
+    finally:
+        # Sai do registro antes de liberar os seguidores: chamadas posteriores executam de novo
+        with _em_voo_lock:
+            _em_voo.pop((chave, formato, destino), None)
+        voo["pronto"].set()
+
+@query_cache.em_cache()
+def _consultar(_conn, query, params=None, formato="pandas", classe=None):
+    return run_query(_conn, query, params=params, formato=formato, classe=classe)
+
+def fetch_data(_conn, query, params=None, formato="pandas", classe=None):
+    """
+    Executa uma query no banco de dados e retorna o resultado como um DataFrame do Pandas
+    (formato "arrow" para consultas grandes e classe para ler da réplica, ver run_query).
+    O resultado fica em cache até um evento do banco alterar uma das tabelas lidas (ver query_cache).
+    Erros são exibidos na página e não são guardados no cache.
+    """
+    if _conn is None:
+        return pd.DataFrame()
+    try:
+        return _consultar(_conn, query, params=params, formato=formato, classe=classe)
+    except QueryCancelada as e:
+        query_cache.nao_cachear()
+        st.warning(str(e))
+        return pd.DataFrame()
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao executar a query: {e}")
+        st.code(query, language="sql")
+        return pd.DataFrame()
@@ -0,0 +1,125 @@
+"""
+Dimensões em memória para decorar as queries de fatos depois da busca.
+
+As queries de títulos e vendas traziam PESSOAS só pelo nome/grupo do cliente e CONTAS_CORRENTE
+só para filtrar a empresa, repetindo o nome em cada linha. Aqui as duas dimensões são carregadas
+uma vez por processo:
+
+- PESSOAS: IDPESSOA -> NOME_PESSOA, IDGRUPO_PESSOA. Atualização incremental (IDs maiores que o
+  último carregado) a cada INTERVALO_INCREMENTAL, recarga completa (renomeações) a cada
+  INTERVALO_COMPLETO, e IDs ausentes encontrados ao decorar são buscados na hora.
+- Lojas por empresa (CONTAS_CORRENTE): uma loja pertence à empresa quando tem alguma conta
+  corrente da empresa (NOME_CONTA em constantes.EMPRESAS); None ("Todas") = lojas com conta.
+  `empresas_por_loja` dá o mesmo critério como pares (loja, empresa) para comparar empresas.
+
+As queries de fatos trazem só IDPESSOA/IDLOJA e filtram empresa com `filtro_lojas`.
+"""
+import threading
+import time
+
+import pandas as pd
+
+import query_cache
+from constantes import EMPRESA_POR_CONTA, EMPRESAS
+from db_utils import ERROS_BANCO, run_query
+
+INTERVALO_INCREMENTAL = 300       # segundos (PESSOAS não avisa alterações)
+INTERVALO_COMPLETO = 6 * 3600
+LOTE_IDS_AUSENTES = 500           # IDs por query ao buscar pessoas ainda não carregadas
+LIMITE_IN = 1500                  # itens por lista IN (máximo aceito pelo Firebird)
+CAMPOS_PESSOA = ["NOME_PESSOA", "IDGRUPO_PESSOA"]
+QUERY_PESSOAS = "SELECT p.IDPESSOA, p.NOME_PESSOA, p.IDGRUPO_PESSOA FROM PESSOAS p"
+
+_lock = threading.Lock()
+_pessoas = {"df": None, "completo": 0.0, "incremental": 0.0}
+
+# --- PESSOAS ---
+def _buscar_pessoas(conn, condicao="", params=None, classe="analitica"):
+    df = run_query(conn, QUERY_PESSOAS + condicao, params=params, formato="arrow", classe=classe)
+    return df.astype({"IDPESSOA": "int64"}).set_index("IDPESSOA")
+
+def pessoas(conn):
+    """DataFrame indexado por IDPESSOA com NOME_PESSOA e IDGRUPO_PESSOA."""
+    with _lock:
+        agora = time.time()
+        df = _pessoas["df"]
+        if df is None or agora - _pessoas["completo"] > INTERVALO_COMPLETO:
+            _pessoas.update(df=_buscar_pessoas(conn), completo=agora, incremental=agora)
+        elif agora - _pessoas["incremental"] > INTERVALO_INCREMENTAL:
+            novas = _buscar_pessoas(conn, " WHERE p.IDPESSOA > ?", [int(df.index.max()) if len(df) else 0])
+            if len(novas):
+                _pessoas["df"] = pd.concat([df, novas])
+            _pessoas["incremental"] = agora
+        return _pessoas["df"]
+
+def _completar(conn, ids):
+    """Busca no principal as pessoas de `ids` que ainda não estão no dicionário."""
+    with _lock:
+        df = _pessoas["df"]
+        ausentes = pd.Index(ids).difference(df.index)
+        if ausentes.empty:
+            return df
+        novas = []
+        for inicio in range(0, len(ausentes), LOTE_IDS_AUSENTES):
+            lote = [int(i) for i in ausentes[inicio:inicio + LOTE_IDS_AUSENTES]]
+            novas.append(_buscar_pessoas(conn, f" WHERE p.IDPESSOA IN ({', '.join('?' for _ in lote)})", lote, classe=None))
+        # IDs sem cadastro ficam com campos nulos (como no LEFT JOIN) e não são buscados de novo
+        _pessoas["df"] = pd.concat([df, pd.concat(novas).reindex(ausentes)])
+        return _pessoas["df"]
+
+def decorar(conn, df, coluna="IDPESSOA", campos=None):
+    """Cópia de `df` com os campos de PESSOAS (padrão: nome e grupo) pelo ID da `coluna`."""
+    campos = campos or CAMPOS_PESSOA
+    dicionario = pessoas(conn)
+    ids = pd.to_numeric(df[coluna]).dropna().astype("int64").unique()
+    if not pd.Index(ids).isin(dicionario.index).all():
+        dicionario = _completar(conn, ids)
+    chaves = pd.to_numeric(df[coluna]).astype("Int64")
+    return df.assign(**{campo: chaves.map(dicionario[campo]).to_numpy() for campo in campos})
+
+# --- Lojas por empresa (CONTAS_CORRENTE) ---
+@query_cache.em_cache(ttl=3600)
+def contas_correntes(_conn):
+    return run_query(_conn, "SELECT DISTINCT cc.IDLOJA, cc.NOME_CONTA FROM CONTAS_CORRENTE cc")
+
+def lojas_por_empresa(conn):
+    """{empresa: lojas}, com None ("Todas") para as lojas que têm alguma conta corrente."""
+    df = contas_correntes(conn)
+    lojas = {None: set(df["IDLOJA"])}
+    for empresa, contas in EMPRESAS.items():
+        lojas[empresa] = set(df.loc[df["NOME_CONTA"].isin(contas), "IDLOJA"])
+    return lojas
+
+def empresas_por_loja(conn):
+    """
+    Pares distintos (IDLOJA, EMPRESA) para agrupar por empresa em uma passada: a loja com contas
+    de duas empresas aparece nas duas, como no filtro de cada empresa.
+    """
+    df = contas_correntes(conn)
+    pares = pd.DataFrame({"IDLOJA": df["IDLOJA"], "EMPRESA": df["NOME_CONTA"].map(EMPRESA_POR_CONTA)})
+    return pares.dropna().drop_duplicates(ignore_index=True)
+
+def filtro_lojas(conn, empresa, coluna):
+    """
+    Condição SQL (sem AND) que restringe `coluna` às lojas da empresa (None/"Todas" = lojas com
+    conta corrente), no lugar do JOIN com CONTAS_CORRENTE. Retorna (condição, parâmetros).
+    """
+    empresa = empresa if empresa in EMPRESAS else None
+    lojas = None
+    if conn is not None:
+        try:
+            lojas = sorted(int(loja) for loja in lojas_por_empresa(conn)[empresa])
+        except ERROS_BANCO:
+            pass
+    if lojas is None:
+        # Sem conexão ou dicionário indisponível: mesma regra como subquery no banco
+        contas = EMPRESAS[empresa] if empresa else []
+        condicao_contas = f" WHERE cc.NOME_CONTA IN ({', '.join('?' for _ in contas)})" if contas else ""
+        return f"{coluna} IN (SELECT cc.IDLOJA FROM CONTAS_CORRENTE cc{condicao_contas})", list(contas)
+    if not lojas:
+        return "1 = 0", []
+    # IDs como parâmetros: o texto da query só muda com a quantidade de lojas (reuso do plano
+    # preparado e das chaves de cache); listas longas em blocos abaixo do limite do IN do Firebird
+    blocos = [lojas[i:i + LIMITE_IN] for i in range(0, len(lojas), LIMITE_IN)]
+    condicao = " OR ".join(f"{coluna} IN ({', '.join('?' for _ in bloco)})" for bloco in blocos)
+    return (f"({condicao})" if len(blocos) > 1 else condicao), lojas
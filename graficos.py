@@ -0,0 +1,51 @@
+"""
+Cache de figuras Plotly já serializadas.
+
+A cada rerun, a Visão Geral e a Inadimplência remontavam todas as figuras (go/px), formatavam o
+rótulo de cada ponto (format_brl, formatar_valor_abreviado) e o Streamlit serializava a figura,
+mesmo com os dados inalterados. Com `exibir`, a figura é montada por uma função que depende só
+dos seus argumentos; o JSON resultante fica no query_cache com chave pela função (arquivo, nome,
+bytecode e literais: query_cache.identidade_funcao, como no em_cache), pelos dados (DataFrames
+pelo conteúdo: uma versão nova do dataset muda a chave) e pelas opções do gráfico. Um gráfico
+inalterado é reenviado a partir do JSON.
+
+Montagem e serialização entram na instrumentação: graficos.exibidos / graficos.montados e os
+tempos graficos.exibicao, graficos.montagem e graficos.montagem.<função>.
+"""
+import json
+
+import plotly.graph_objects as go
+import streamlit as st
+
+import instrumentacao
+import query_cache
+
+class _FiguraSerializada(go.Figure):
+    """
+    Figura a partir do JSON em cache. O st.plotly_chart usa to_dict() de figuras sem validá-las
+    de novo (um dict passaria pela validação completa, mais cara que montar a figura).
+    """
+    def __init__(self, spec):
+        super().__init__()
+        self._spec = spec
+
+    def to_dict(self):
+        return json.loads(self._spec)
+
+@query_cache.em_cache(ttl=query_cache.TTL_MAXIMO, aquecer=False)
+def _serializar(grafico, argumentos, _montar):
+    # Sem tabelas lidas: a entrada só sai do cache pelo orçamento de memória ou pelo TTL
+    instrumentacao.incrementar("graficos.montados")
+    with instrumentacao.medir("graficos.montagem"), instrumentacao.medir(f"graficos.montagem.{_montar.__name__}"):
+        figura = _montar(**argumentos)
+        return figura.to_json()
+
+def exibir(montar, argumentos, **opcoes):
+    """
+    st.plotly_chart(montar(**argumentos), **opcoes), reaproveitando o JSON em cache quando a
+    função e os argumentos não mudaram. `montar` não deve ler nada além dos argumentos.
+    """
+    instrumentacao.incrementar("graficos.exibidos")
+    with instrumentacao.medir("graficos.exibicao"):
+        spec = _serializar(query_cache.identidade_funcao(montar), argumentos, montar)
+        return st.plotly_chart(_FiguraSerializada(spec), **opcoes)
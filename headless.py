@@ -0,0 +1,73 @@
+import os
+import sys
+import tomllib
+from contextlib import contextmanager
+from streamlit import config
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import build_mock_config_get_option
+
+# --- Execução headless das páginas (AppTest), usada pelas ferramentas de carga e diagnóstico ---
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+if RAIZ not in sys.path:
+    # As páginas importam db_utils a partir da raiz do app
+    sys.path.insert(0, RAIZ)
+
+PAGINAS = {
+    "Visao_Geral": "Visao_Geral.py",
+    "Fluxo_de_Caixa": os.path.join("pages", "1_Fluxo de Caixa.py"),
+    "Inadimplencia": os.path.join("pages", "2_Inadimplencia.py"),
+    "Automacoes": os.path.join("pages", "3_Automacoes.py"),
+}
+TIPOS_WIDGET = ("selectbox", "multiselect", "number_input", "date_input", "slider", "checkbox", "toggle", "text_input", "radio")
+
+@contextmanager
+def sessoes_paralelas():
+    """
+    Para rodar sessões em threads paralelas. O AppTest aplica e desfaz um patch em
+    config.get_option a cada run, e uma sessão desfaz o patch da outra; com a opção fixada
+    durante o bloco, qualquer ordem de restauração continua vendo global.appTest ligado.
+    """
+    original = config.get_option
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    try:
+        yield
+    finally:
+        config.get_option = original
+
+def carregar_secrets(caminho):
+    """Lê um secrets.toml (ex.: apontando para o banco sintético) para injetar nas sessões."""
+    if not caminho:
+        return {}
+    with open(caminho, "rb") as f:
+        return tomllib.load(f)
+
+def nova_sessao(pagina, secrets=None, timeout=300):
+    """Cria uma sessão simulada (AppTest) para a página informada."""
+    at = AppTest.from_file(os.path.join(RAIZ, PAGINAS[pagina]), default_timeout=timeout)
+    for chave, valor in (secrets or {}).items():
+        at.secrets[chave] = valor
+    return at
+
+def widget_por_label(at, label):
+    for tipo in TIPOS_WIDGET:
+        for widget in getattr(at, tipo):
+            if widget.label == label:
+                return widget
+    raise KeyError(f"Widget '{label}' não encontrado na página.")
+
+def aplicar_filtros(at, filtros):
+    """Altera os widgets informados ({label: valor}) sem executar a página."""
+    for label, valor in filtros.items():
+        widget_por_label(at, label).set_value(valor)
+    return at
+
+def clicar(at, label):
+    """Clica no botão com o label informado e executa a página."""
+    for botao in at.button:
+        if botao.label == label:
+            return botao.click().run()
+    raise KeyError(f"Botão '{label}' não encontrado na página.")
+
+def erros_da_execucao(at):
+    """Mensagens de exceções não tratadas da última execução da página."""
+    return [str(e.value) for e in at.exception]
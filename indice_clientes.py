@@ -0,0 +1,192 @@
+"""
+Índice de clientes (IDPESSOA) por métrica × empresa × mês em bitmaps comprimidos (roaring).
+
+Cada métrica é uma query que traz os pares distintos (loja, mês, cliente) — clientes com venda
+no mês, clientes com título vencido no mês, clientes com contrato iniciado no mês... O índice
+é montado uma vez por métrica, com um bitmap por (empresa, ano, mês), e contagens distintas
+sobre qualquer união de meses e empresas viram operações de bitmap em memória:
+
+    contar(conn, "vendas", [(2025, 3)], ["Plugtech Brasil"])    # clientes com venda em mar/25
+    contar(conn, METRICAS_INADIMPLENCIA["Todos"])                # inadimplentes acumulados
+
+A empresa segue o critério de dimensoes.lojas_por_empresa (loja com conta corrente da empresa);
+empresa None é "Todas" (lojas com conta corrente). O índice de uma métrica é refeito quando o
+banco avisa alteração nas suas tabelas (query_cache), após INTERVALO_RECONSTRUCAO e, para
+métricas relativas a hoje (inadimplência), na virada do dia.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from pyroaring import FrozenBitMap
+
+import dimensoes
+import query_cache
+from constantes import EMPRESAS
+from db_utils import run_query
+
+INTERVALO_RECONSTRUCAO = 3600   # segundos (PESSOAS/CONTAS_CORRENTE não avisam alterações)
+DIAS_CARENCIA_INADIMPLENCIA = 5  # mesmo critério da página de Inadimplência
+SITUACOES_CONTRATO = ("AB", "BL", "CA")
+CENTRO_CUSTO_JURIDICO = 4240340
+
+# Cada query traz IDLOJA, ANO, MES e IDPESSOA distintos; params é chamado a cada montagem
+_QUERY_INADIMPLENTES = """
+SELECT DISTINCT cf.IDLOJA, EXTRACT(YEAR FROM cf.DATA_VENCIMENTO) AS ANO, EXTRACT(MONTH FROM cf.DATA_VENCIMENTO) AS MES, cf.IDPESSOA
+FROM CONTAS_FINANCEIRA cf
+WHERE cf.TIPO_CONTA IN ('RE', 'RP') AND cf.SITUACAO_CONTA = 'AB' AND cf.DATA_VENCIMENTO < ? AND cf.IDPESSOA IS NOT NULL
+  AND {condicao_juridico}
+"""
+_QUERY_CONTRATOS = """
+SELECT DISTINCT c.IDLOJA, EXTRACT(YEAR FROM c.DATA_INICIO) AS ANO, EXTRACT(MONTH FROM c.DATA_INICIO) AS MES, c.IDPESSOA
+FROM CONTRATOS c
+WHERE c.DATA_INICIO IS NOT NULL AND c.IDPESSOA IS NOT NULL{condicao_situacao}
+"""
+
+def _limite_inadimplencia():
+    return [date.today() - timedelta(days=DIAS_CARENCIA_INADIMPLENCIA)]
+
+METRICAS = {
+    "vendas": {
+        "query": """
+SELECT DISTINCT v.IDLOJA, EXTRACT(YEAR FROM v.DATA_VENDA) AS ANO, EXTRACT(MONTH FROM v.DATA_VENDA) AS MES, v.IDPESSOA
+FROM VENDAS v
+WHERE v.DATA_CANCELAMENTO IS NULL AND v.IDPESSOA IS NOT NULL
+""",
+        "params": list,
+    },
+    "inadimplentes": {
+        "query": _QUERY_INADIMPLENTES.format(condicao_juridico=f"(cf.COD_CENTRO_CUSTO IS NULL OR cf.COD_CENTRO_CUSTO <> {CENTRO_CUSTO_JURIDICO})"),
+        "params": _limite_inadimplencia,
+        "diaria": True,
+    },
+    "inadimplentes_juridico": {
+        "query": _QUERY_INADIMPLENTES.format(condicao_juridico=f"cf.COD_CENTRO_CUSTO = {CENTRO_CUSTO_JURIDICO}"),
+        "params": _limite_inadimplencia,
+        "diaria": True,
+    },
+    "contratos": {"query": _QUERY_CONTRATOS.format(condicao_situacao=""), "params": list},
+    **{
+        f"contratos_{situacao}": {"query": _QUERY_CONTRATOS.format(condicao_situacao=f" AND c.SITUACAO = '{situacao}'"), "params": list}
+        for situacao in SITUACOES_CONTRATO
+    },
+}
+
+# Métricas a unir conforme o filtro "Status Jurídico" das páginas
+METRICAS_INADIMPLENCIA = {
+    "Todos": ["inadimplentes", "inadimplentes_juridico"],
+    "Apenas Negativados": ["inadimplentes_juridico"],
+    "Excluir Negativados": ["inadimplentes"],
+}
+
+def metricas_contratos(situacoes):
+    """Métricas de contrato para as situações selecionadas (vazio = todas)."""
+    return [f"contratos_{s}" for s in situacoes] if situacoes else ["contratos"]
+
+_lock = threading.Lock()
+_locks_metrica = {metrica: threading.Lock() for metrica in METRICAS}
+_indices = {}  # metrica -> {"bitmaps": {(empresa, ano, mes): FrozenBitMap}, "montado": ts, "dia": date}
+
+def _descartar(tabelas):
+    with _lock:
+        for metrica in list(_indices):
+            if query_cache.tabelas_da_query(METRICAS[metrica]["query"]) & set(tabelas):
+                del _indices[metrica]
+
+query_cache.ao_invalidar(_descartar)
+
+# --- Montagem ---
+def _montar(conn, metrica):
+    definicao = METRICAS[metrica]
+    df = run_query(conn, definicao["query"], params=definicao["params"](), formato="arrow", classe="analitica")
+    lojas = dimensoes.lojas_por_empresa(conn)
+    loja = df["IDLOJA"].to_numpy()
+    periodo = df["ANO"].to_numpy(dtype=np.int64) * 12 + df["MES"].to_numpy(dtype=np.int64) - 1
+    pessoa = df["IDPESSOA"].to_numpy(dtype=np.uint32)
+    bitmaps = {}
+    for empresa, lojas_empresa in lojas.items():
+        selecao = np.isin(loja, list(lojas_empresa))
+        # Ordena por período e fatia: um bitmap por mês a partir de um único array de clientes
+        ordem = np.argsort(periodo[selecao], kind="stable")
+        periodos, pessoas = periodo[selecao][ordem], pessoa[selecao][ordem]
+        valores, inicios = np.unique(periodos, return_index=True)
+        for p, fatia in zip(valores, np.split(pessoas, inicios[1:])):
+            bitmaps[(empresa, int(p // 12), int(p % 12) + 1)] = FrozenBitMap(fatia)
+    return {"bitmaps": bitmaps, "montado": time.time(), "dia": date.today()}
+
+def _indice(conn, metrica):
+    with _locks_metrica[metrica]:
+        indice = _indices.get(metrica)
+        if (indice is None or time.time() - indice["montado"] > INTERVALO_RECONSTRUCAO
+                or (METRICAS[metrica].get("diaria") and indice["dia"] != date.today())):
+            indice = _montar(conn, metrica)
+            with _lock:
+                _indices[metrica] = indice
+        return indice["bitmaps"]
+
+def invalidar(metrica=None):
+    """Descarta o índice de uma métrica (ou de todas); será remontado no próximo uso."""
+    with _lock:
+        if metrica is None:
+            _indices.clear()
+        else:
+            _indices.pop(metrica, None)
+
+# --- Consultas ---
+def clientes(conn, metricas, meses=None, empresas=None):
+    """
+    Bitmap dos clientes de `metricas` (nome ou lista, unidas) nos `meses` [(ano, mes)] e
+    `empresas` (lista de nomes). meses None = todos os meses; empresas vazio/None = Todas.
+    """
+    metricas = [metricas] if isinstance(metricas, str) else metricas
+    empresas = [e for e in (empresas or []) if e in EMPRESAS] or [None]
+    meses = None if meses is None else set(meses)
+    partes = []
+    for metrica in metricas:
+        for (empresa, ano, mes), bitmap in _indice(conn, metrica).items():
+            if empresa in empresas and (meses is None or (ano, mes) in meses):
+                partes.append(bitmap)
+    return FrozenBitMap.union(*partes) if partes else FrozenBitMap()
+
+def contar(conn, metricas, meses=None, empresas=None):
+    """Número de clientes distintos (ver `clientes`)."""
+    return len(clientes(conn, metricas, meses, empresas))
+
+def contar_por_empresa(conn, metricas, meses=None, empresas=None):
+    """{empresa: clientes distintos} de cada empresa (padrão: todas) em uma passada pelo índice."""
+    metricas = [metricas] if isinstance(metricas, str) else metricas
+    empresas = [e for e in (empresas or EMPRESAS) if e in EMPRESAS]
+    meses = None if meses is None else set(meses)
+    partes = {empresa: [] for empresa in empresas}
+    for metrica in metricas:
+        for (empresa, ano, mes), bitmap in _indice(conn, metrica).items():
+            if empresa in partes and (meses is None or (ano, mes) in meses):
+                partes[empresa].append(bitmap)
+    return {empresa: len(FrozenBitMap.union(*bitmaps)) if bitmaps else 0 for empresa, bitmaps in partes.items()}
+
+def contagens_mensais(conn, metricas, ano, empresas=None, acumulado=False):
+    """
+    Clientes distintos em cada mês do ano (DataFrame MES, TOTAL). Com `acumulado`, cada mês
+    conta a união de todos os meses até ele, inclusive de anos anteriores.
+    """
+    metricas = [metricas] if isinstance(metricas, str) else metricas
+    empresas = [e for e in (empresas or []) if e in EMPRESAS] or [None]
+    por_mes = {mes: [] for mes in range(1, 13)}
+    anteriores = []
+    for metrica in metricas:
+        for (empresa, a, mes), bitmap in _indice(conn, metrica).items():
+            if empresa not in empresas:
+                continue
+            if a == ano:
+                por_mes[mes].append(bitmap)
+            elif a < ano and acumulado:
+                anteriores.append(bitmap)
+    totais, corrente = [], FrozenBitMap.union(*anteriores) if anteriores else FrozenBitMap()
+    for mes in range(1, 13):
+        do_mes = FrozenBitMap.union(*por_mes[mes]) if por_mes[mes] else FrozenBitMap()
+        if acumulado:
+            corrente = corrente | do_mes
+        totais.append(len(corrente if acumulado else do_mes))
+    return pd.DataFrame({"MES": range(1, 13), "TOTAL": totais})
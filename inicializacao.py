@@ -0,0 +1,223 @@
+"""
+Inicialização do processo: pré-carga única com orçamento de tempo e verificação de prontidão.
+
+O Streamlit só executa uma página quando chega a primeira sessão, e cada página importava plotly,
+pandas e os módulos de dados e abria a conexão na hora: depois de um deploy, as primeiras sessões
+esperavam importações, pool de conexões e caches frios. As páginas importam este módulo antes dos
+demais, o que dispara (uma vez por processo) uma thread que:
+
+1. importa os módulos pesados e os de dados, medindo cada um (relatório de importação);
+2. abre a conexão (pool, réplica, ouvinte de eventos, cache_warmer) e pré-abre conexões do pool;
+3. carrega as dimensões (PESSOAS, lojas por empresa) e as bases compartilhadas de metricas.py.
+
+As etapas rodam dentro de `orcamento_segundos`; as que não couberem são relatadas como adiadas e
+concluídas em seguida, fora do orçamento.
+Importações raras (o motor do Excel, xlsxwriter) ficam fora da pré-carga: o pandas só as faz ao
+exportar. Uma etapa que falha (ex.: banco fora do ar) é repetida a cada `nova_tentativa`.
+
+`pronto()` só é verdadeiro depois que todas as etapas terminaram sem erro (uma etapa adiada ainda
+não conta). O estado é gravado em ARQUIVO_PRONTO para probes de readiness:
+
+    python inicializacao.py            # relatório da última inicialização
+    python inicializacao.py --pronto   # sai com 0 só quando o processo está quente
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+
+import instrumentacao
+
+CONFIG_PADRAO = {
+    "orcamento_segundos": 60,  # etapas que começariam depois disso são relatadas como adiadas
+    "conexoes_pool": 2,        # conexões abertas antecipadamente no pool principal
+    "nova_tentativa": 30,      # segundos entre tentativas quando uma etapa falha
+}
+ARQUIVO_PRONTO = ".inicializacao.json"
+
+# Importados (e medidos) na pré-carga, na ordem; xlsxwriter fica de fora de propósito
+MODULOS = [
+    "pandas", "numpy", "pyarrow", "plotly.express", "plotly.graph_objects", "pyroaring", "firebird.driver",
+    "db_utils", "query_cache", "datasets_compartilhados", "dimensoes", "metricas", "indice_clientes",
+    "perfil_clientes", "projecao_caixa", "saldo_diario", "partition_cache", "tabela_paginada",
+]
+
+_lock = threading.Lock()
+_estado = {"thread": None, "config": dict(CONFIG_PADRAO), "inicio": None, "fim": None, "etapas": {}, "importacoes": {}, "carregados": set()}
+
+# --- Etapas (módulos importados dentro das funções: a importação é parte do que se mede) ---
+def _importar(_conn):
+    for nome in MODULOS:
+        if nome in _estado["carregados"]:
+            _estado["importacoes"][nome] = None  # já importado quando a pré-carga começou
+            continue
+        inicio = time.perf_counter()
+        importlib.import_module(nome)
+        _estado["importacoes"].setdefault(nome, time.perf_counter() - inicio)
+    return f"{len(MODULOS)} módulos"
+
+def _conectar(_conn):
+    db_utils = importlib.import_module("db_utils")
+    conn = db_utils.get_connection()
+    if conn is None:
+        db_utils.get_connection.clear()  # não guarda a falha: a próxima tentativa reconecta
+        raise RuntimeError("sem conexão com o banco")
+    abertas = db_utils.preabrir_pool(_estado["config"]["conexoes_pool"])
+    return conn, f"{abertas} conexões pré-abertas"
+
+def _dimensoes(conn):
+    dimensoes = importlib.import_module("dimensoes")
+    return f"{len(dimensoes.pessoas(conn))} pessoas, {len(dimensoes.lojas_por_empresa(conn)[None])} lojas"
+
+def _bases(conn):
+    metricas = importlib.import_module("metricas")
+    return ", ".join(f"{nome}: {len(metricas.base(conn, nome))} linhas" for nome in metricas.METRICAS)
+
+# (nome, função(conn)); _conectar devolve a conexão usada pelas seguintes
+ETAPAS = [("importacoes", _importar), ("conexao", _conectar), ("dimensoes", _dimensoes), ("bases", _bases)]
+
+# --- Pré-carga ---
+def _executar_etapas(pendentes, prazo):
+    """
+    Roda as etapas pendentes em ordem. Retorna (restantes, adiadas): as que faltam a partir da
+    primeira falha ou da primeira que começaria depois do `prazo` (adiadas=True nesse caso).
+    """
+    conn = None
+    for posicao, (nome, funcao) in enumerate(pendentes):
+        if time.monotonic() > prazo:
+            for adiada, _ in pendentes[posicao:]:
+                _estado["etapas"][adiada] = {"situacao": "adiada", "segundos": 0.0, "detalhe": "fora do orçamento"}
+            return pendentes[posicao:], True
+        if conn is None and nome not in ("importacoes", "conexao"):
+            conn, _ = _conectar(None)  # nova tentativa a partir de uma etapa posterior à conexão
+        inicio = time.perf_counter()
+        try:
+            with instrumentacao.medir(f"inicializacao.{nome}"):
+                resultado = funcao(conn)
+        except Exception as e:
+            _estado["etapas"][nome] = {"situacao": "falhou", "segundos": time.perf_counter() - inicio, "detalhe": str(e)}
+            return pendentes[posicao:], False
+        if nome == "conexao":
+            conn, resultado = resultado
+        _estado["etapas"][nome] = {"situacao": "ok", "segundos": time.perf_counter() - inicio, "detalhe": resultado}
+    return [], False
+
+def _preaquecer():
+    config = _estado["config"]
+    pendentes = list(ETAPAS)
+    prazo = time.monotonic() + config["orcamento_segundos"]
+    while True:
+        adiadas = False
+        try:
+            pendentes, adiadas = _executar_etapas(pendentes, prazo)
+        except Exception:
+            pass  # a conexão falhou de novo antes da etapa pendente: tenta no próximo ciclo
+        _gravar()
+        if not pendentes:
+            break
+        if adiadas:
+            # Orçamento esgotado: relata o que ficou para depois e conclui essas etapas sem prazo
+            print(relatorio_texto(estado()), flush=True)
+            prazo = float("inf")
+        else:
+            time.sleep(config["nova_tentativa"])
+    _estado["fim"] = time.time()
+    _gravar()
+    print(relatorio_texto(estado()), flush=True)
+
+def iniciar(config=None):
+    """Dispara (uma vez por processo) a pré-carga em segundo plano."""
+    with _lock:
+        if _estado["thread"] is not None:
+            return
+        if config is None:
+            try:
+                config = dict(st.secrets.get("inicializacao", {}))
+            except Exception:
+                config = {}  # sem secrets.toml (ex.: testes): valores padrão
+        _estado["config"].update(config)
+        _estado["inicio"] = time.time()
+        _estado["carregados"] = set(sys.modules)
+        _estado["etapas"] = {nome: {"situacao": "pendente", "segundos": 0.0, "detalhe": ""} for nome, _ in ETAPAS}
+        _estado["thread"] = threading.Thread(target=_preaquecer, name="inicializacao", daemon=True)
+    _gravar()
+    _estado["thread"].start()
+
+# --- Prontidão ---
+def estado():
+    """Cópia do estado: início, fim, etapas {nome: situação, segundos, detalhe} e importações."""
+    return {
+        "pid": os.getpid(), "inicio": _estado["inicio"], "fim": _estado["fim"], "pronto": pronto(),
+        "orcamento_segundos": _estado["config"]["orcamento_segundos"],
+        "etapas": {nome: dict(etapa) for nome, etapa in _estado["etapas"].items()},
+        "importacoes": dict(_estado["importacoes"]),
+    }
+
+def pronto():
+    etapas = _estado["etapas"]
+    return bool(etapas) and all(etapa["situacao"] == "ok" for etapa in etapas.values())
+
+def _gravar():
+    try:
+        with open(ARQUIVO_PRONTO + ".tmp", "w") as f:
+            json.dump(estado(), f)
+        os.replace(ARQUIVO_PRONTO + ".tmp", ARQUIVO_PRONTO)
+    except OSError:
+        pass
+
+def indicador():
+    """Situação do processo no rodapé da sidebar: verde só depois da pré-carga."""
+    if pronto():
+        st.sidebar.caption("🟢 Servidor pronto")
+    elif any(etapa["situacao"] == "falhou" for etapa in _estado["etapas"].values()):
+        st.sidebar.caption("🔴 Inicialização com falha; tentando novamente")
+    else:
+        st.sidebar.caption("🟡 Servidor aquecendo; as primeiras consultas podem demorar")
+
+def relatorio_texto(dados):
+    """Relatório legível de um estado (de `estado()` ou de ARQUIVO_PRONTO)."""
+    linhas = [f"Inicialização (pid {dados['pid']}): {'pronto' if dados['pronto'] else 'não pronto'}, orçamento {dados['orcamento_segundos']}s"]
+    if dados["inicio"] and dados["fim"]:
+        linhas[0] += f", concluída em {dados['fim'] - dados['inicio']:.1f}s"
+    linhas.append(f"{'etapa':<14}{'situação':<10}{'tempo (s)':>10}  detalhe")
+    for nome, etapa in dados["etapas"].items():
+        linhas.append(f"{nome:<14}{etapa['situacao']:<10}{etapa['segundos']:>10.2f}  {etapa['detalhe']}")
+    linhas.append(f"{'importação':<36}{'tempo (s)':>10}")
+    for nome, segundos in sorted(dados["importacoes"].items(), key=lambda item: -(item[1] or 0)):
+        linhas.append(f"{nome:<36}{'já carregado' if segundos is None else f'{segundos:.3f}':>10}")
+    return "\n".join(linhas)
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Relatório e verificação de prontidão da inicialização do dashboard.")
+    parser.add_argument("--arquivo", default=ARQUIVO_PRONTO, help="estado gravado pelo processo do Streamlit")
+    parser.add_argument("--pronto", action="store_true", help="só verifica: código 0 quando o processo está pronto")
+    args = parser.parse_args()
+    try:
+        with open(args.arquivo) as f:
+            dados = json.load(f)
+    except (OSError, ValueError):
+        print("Nenhuma inicialização registrada.")
+        sys.exit(1)
+    ok = dados["pronto"] and _processo_vivo(dados["pid"])
+    if not args.pronto:
+        print(relatorio_texto(dados))
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
+else:
+    iniciar()
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# --- Instrumentação leve e thread-safe, compartilhada pelo app e pelas ferramentas de carga ---
+_lock = threading.Lock()
+_contadores = defaultdict(int)
+_tempos = defaultdict(lambda: deque(maxlen=10_000))
+_em_uso = defaultdict(int)
+_picos = defaultdict(int)
+
+def incrementar(nome, valor=1):
+    with _lock:
+        _contadores[nome] += valor
+
+@contextmanager
+def medir(nome):
+    """Registra a duração (em segundos) do bloco na série `nome`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        with _lock:
+            _tempos[nome].append(duracao)
+
+@contextmanager
+def em_uso(nome):
+    """Contador de recursos em uso (ex.: queries em execução), guardando o pico observado."""
+    with _lock:
+        _em_uso[nome] += 1
+        _picos[nome] = max(_picos[nome], _em_uso[nome])
+    try:
+        yield
+    finally:
+        with _lock:
+            _em_uso[nome] -= 1
+
+def snapshot():
+    """Retorna uma cópia dos contadores, tempos, recursos em uso e picos."""
+    with _lock:
+        return {
+            "contadores": dict(_contadores),
+            "tempos": {nome: list(valores) for nome, valores in _tempos.items()},
+            "em_uso": dict(_em_uso),
+            "picos": dict(_picos),
+        }
+
+def resetar():
+    with _lock:
+        _contadores.clear()
+        _tempos.clear()
+        _picos.clear()
+        _picos.update(_em_uso)
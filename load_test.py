@@ -0,0 +1,156 @@
+"""
+Teste de carga com N sessões simultâneas executando as páginas do dashboard de forma headless.
+
+Cada sessão abre uma página, troca filtros como um usuário faria e mede o tempo de cada rerun.
+Ao final são reportados p50/p95/p99 de latência, uso de conexões/queries no banco e RSS do processo.
+
+Uso:
+    python load_test.py --secrets .streamlit/secrets_sintetico.toml --sessoes 30 --reruns 5
+"""
+import argparse
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import headless
+import instrumentacao
+import query_cache
+
+EMPRESAS_NOMES = ["Plugtech Brasil", "Plugtech Gestão", "Plugtech Serviços"]
+STATUS_JURIDICO = ["Todos", "Apenas Negativados", "Excluir Negativados"]
+
+# --- Mudanças de filtro realistas por página: label do widget -> gerador de valor ---
+CENARIOS = {
+    "Visao_Geral": {
+        "Ano": lambda r, hoje: r.choice([hoje.year, hoje.year, hoje.year - 1]),
+        "Selecione a(s) Empresa(s)": lambda r, hoje: r.sample(EMPRESAS_NOMES, r.randint(1, len(EMPRESAS_NOMES))),
+        "Selecione o Tipo de Contrato": lambda r, hoje: r.choice([['AB'], ['AB'], ['AB', 'BL']]),
+        "Selecione o Mês para Análise": lambda r, hoje: r.randint(0, 12),
+    },
+    "Inadimplencia": {
+        "Selecione o Ano": lambda r, hoje: r.choice([hoje.year, hoje.year - 1]),
+        "Selecione o Mês": lambda r, hoje: r.randint(1, 12),
+        "Selecione a Empresa": lambda r, hoje: r.choice(["Todas"] + EMPRESAS_NOMES),
+        "Status Jurídico": lambda r, hoje: r.choice(STATUS_JURIDICO),
+    },
+    "Fluxo_de_Caixa": {
+        "Data de Início": lambda r, hoje: hoje - timedelta(days=r.choice([7, 30, 30, 90])),
+        "Empresa": lambda r, hoje: r.choice(["Todas"] + EMPRESAS_NOMES),
+        "Status Jurídico": lambda r, hoje: r.choice(STATUS_JURIDICO),
+    },
+}
+# Peso de cada página no tráfego simulado (picos das 9h e do fechamento do mês)
+PESOS_PADRAO = {"Visao_Geral": 3, "Inadimplencia": 2}
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+def rss_mb():
+    """RSS atual do processo em MB (lido de /proc; em outros sistemas, o pico via resource)."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def simular_sessao(id_sessao, pagina, reruns, secrets, seed):
+    r = random.Random(seed + id_sessao)
+    hoje = date.today()
+    cenario = CENARIOS[pagina]
+    amostras, erros = [], []
+    at = headless.nova_sessao(pagina, secrets)
+    for i in range(reruns + 1):
+        if i > 0:
+            # Um usuário troca um filtro por vez
+            label = r.choice(list(cenario))
+            try:
+                headless.aplicar_filtros(at, {label: cenario[label](r, hoje)})
+            except KeyError as e:
+                erros.append(str(e))
+        inicio = time.perf_counter()
+        at.run()
+        amostras.append(time.perf_counter() - inicio)
+        erros.extend(headless.erros_da_execucao(at))
+    return pagina, amostras, erros
+
+def monitorar(parar, amostras_rss, intervalo=0.5):
+    while not parar.is_set():
+        amostras_rss.append(rss_mb())
+        parar.wait(intervalo)
+
+def executar(sessoes, reruns, paginas, secrets, seed=0, concorrencia=None):
+    r = random.Random(seed)
+    instrumentacao.resetar()
+    atribuicao = r.choices(list(paginas), weights=list(paginas.values()), k=sessoes)
+    amostras_rss, parar = [rss_mb()], threading.Event()
+    monitor = threading.Thread(target=monitorar, args=(parar, amostras_rss), daemon=True)
+    monitor.start()
+    inicio = time.perf_counter()
+    with headless.sessoes_paralelas(), ThreadPoolExecutor(max_workers=concorrencia or sessoes) as pool:
+        futuros = [pool.submit(simular_sessao, i, pagina, reruns, secrets, seed) for i, pagina in enumerate(atribuicao)]
+        resultados = [f.result() for f in futuros]
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    monitor.join()
+    amostras_rss.append(rss_mb())
+    return {"resultados": resultados, "duracao": duracao, "rss": amostras_rss, "instrumentacao": instrumentacao.snapshot(), "cache": query_cache.estatisticas()}
+
+def imprimir_relatorio(relatorio):
+    print(f"Duração total: {relatorio['duracao']:.1f}s")
+    por_pagina = {}
+    erros = []
+    for pagina, amostras, erros_sessao in relatorio["resultados"]:
+        por_pagina.setdefault(pagina, []).extend(amostras)
+        erros.extend(erros_sessao)
+    todas = [a for amostras in por_pagina.values() for a in amostras]
+    print(f"\n{'Página':<16}{'reruns':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}")
+    for pagina, amostras in sorted(por_pagina.items()) + [("TOTAL", todas)]:
+        print(f"{pagina:<16}{len(amostras):>8}{percentil(amostras, 50):>10.2f}{percentil(amostras, 95):>10.2f}{percentil(amostras, 99):>10.2f}")
+
+    inst = relatorio["instrumentacao"]
+    tempos_query = inst["tempos"].get("db.query", [])
+    print("\nBanco de dados:")
+    print(f"  conexões abertas: {inst['contadores'].get('db.conexoes_abertas', 0)}")
+    print(f"  queries executadas: {inst['contadores'].get('db.queries', 0)}")
+    print(f"  queries coalescidas (aguardaram uma execução idêntica): {inst['contadores'].get('db.queries_coalescidas', 0)}")
+    print(f"  queries canceladas: {inst['contadores'].get('db.queries_canceladas_superada', 0)} por rerun, {inst['contadores'].get('db.queries_canceladas_timeout', 0)} por limite de tempo")
+    print(f"  pico de queries simultâneas (conexões em uso): {inst['picos'].get('db.queries_em_execucao', 0)}")
+    print(f"  cache de resultados: {inst['contadores'].get('cache.hits', 0)} acertos, {inst['contadores'].get('cache.misses', 0)} faltas, {inst['contadores'].get('cache.invalidacoes', 0)} invalidações por evento")
+    cache = relatorio["cache"]
+    print(f"  memória do cache: {cache['bytes'] / 2**20:.0f} de {cache['orcamento'] / 2**20:.0f} MB em {cache['entradas']} entradas ({cache['comprimidas']} comprimidas), {cache['despejos']} despejos por orçamento")
+    print(f"  réplica de leitura: {inst['contadores'].get('db.queries_replica', 0)} queries, {sum(v for k, v in inst['contadores'].items() if k.startswith('db.queries_replica_evitadas_'))} no principal por atraso")
+    print(f"  datasets compartilhados: {inst['contadores'].get('datasets.cargas', 0)} cargas, {inst['contadores'].get('datasets.anexados', 0)} versões anexadas")
+    tempos_graficos = inst["tempos"].get("graficos.montagem", [])
+    print(f"  gráficos: {inst['contadores'].get('graficos.exibidos', 0)} exibidos, {inst['contadores'].get('graficos.montados', 0)} montados (p95 da montagem {percentil(tempos_graficos, 95):.3f}s)")
+    print(f"  latência das queries p50/p95/p99: {percentil(tempos_query, 50):.3f}/{percentil(tempos_query, 95):.3f}/{percentil(tempos_query, 99):.3f}s")
+    print(f"\nRSS do processo: inicial {relatorio['rss'][0]:.0f} MB, pico {max(relatorio['rss']):.0f} MB, final {relatorio['rss'][-1]:.0f} MB")
+    if erros:
+        print(f"\n{len(erros)} erro(s) durante as execuções, ex.: {erros[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do dashboard com sessões simultâneas.")
+    parser.add_argument("--secrets", help="secrets.toml apontando para o banco sintético (padrão: .streamlit/secrets.toml)")
+    parser.add_argument("--sessoes", type=int, default=20, help="número de sessões simultâneas")
+    parser.add_argument("--reruns", type=int, default=5, help="trocas de filtro por sessão")
+    parser.add_argument("--paginas", nargs="+", default=list(PESOS_PADRAO), choices=list(CENARIOS), help="páginas exercitadas")
+    parser.add_argument("--concorrencia", type=int, help="limite de sessões executando ao mesmo tempo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paginas = {p: PESOS_PADRAO.get(p, 1) for p in args.paginas}
+    relatorio = executar(args.sessoes, args.reruns, paginas, headless.carregar_secrets(args.secrets), args.seed, args.concorrencia)
+    imprimir_relatorio(relatorio)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Camada de métricas compartilhada entre as páginas.
+
+Cada métrica é definida uma vez, com suas dimensões, e buscada no grão mais fino que as páginas
+compartilham: o resultado fica em uma única entrada do query_cache (invalidada pelos eventos do
+banco) e cada página só fatia esse DataFrame em memória. Trocar de página ou de filtro reaproveita
+a mesma busca em vez de repetir queries quase iguais.
+
+- faturamento: vendas não canceladas somadas por loja × ano × mês × situação do contrato × setor.
+- titulos_abertos: títulos em aberto de CONTAS_FINANCEIRA, um por linha (as páginas precisam do
+  detalhe: cliente, vencimento, valor), com tipo, loja, cliente e flag de jurídico.
+- contratos / equipamentos: um contrato (ou equipamento de contrato) por linha, com loja, situação
+  e datas; QUANTIDADE = 1 é a medida somada (ativos = iniciados e ainda não retirados).
+
+Empresa é uma dimensão derivada: uma loja pertence à empresa quando tem alguma conta corrente da
+empresa (dimensoes.lojas_por_empresa). Cada linha conta uma vez, mesmo que a loja tenha várias
+contas correntes. Com "EMPRESA" em `por`, todas as empresas saem da mesma passada agrupada
+(modo de comparação das páginas): a loja de duas empresas conta nas duas, como em cada filtro. Nome e grupo do cliente vêm do dicionário de PESSOAS (dimensoes.decorar), não
+de um JOIN: a query traz só os IDs.
+"""
+import pandas as pd
+import streamlit as st
+
+import datasets_compartilhados
+import dimensoes
+import query_cache
+from constantes import CASE_SETOR, EMPRESAS
+from db_utils import run_query
+
+CENTRO_CUSTO_JURIDICO = 4240340
+_DIMENSOES_FATURAMENTO = {
+    "IDLOJA": "v.IDLOJA",
+    "ANO": "EXTRACT(YEAR FROM v.DATA_VENDA)",
+    "MES": "EXTRACT(MONTH FROM v.DATA_VENDA)",
+    "SITUACAO": "c.SITUACAO",
+    "COM_CONTRATO": "CASE WHEN c.IDCONTRATO IS NULL THEN 0 ELSE 1 END",
+    "SETOR": CASE_SETOR,
+}
+
+METRICAS = {
+    "faturamento": {
+        "query": f"""
+SELECT {', '.join(f'{expr} AS {nome}' for nome, expr in _DIMENSOES_FATURAMENTO.items())}, SUM(v.VALOR_VENDA) AS VALOR
+FROM VENDAS v
+LEFT JOIN CONTRATOS c ON v.IDCONTRATO = c.IDCONTRATO
+LEFT JOIN PESSOAS p ON c.IDPESSOA = p.IDPESSOA
+WHERE v.DATA_CANCELAMENTO IS NULL
+GROUP BY {', '.join(_DIMENSOES_FATURAMENTO.values())}
+""",
+        "dimensoes": list(_DIMENSOES_FATURAMENTO),
+        "medidas": ["VALOR"],
+        "datas": [],
+        "classe": "analitica",  # réplica de leitura (db_utils.ATRASO_MAXIMO)
+    },
+    "titulos_abertos": {
+        "query": f"""
+SELECT cf.IDCONTA_FINANCEIRA, cf.TIPO_CONTA, cf.IDLOJA, cf.IDPESSOA,
+       cf.DATA_VENCIMENTO, cf.VALOR_NOMINAL, (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO, 0)) AS VALOR_PENDENTE,
+       CASE WHEN cf.COD_CENTRO_CUSTO = {CENTRO_CUSTO_JURIDICO} THEN 1 ELSE 0 END AS JURIDICO
+FROM CONTAS_FINANCEIRA cf
+WHERE cf.SITUACAO_CONTA = 'AB'
+""",
+        "pessoa": "IDPESSOA",  # NOME_PESSOA e IDGRUPO_PESSOA decorados por dimensoes.decorar
+        "dimensoes": ["IDCONTA_FINANCEIRA", "TIPO_CONTA", "IDLOJA", "IDPESSOA", "NOME_PESSOA", "IDGRUPO_PESSOA", "DATA_VENCIMENTO", "JURIDICO"],
+        "medidas": ["VALOR_PENDENTE", "VALOR_NOMINAL"],
+        "datas": ["DATA_VENCIMENTO"],
+        "classe": "relatorio",
+    },
+    "contratos": {
+        "query": """
+SELECT c.IDCONTRATO, c.IDLOJA, c.IDPESSOA, c.SITUACAO, c.DATA_INICIO, 1 AS QUANTIDADE
+FROM CONTRATOS c
+WHERE c.DATA_INICIO IS NOT NULL
+""",
+        "dimensoes": ["IDCONTRATO", "IDLOJA", "IDPESSOA", "SITUACAO", "DATA_INICIO"],
+        "medidas": ["QUANTIDADE"],
+        "datas": ["DATA_INICIO"],
+        "classe": "analitica",
+    },
+    "equipamentos": {
+        "query": """
+SELECT ce.IDCONTRATO_EQUIPAMENTO, c.IDCONTRATO, c.IDLOJA, c.SITUACAO, ei.IDPRODUTO, c.DATA_INICIO, ce.DATA_RETIRADA, 1 AS QUANTIDADE
+FROM CONTRATOS_EQUIPAMENTO ce
+JOIN CONTRATOS c ON ce.IDCONTRATO = c.IDCONTRATO
+LEFT JOIN EQUIPAMENTOS_ITENS ei ON ce.IDEQUIPAMENTO_ITEM = ei.IDEQUIPAMENTO_ITEM
+WHERE c.DATA_INICIO IS NOT NULL
+""",
+        "dimensoes": ["IDCONTRATO_EQUIPAMENTO", "IDCONTRATO", "IDLOJA", "SITUACAO", "IDPRODUTO", "DATA_INICIO", "DATA_RETIRADA"],
+        "medidas": ["QUANTIDADE"],
+        "datas": ["DATA_INICIO", "DATA_RETIRADA"],
+        "classe": "analitica",
+    },
+}
+
+# Filtro "Status Jurídico" das páginas como filtro da dimensão JURIDICO
+JURIDICO_POR_STATUS = {"Todos": None, "Apenas Negativados": [1], "Excluir Negativados": [0]}
+
+# --- Bases compartilhadas (uma por métrica, lida por todas as páginas e processos do host) ---
+def base(_conn, metrica):
+    """Base da métrica, somente leitura (ver datasets_compartilhados)."""
+    definicao = METRICAS[metrica]
+    tabelas = query_cache.tabelas_da_query(definicao["query"])
+    return datasets_compartilhados.obter(metrica, lambda: _carregar_base(_conn, metrica), tabelas, ttl=3600)
+
+def _carregar_base(conn, metrica):
+    definicao = METRICAS[metrica]
+    df = run_query(conn, definicao["query"], formato="arrow", classe=definicao["classe"])
+    for coluna in definicao["datas"]:
+        df[coluna] = pd.to_datetime(df[coluna])
+    for coluna in definicao["medidas"]:
+        df[coluna] = pd.to_numeric(df[coluna]).astype("float64")
+    if "pessoa" in definicao:
+        df = dimensoes.decorar(conn, df, definicao["pessoa"])
+    return df
+
+# --- Fatiamento ---
+def fatiar(conn, metrica, empresas=None, filtros=None, intervalos=None, por=None):
+    """
+    Recorte da métrica a partir da base em cache.
+
+    empresas: nomes de constantes.EMPRESAS (vazio/None = sem filtro de empresa); o item None é
+    "Todas" das páginas financeiras: as lojas com alguma conta corrente, como no índice de clientes.
+    filtros: {coluna: valor, lista de valores aceitos ou função coluna -> máscara}; None é ignorado.
+    intervalos: {dimensão: (inicio, fim)} inclusivo, com None para ponta aberta.
+    por: None devolve as linhas; lista de dimensões devolve a medida principal (a primeira)
+    somada por elas; [] devolve o total. "EMPRESA" em `por` agrupa por empresa (as de
+    `empresas`, ou todas), em vez de filtrar.
+    """
+    definicao = METRICAS[metrica]
+    medida = definicao["medidas"][0]
+    df = base(conn, metrica)
+    selecao = pd.Series(True, index=df.index)
+    empresas = [e for e in (empresas or []) if e in EMPRESAS or e is None]
+    por_empresa = bool(por) and "EMPRESA" in por
+    if por_empresa:
+        empresas = [e for e in empresas if e is not None]
+    if empresas and not por_empresa:
+        lojas = dimensoes.lojas_por_empresa(conn)
+        selecao &= df["IDLOJA"].isin(set().union(*(lojas[e] for e in empresas)))
+    for coluna, valores in (filtros or {}).items():
+        if callable(valores):
+            selecao &= valores(df[coluna])
+        elif valores is not None:
+            selecao &= df[coluna].isin(valores if isinstance(valores, (list, tuple, set)) else [valores])
+    for coluna, (inicio, fim) in (intervalos or {}).items():
+        valores = df[coluna]
+        if inicio is not None:
+            selecao &= valores >= (pd.Timestamp(inicio) if coluna in definicao["datas"] else inicio)
+        if fim is not None:
+            selecao &= valores <= (pd.Timestamp(fim) if coluna in definicao["datas"] else fim)
+    df = df[selecao]
+    if por_empresa:
+        mapa = dimensoes.empresas_por_loja(conn)
+        df = df.merge(mapa[mapa["EMPRESA"].isin(empresas)] if empresas else mapa, on="IDLOJA")
+    if por is None:
+        return df.reset_index(drop=True)
+    if not por:
+        return float(df[medida].sum())
+    return df.groupby(por, as_index=False)[medida].sum()
+
+def filtros_ativos(conn, situacoes, ids_produto):
+    """
+    Filtros de "contratos" e "equipamentos" para os filtros de tipo de contrato e de equipamento
+    da Visão Geral: com produtos, os contratos que têm algum equipamento deles e só esses
+    equipamentos. Retorna (filtros_contratos, filtros_equipamentos).
+    """
+    filtro_contratos = {"SITUACAO": situacoes or None}
+    filtro_equipamentos = {"SITUACAO": situacoes or None}
+    if ids_produto:
+        equipamentos_produto = fatiar(conn, "equipamentos", filtros={"IDPRODUTO": list(ids_produto)})
+        filtro_contratos["IDCONTRATO"] = list(set(equipamentos_produto["IDCONTRATO"]))
+        filtro_equipamentos["IDPRODUTO"] = list(ids_produto)
+    return filtro_contratos, filtro_equipamentos
+
+def fetch_metrica(_conn, metrica, empresas=None, filtros=None, intervalos=None, por=None):
+    """Como fatiar, mas com o erro exibido na página (retorna vazio/0 em caso de falha)."""
+    definicao = METRICAS[metrica]
+    vazio = 0.0 if por == [] else pd.DataFrame(columns=por + definicao["medidas"][:1] if por else definicao["dimensoes"] + definicao["medidas"])
+    if _conn is None:
+        return vazio
+    try:
+        return fatiar(_conn, metrica, empresas, filtros, intervalos, por)
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao calcular a métrica '{metrica}': {e}")
+        return vazio
@@ -1,283 +1,430 @@
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-from datetime import datetime, timedelta
-# Assumindo que db_utils.py está no mesmo diretório
-from db_utils import get_connection, fetch_data
-
-st.set_page_config(page_title="Financeiro", layout="wide")
-st.title("Análise Financeira")
-
-conn = get_connection()
-
-# --- Mapeamento de Empresas e suas contas ---
-EMPRESAS = {
-    "Plugtech Brasil": [
-        'BB PLUG BRASIL RF', 'BNB PLUG BRASIL 8299', 'BNB ES FI PLUG BRASI',
-        'BB PLUG BRASIL', 'BNB RS FI PLUG BRASI', 'BNB PLUG BRASIL13815',
-        'BNB PLUG BRASIL13910', 'CEF PLUG BRASIL', 'CEF AP PLUG BRASIL',
-        'ADM PLUG BRASIL', 'PERDA CONT PLUG BRAS', 'PJBANK PLUGTECH BRAS',
-        'CARTAO 9412 PLUG BRA', 'F RESERVA P BRASIL'
-    ],
-    "Plugtech Gestão": [
-        'BB PLUG GESTAO RF', 'BB PLUG GESTAO', 'SICRED CAPITAL GESTA',
-        'ADM PLUG GESTAO', 'BNB PLUG GESTAO32495', 'PJBANK PLUGTECH GEST',
-        'SICRED PLUG GESTAO'
-    ],
-    "Plugtech Serviços": [
-        'BB PLUG SERVICOS RF', 'BB PLUG SERVICOS', 'BNB PLUG SERV 26551',
-        'BNB PLUG SERVIC28454', 'BNB FI AT PLUG SERVI', 'CEF PLUG SERVICOS',
-        'CEF AP PLUG SERVICOS', 'TESOURARIA PLUG SERV', 'ADM PLUG SERVICOS',
-        'PERDA CONT PLUG SERV', 'CARTAO 3948 PLUG SER', 'PJBANK PLUGTECG SERV',
-        'F RESERVA P SERVICOS'
-    ]
-}
-
-# --- Função de formatação BRL ---
-def format_brl(valor):
-    if not isinstance(valor, (int, float)): return "R$ 0,00"
-    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-# --- Filtros na Sidebar ---
-st.sidebar.header("Filtros da Página")
-data_inicio = st.sidebar.date_input("Data de Início", datetime.now().date() - timedelta(days=30))
-data_fim = st.sidebar.date_input("Data de Fim", datetime.now().date())
-
-empresa_selecionada = st.sidebar.selectbox("Empresa", ["Todas"] + list(EMPRESAS.keys()))
-
-# NOVO: Filtro para contas no jurídico
-status_juridico = st.sidebar.selectbox(
-    "Status Jurídico",
-    ["Todos", "Apenas Negativados", "Excluir Negativados"],
-    index=2 # Padrão para "Excluir Negativados"
-)
-
-
-# --- Construção da condição de filtro dinâmica ---
-filtro_contas_corrente_condicao = []
-filtro_contas_corrente_params = []
-
-filtro_contas_financeira_condicao = []
-filtro_contas_financeira_params = []
-
-
-if empresa_selecionada != 'Todas':
-    contas = EMPRESAS.get(empresa_selecionada)
-    if contas:
-        placeholders = ', '.join('?' for _ in contas)
-        # Filtro para queries na CONTAS_CORRENTE
-        filtro_contas_corrente_condicao.append(f"cc.NOME_CONTA IN ({placeholders})")
-        filtro_contas_corrente_params.extend(contas)
-        # Filtro para queries na CONTAS_FINANCEIRA (que usa join com CONTAS_CORRENTE)
-        filtro_contas_financeira_condicao.append(f"cc.NOME_CONTA IN ({placeholders})")
-        filtro_contas_financeira_params.extend(contas)
-
-# --- ALTERADO: Adiciona condição do filtro jurídico para CONTAS_FINANCEIRA ---
-# A lógica agora usa cf.COD_CENTRO_CUSTO = 4240340
-if status_juridico == 'Apenas Negativados':
-    # Inclui APENAS contas do centro de custo jurídico
-    filtro_contas_financeira_condicao.append("cf.COD_CENTRO_CUSTO = 4240340")
-elif status_juridico == 'Excluir Negativados':
-    # Exclui contas do centro de custo jurídico (trata nulos como "não jurídico")
-    filtro_contas_financeira_condicao.append("(cf.COD_CENTRO_CUSTO IS NULL OR cf.COD_CENTRO_CUSTO <> 4240340)")
-# Se status_juridico == 'Todos', nenhum filtro de custo é adicionado.
-# --- FIM DA ALTERAÇÃO ---
-
-filtro_contas_corrente_condicao.append("cc.IDCONTA_CORRENTE <> 32 AND cc.IDCONTA_CORRENTE <> 33")
-
-# Constrói as strings de filtro final
-filtro_cc_str = " AND ".join(filtro_contas_corrente_condicao) if filtro_contas_corrente_condicao else ""
-filtro_cf_str = " AND ".join(filtro_contas_financeira_condicao) if filtro_contas_financeira_condicao else ""
-
-
-# --- Função para buscar dados de KPI ---
-@st.cache_data(ttl=3600)
-def calcular_kpi(query, params):
-    df = fetch_data(conn, query, params=params)
-    return df.iloc[0,0] if not df.empty and pd.notna(df.iloc[0,0]) else 0
-
-# --- KPIs Financeiros ---
-col1, col2, col3, col4 = st.columns(4)
-
-# KPI 1: Saldo Final - ALTERADO
-query_saldo = f"""
-SELECT COALESCE(SUM(COALESCE(cc.SALDO_FECHAMENTO, 0) + COALESCE(cc.SALDO_DINHEIRO, 0) + COALESCE(cc.SALDO_CHEQUE, 0)), 0)
-FROM CONTAS_CORRENTE cc
-{ "WHERE " + filtro_cc_str if filtro_cc_str else ""}
-"""
-saldo_final = calcular_kpi(query_saldo, filtro_contas_corrente_params)
-col1.metric("Saldo na Conta", format_brl(saldo_final), help="Saldo (Fechamento + Dinheiro + Cheque) somado de todas as contas, baseado nos filtros.")
-
-# KPI 2: Total a Receber (MODIFICADO: removido valor zero)
-query_receber = f"""
-SELECT COALESCE(SUM(cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)),0)
-FROM CONTAS_FINANCEIRA cf
-JOIN CONTAS_CORRENTE cc ON cf.IDLOJA = cc.IDLOJA
-WHERE cf.TIPO_CONTA IN('RE','RP') AND cf.SITUACAO_CONTA='AB' AND cf.DATA_VENCIMENTO BETWEEN ? AND ?
-  AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
-  { "AND " + filtro_cf_str if filtro_cf_str else ""}
-"""
-total_a_receber = calcular_kpi(query_receber, [data_inicio, data_fim] + filtro_contas_financeira_params)
-col2.metric("Contas a Receber", format_brl(total_a_receber))
-
-# KPI 3: Total a Pagar (MODIFICADO: removido valor zero)
-query_pagar = f"""
-SELECT COALESCE(SUM(cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)),0)
-FROM CONTAS_FINANCEIRA cf
-JOIN CONTAS_CORRENTE cc ON cf.IDLOJA = cc.IDLOJA
-WHERE cf.TIPO_CONTA='PA' AND cf.SITUACAO_CONTA='AB' AND cf.DATA_VENCimento BETWEEN ? AND ?
-  AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
-  { "AND " + filtro_cf_str if filtro_cf_str else ""}
-"""
-total_a_pagar = calcular_kpi(query_pagar, [data_inicio, data_fim] + filtro_contas_financeira_params)
-col3.metric("Contas a Pagar", format_brl(total_a_pagar))
-
-# KPI 4: Saldo Operacional
-saldo_operacional = saldo_final + total_a_receber - total_a_pagar
-col4.metric("Saldo Operacional", format_brl(saldo_operacional), help="Saldo na Conta + Contas a Receber - Contas a Pagar")
-
-st.markdown("---")
-
-# --- GRÁFICO NOVO: Entradas vs Saídas ---
-st.subheader("Balanço de Entradas e Saídas")
-query_balanco = f"""
-SELECT
-    lb.DATA_OPERACAO,
-    COALESCE(SUM(CASE WHEN lb.TIPO_LANCAMENTO = 'E' THEN lb.VALOR_LANCAMENTO ELSE 0 END), 0) AS Entradas,
-    COALESCE(SUM(CASE WHEN lb.TIPO_LANCAMENTO = 'S' THEN lb.VALOR_LANCAMENTO ELSE 0 END), 0) AS Saidas
-FROM LANCAMENTOS_BANCARIO lb
-JOIN CONTAS_CORRENTE cc ON lb.IDLOJA = cc.IDLOJA
-WHERE lb.DATA_OPERACAO BETWEEN ? AND ? { "AND " + filtro_cc_str if filtro_cc_str else ""}
-GROUP BY lb.DATA_OPERACAO
-ORDER BY lb.DATA_OPERACAO
-"""
-df_balanco = fetch_data(conn, query_balanco, [data_inicio, data_fim] + filtro_contas_corrente_params)
-
-if not df_balanco.empty:
-    df_balanco.columns = df_balanco.columns.str.lower()
-    df_balanco['data_operacao'] = pd.to_datetime(df_balanco['data_operacao'])
-
-    # Garante que todos os dias do intervalo apareçam
-    todas_as_datas = pd.date_range(start=data_inicio, end=data_fim)
-    df_completo = pd.DataFrame(todas_as_datas, columns=['data_operacao'])
-    df_balanco = pd.merge(df_completo, df_balanco, on='data_operacao', how='left').fillna(0)
-    
-    # Transforma 'saidas' em valor negativo para plotagem
-    df_balanco['saidas'] = -df_balanco['saidas']
-    
-    # Prepara o dataframe para o gráfico (formato longo)
-    df_plot = df_balanco.melt(
-        id_vars='data_operacao',
-        value_vars=['entradas', 'saidas'],
-        var_name='tipo',
-        value_name='valor'
-    )
-    # Remove os dias com valor 0 para não poluir o gráfico
-    df_plot = df_plot[df_plot['valor'] != 0]
-
-    fig_balanco = px.bar(
-        df_plot,
-        x='data_operacao',
-        y='valor',
-        color='tipo',
-        title='Entradas vs. Saídas Diárias',
-        labels={'data_operacao': 'Data', 'valor': 'Valor (R$)', 'tipo': 'Tipo de Lançamento'},
-        color_discrete_map={'entradas': '#2ca02c', 'saidas': '#d62728'},
-        barmode='relative',
-        text=df_plot['valor'].apply(format_brl)
-    )
-
-    fig_balanco.update_traces(textposition='auto')
-    fig_balanco.update_layout(
-        showlegend=True,
-        xaxis=dict(
-            tickformat='%d-%m-%Y', # ALTERADO: formato de data
-            title='Data',
-            type='date'
-        ),
-        yaxis=dict(title='Valor (R$)')
-    )
-
-    st.plotly_chart(fig_balanco, use_container_width=True)
-else:
-    st.info("Não há dados de lançamentos bancários para o período selecionado.")
-
-st.markdown("---")
-
-# --- Tabelas lado a lado: Contas a Receber e Contas a Pagar ---
-col_receber, col_pagar = st.columns(2)
-
-with col_receber:
-    st.markdown("### Contas a Receber Detalhadas")
-    # MODIFICADO: Adicionado filtro (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
-    query_tabela_receber = f"""
-    SELECT cf.DATA_VENCIMENTO,
-            p.NOME_PESSOA AS cliente,
-            (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) AS valor_pendente
-    FROM CONTAS_FINANCEIRA cf
-    JOIN PESSOAS p ON cf.IDPESSOA = p.IDPESSOA
-    JOIN CONTAS_CORRENTE cc ON cf.IDLOJA = cc.IDLOJA
-    WHERE cf.TIPO_CONTA IN('RE','RP')
-      AND cf.DATA_VENCIMENTO BETWEEN ? AND ?
-      AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
-      { "AND " + filtro_cf_str if filtro_cf_str else ""}
-    ORDER BY cf.DATA_VENCIMENTO
-    """
-    df_tabela_receber = fetch_data(conn, query_tabela_receber, [data_inicio, data_fim] + filtro_contas_financeira_params)
-    if not df_tabela_receber.empty:
-        df_tabela_receber.columns = df_tabela_receber.columns.str.lower()
-        # ALTERADO: Formato de data
-        df_tabela_receber['data_vencimento'] = pd.to_datetime(df_tabela_receber['data_vencimento']).dt.strftime('%d-%m-%Y')
-        # REMOVIDA: Formatação manual do valor_pendente
-        # df_tabela_receber['valor_pendente'] = df_tabela_receber['valor_pendente'].apply(format_brl)
-    
-    # MODIFICADO: Usando column_config para formatar
-    st.dataframe(
-        df_tabela_receber,
-        use_container_width=True,
-        hide_index=True,
-        column_config={
-            "valor_pendente": st.column_config.NumberColumn(
-                "Valor Pendente",
-                format="R$ %.2f"
-            )
-        }
-    )
-
-with col_pagar:
-    st.markdown("### Contas a Pagar Detalhadas")
-    # MODIFICADO: Exibindo VALOR_NOMINAL, mas mantendo o filtro de valor pendente > 0
-    query_tabela_pagar = f"""
-    SELECT cf.DATA_VENCIMENTO,
-            p.NOME_PESSOA AS fornecedor,
-            cf.VALOR_NOMINAL AS valor_nominal -- ALTERADO DE VOLTA PARA VALOR_NOMINAL
-    FROM CONTAS_FINANCEIRA cf
-    JOIN PESSOAS p ON cf.IDPESSOA = p.IDPESSOA
-    JOIN CONTAS_CORRENTE cc ON cf.IDLOJA = cc.IDLOJA
-    WHERE cf.TIPO_CONTA='PA'
-      AND cf.DATA_VENCIMENTO BETWEEN ? AND ?
-      AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0 -- FILTRO DE PENDENTE > 0 MANTIDO
-      { "AND " + filtro_cf_str if filtro_cf_str else ""}
-    ORDER BY cf.DATA_VENCIMENTO
-    """
-    df_tabela_pagar = fetch_data(conn, query_tabela_pagar, [data_inicio, data_fim] + filtro_contas_financeira_params)
-    if not df_tabela_pagar.empty:
-        df_tabela_pagar.columns = df_tabela_pagar.columns.str.lower()
-        # ALTERADO: Formato de data
-        df_tabela_pagar['data_vencimento'] = pd.to_datetime(df_tabela_pagar['data_vencimento']).dt.strftime('%d-%m-%Y')
-        # REMOVIDA: Formatação manual do valor_nominal
-        # df_tabela_pagar['valor_nominal'] = df_tabela_pagar['valor_nominal'].apply(format_brl)
-    
-    # MODIFICADO: Usando column_config para formatar
-    st.dataframe(
-        df_tabela_pagar,
-        use_container_width=True,
-        hide_index=True,
-        column_config={
-            "valor_nominal": st.column_config.NumberColumn(
-                "Valor Nominal",
-                format="R$ %.2f"
-            )
-        }
-    )
-
+import streamlit as st
+import inicializacao  # antes dos demais: dispara a pré-carga do processo
+import pandas as pd
+import plotly.express as px
+from datetime import datetime, timedelta
+import comparativo
+import dimensoes
+import graficos
+import metricas
+import perfil_clientes
+import query_cache
+from constantes import EMPRESAS
+import projecao_caixa
+import saldo_diario
+# Assumindo que db_utils.py está no mesmo diretório
+from db_utils import get_connection, fetch_data
+from partition_cache import fetch_data_periodo
+from tabela_paginada import tabela_paginada
+
+st.set_page_config(page_title="Financeiro", layout="wide")
+st.title("Análise Financeira")
+
+conn = get_connection()
+
+# --- Função de formatação BRL ---
+def format_brl(valor):
+    if not isinstance(valor, (int, float)): return "R$ 0,00"
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+# --- Filtros na Sidebar ---
+st.sidebar.header("Filtros da Página")
+data_inicio = st.sidebar.date_input("Data de Início", datetime.now().date() - timedelta(days=30))
+data_fim = st.sidebar.date_input("Data de Fim", datetime.now().date())
+
+empresa_selecionada = st.sidebar.selectbox("Empresa", ["Todas"] + list(EMPRESAS.keys()))
+
+# NOVO: Filtro para contas no jurídico
+status_juridico = st.sidebar.selectbox(
+    "Status Jurídico",
+    ["Todos", "Apenas Negativados", "Excluir Negativados"],
+    index=2 # Padrão para "Excluir Negativados"
+)
+comparar_empresas = st.sidebar.toggle("Comparar empresas", help="Todas as empresas lado a lado, calculadas em uma única passada (o filtro de empresa é ignorado).")
+inicializacao.indicador()
+
+# --- Modo de comparação: todas as empresas agrupadas em uma passada (comparativo.py) ---
+def figura_saldo_empresas(serie):
+    fig = px.line(serie, x="DATA", y="SALDO", color="EMPRESA", title="Saldo ao Final de Cada Dia por Empresa", labels={"DATA": "Data", "SALDO": "Saldo (R$)", "EMPRESA": "Empresa"})
+    fig.update_layout(xaxis=dict(tickformat="%d-%m-%Y"))
+    return fig
+
+if comparar_empresas:
+    st.subheader("Comparativo entre Empresas")
+    try:
+        kpis_empresas, serie_empresas = comparativo.fluxo_caixa(conn, data_inicio, data_fim, status_juridico, datetime.now().date())
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao calcular o comparativo entre empresas: {e}")
+        st.stop()
+    for coluna, (empresa, kpi) in zip(st.columns(len(kpis_empresas)), kpis_empresas.iterrows()):
+        coluna.markdown(f"**{empresa}**")
+        coluna.metric("Saldo na Conta", format_brl(kpi["SALDO"]))
+        coluna.metric("Contas a Receber", format_brl(kpi["RECEBER"]))
+        coluna.metric("Contas a Pagar", format_brl(kpi["PAGAR"]))
+        coluna.metric("Saldo Operacional", format_brl(kpi["SALDO_OPERACIONAL"]))
+    if not serie_empresas.empty:
+        graficos.exibir(figura_saldo_empresas, {"serie": serie_empresas}, use_container_width=True)
+    st.stop()
+
+
+# --- Construção da condição de filtro dinâmica ---
+filtro_contas_corrente_condicao = []
+filtro_contas_corrente_params = []
+
+filtro_contas_financeira_condicao = []
+filtro_contas_financeira_params = []
+
+
+if empresa_selecionada != 'Todas':
+    contas = EMPRESAS.get(empresa_selecionada)
+    if contas:
+        placeholders = ', '.join('?' for _ in contas)
+        # Filtro para queries na CONTAS_CORRENTE
+        filtro_contas_corrente_condicao.append(f"cc.NOME_CONTA IN ({placeholders})")
+        filtro_contas_corrente_params.extend(contas)
+
+# Filtro para queries na CONTAS_FINANCEIRA: lojas da empresa pelo dicionário (dimensoes.py), sem JOIN com CONTAS_CORRENTE
+condicao_lojas, params_lojas = dimensoes.filtro_lojas(conn, empresa_selecionada, "cf.IDLOJA")
+filtro_contas_financeira_condicao.append(condicao_lojas)
+filtro_contas_financeira_params.extend(params_lojas)
+
+# --- ALTERADO: Adiciona condição do filtro jurídico para CONTAS_FINANCEIRA ---
+# A lógica agora usa cf.COD_CENTRO_CUSTO = 4240340
+if status_juridico == 'Apenas Negativados':
+    # Inclui APENAS contas do centro de custo jurídico
+    filtro_contas_financeira_condicao.append("cf.COD_CENTRO_CUSTO = 4240340")
+elif status_juridico == 'Excluir Negativados':
+    # Exclui contas do centro de custo jurídico (trata nulos como "não jurídico")
+    filtro_contas_financeira_condicao.append("(cf.COD_CENTRO_CUSTO IS NULL OR cf.COD_CENTRO_CUSTO <> 4240340)")
+# Se status_juridico == 'Todos', nenhum filtro de custo é adicionado.
+# --- FIM DA ALTERAÇÃO ---
+
+filtro_contas_corrente_condicao.append("cc.IDCONTA_CORRENTE <> 32 AND cc.IDCONTA_CORRENTE <> 33")
+
+# Constrói as strings de filtro final
+filtro_cc_str = " AND ".join(filtro_contas_corrente_condicao) if filtro_contas_corrente_condicao else ""
+filtro_cf_str = " AND ".join(filtro_contas_financeira_condicao) if filtro_contas_financeira_condicao else ""
+
+
+# --- Função para buscar dados de KPI ---
+@query_cache.em_cache(ttl=3600)
+def calcular_kpi(query, params):
+    df = fetch_data(conn, query, params=params)
+    return df.iloc[0,0] if not df.empty and pd.notna(df.iloc[0,0]) else 0
+
+# KPIs por período: recortes da base de títulos em aberto da camada de métricas (metricas.py),
+# compartilhada com Inadimplência e Automações; mover a janela de datas não refaz a busca
+def calcular_kpi_periodo(tipos_conta):
+    return metricas.fetch_metrica(
+        conn, "titulos_abertos", [empresa_selecionada if empresa_selecionada != 'Todas' else None],
+        filtros={"TIPO_CONTA": tipos_conta, "JURIDICO": metricas.JURIDICO_POR_STATUS[status_juridico], "VALOR_PENDENTE": lambda valor: valor > 0},
+        intervalos={"DATA_VENCIMENTO": (data_inicio, data_fim)},
+        por=[],
+    )
+
+# --- KPIs Financeiros ---
+col1, col2, col3, col4 = st.columns(4)
+
+# KPI 1: Saldo Final - ALTERADO
+query_saldo = f"""
+SELECT COALESCE(SUM(COALESCE(cc.SALDO_FECHAMENTO, 0) + COALESCE(cc.SALDO_DINHEIRO, 0) + COALESCE(cc.SALDO_CHEQUE, 0)), 0)
+FROM CONTAS_CORRENTE cc
+{ "WHERE " + filtro_cc_str if filtro_cc_str else ""}
+"""
+saldo_final = calcular_kpi(query_saldo, filtro_contas_corrente_params)
+col1.metric("Saldo na Conta", format_brl(saldo_final), help="Saldo (Fechamento + Dinheiro + Cheque) somado de todas as contas, baseado nos filtros.")
+
+# KPI 2: Total a Receber (MODIFICADO: removido valor zero)
+total_a_receber = calcular_kpi_periodo(["RE", "RP"])
+col2.metric("Contas a Receber", format_brl(total_a_receber))
+
+# KPI 3: Total a Pagar (MODIFICADO: removido valor zero)
+total_a_pagar = calcular_kpi_periodo(["PA"])
+col3.metric("Contas a Pagar", format_brl(total_a_pagar))
+
+# KPI 4: Saldo Operacional
+saldo_operacional = float(saldo_final) + total_a_receber - total_a_pagar
+col4.metric("Saldo Operacional", format_brl(saldo_operacional), help="Saldo na Conta + Contas a Receber - Contas a Pagar")
+
+st.markdown("---")
+
+# --- Evolução do Saldo (série diária por conta corrente, ver saldo_diario.py) ---
+query_saldos_contas = f"""
+SELECT cc.IDCONTA_CORRENTE, COALESCE(cc.SALDO_FECHAMENTO, 0) + COALESCE(cc.SALDO_DINHEIRO, 0) + COALESCE(cc.SALDO_CHEQUE, 0) AS SALDO
+FROM CONTAS_CORRENTE cc
+{ "WHERE " + filtro_cc_str if filtro_cc_str else ""}
+"""
+df_saldos_contas = fetch_data(conn, query_saldos_contas, filtro_contas_corrente_params)
+
+@st.fragment
+def secao_evolucao_saldo():
+    """Saldo ao fim de cada dia do período e saldo em uma data escolhida (reexecuta só esta seção)."""
+    st.subheader("Evolução do Saldo")
+    if conn is None or df_saldos_contas.empty:
+        st.info("Não há contas correntes para os filtros selecionados.")
+        return
+    hoje = datetime.now().date()
+    saldos_atuais = dict(zip(df_saldos_contas["IDCONTA_CORRENTE"], df_saldos_contas["SALDO"]))
+    try:
+        df_serie = saldo_diario.serie_saldo(conn, saldos_atuais, data_inicio, min(data_fim, hoje))
+    except Exception as e:
+        st.error(f"Erro ao montar a série de saldos: {e}")
+        return
+
+    col_grafico, col_data = st.columns([3, 1])
+    with col_grafico:
+        fig_saldo = px.line(df_serie, x="DATA", y="SALDO", title="Saldo ao Final de Cada Dia", labels={"DATA": "Data", "SALDO": "Saldo (R$)"})
+        fig_saldo.update_layout(xaxis=dict(tickformat="%d-%m-%Y"))
+        st.plotly_chart(fig_saldo, use_container_width=True)
+    with col_data:
+        dia = st.date_input("Saldo em", value=min(data_fim, hoje), max_value=hoje, key="saldo_em_data")
+        st.metric(f"Saldo em {dia.strftime('%d-%m-%Y')}", format_brl(saldo_diario.saldo_em(conn, saldos_atuais, dia)))
+
+secao_evolucao_saldo()
+
+st.markdown("---")
+
+# --- Projeção de Caixa (títulos em aberto, ver projecao_caixa.py) ---
+@st.fragment
+def secao_projecao():
+    """Saldo projetado dia a dia a partir do saldo atual e dos títulos em aberto."""
+    st.subheader("Projeção de Caixa")
+    if conn is None:
+        st.info("Sem conexão com o banco de dados.")
+        return
+    try:
+        titulos = projecao_caixa.carregar_titulos(conn)
+        # Filtro de empresa como máscara sobre os títulos já carregados
+        lojas_empresa = dimensoes.lojas_por_empresa(conn)[empresa_selecionada if empresa_selecionada != 'Todas' else None]
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao carregar os títulos em aberto: {e}")
+        return
+
+    col_horizonte, col_vencidos = st.columns([3, 1])
+    horizonte = col_horizonte.slider("Horizonte (dias)", projecao_caixa.HORIZONTE_MINIMO, projecao_caixa.HORIZONTE_MAXIMO, 90, step=15, key="projecao_horizonte")
+    incluir_vencidos = col_vencidos.checkbox("Considerar recebíveis vencidos", value=False, key="projecao_vencidos", help="Recebíveis já vencidos entram hoje (mais o atraso do segmento).")
+    atrasos, inadimplencias = {}, {}
+    with st.expander("Premissas por segmento de cliente"):
+        for segmento, nome in projecao_caixa.SEGMENTOS.items():
+            col_nome, col_atraso, col_inad = st.columns([1, 2, 2])
+            col_nome.markdown(f"**{nome}**")
+            atrasos[segmento] = col_atraso.number_input("Atraso médio (dias)", 0, 180, 0, key=f"projecao_atraso_{segmento}")
+            inadimplencias[segmento] = col_inad.number_input("Inadimplência (%)", 0.0, 100.0, 0.0, step=0.5, key=f"projecao_inad_{segmento}") / 100
+
+    selecao = projecao_caixa.mascara(titulos, lojas_empresa, status_juridico)
+    df_projecao = projecao_caixa.projetar(titulos, saldo_final, datetime.now().date(), horizonte, atrasos, inadimplencias, selecao, incluir_vencidos)
+
+    fig_projecao = px.line(df_projecao, x="DATA", y="SALDO", title=f"Saldo Projetado para os Próximos {horizonte} Dias", labels={"DATA": "Data", "SALDO": "Saldo (R$)"})
+    fig_projecao.add_hline(y=0, line_dash="dot", line_color="red")
+    fig_projecao.update_layout(xaxis=dict(tickformat="%d-%m-%Y"))
+    st.plotly_chart(fig_projecao, use_container_width=True)
+
+    col_entradas, col_saidas, col_final, col_minimo = st.columns(4)
+    col_entradas.metric("Entradas Projetadas", format_brl(float(df_projecao["ENTRADAS"].sum())))
+    col_saidas.metric("Saídas Projetadas", format_brl(float(df_projecao["SAIDAS"].sum())))
+    col_final.metric("Saldo ao Final", format_brl(float(df_projecao["SALDO"].iloc[-1])))
+    minimo = df_projecao.loc[df_projecao["SALDO"].idxmin()]
+    col_minimo.metric("Menor Saldo", format_brl(float(minimo["SALDO"])), help=f"Em {minimo['DATA'].strftime('%d-%m-%Y')}")
+
+secao_projecao()
+
+st.markdown("---")
+
+# --- GRÁFICO NOVO: Entradas vs Saídas ---
+st.subheader("Balanço de Entradas e Saídas")
+
+# Granularidade do gráfico conforme o tamanho do período: a agregação é feita no SQL, então
+# períodos longos trazem poucas linhas e o gráfico tem no máximo algumas dezenas de barras
+GRANULARIDADES_BALANCO = {
+    # nome: (expressão SQL do início do período, frequência pandas, formato do eixo, rótulo)
+    "Diário": ("CAST(lb.DATA_OPERACAO AS DATE)", "D", "%d-%m-%Y", "Diárias"),
+    "Semanal": ("DATEADD(-MOD(EXTRACT(WEEKDAY FROM lb.DATA_OPERACAO) + 6, 7) DAY TO CAST(lb.DATA_OPERACAO AS DATE))", "W-MON", "%d-%m-%Y", "Semanais"),
+    "Mensal": ("DATEADD(1 - EXTRACT(DAY FROM lb.DATA_OPERACAO) DAY TO CAST(lb.DATA_OPERACAO AS DATE))", "MS", "%m-%Y", "Mensais"),
+}
+MAX_BARRAS_COM_ROTULO = 40
+
+def granularidade_automatica(inicio, fim):
+    dias = (fim - inicio).days + 1
+    if dias <= 62:
+        return "Diário"
+    return "Semanal" if dias <= 366 else "Mensal"
+
+def buscar_balanco(inicio, fim, granularidade):
+    expr_periodo = GRANULARIDADES_BALANCO[granularidade][0]
+    query_balanco = f"""
+    SELECT
+        {expr_periodo} AS PERIODO,
+        COALESCE(SUM(CASE WHEN lb.TIPO_LANCAMENTO = 'E' THEN lb.VALOR_LANCAMENTO ELSE 0 END), 0) AS Entradas,
+        COALESCE(SUM(CASE WHEN lb.TIPO_LANCAMENTO = 'S' THEN lb.VALOR_LANCAMENTO ELSE 0 END), 0) AS Saidas
+    FROM LANCAMENTOS_BANCARIO lb
+    JOIN CONTAS_CORRENTE cc ON lb.IDLOJA = cc.IDLOJA
+    WHERE lb.DATA_OPERACAO BETWEEN ? AND ? { "AND " + filtro_cc_str if filtro_cc_str else ""}
+    GROUP BY {expr_periodo}
+    ORDER BY 1
+    """
+    if granularidade == "Diário":
+        # Dias são aditivos por partição: janelas deslocadas reaproveitam os meses em cache
+        return fetch_data_periodo(conn, query_balanco, inicio, fim, filtro_contas_corrente_params, coluna="PERIODO")
+    return fetch_data(conn, query_balanco, [inicio, fim] + filtro_contas_corrente_params)
+
+def grafico_balanco(df_balanco, inicio, fim, granularidade, titulo):
+    _, frequencia, formato, _ = GRANULARIDADES_BALANCO[granularidade]
+    df_balanco = df_balanco.rename(columns=str.lower)
+    df_balanco['periodo'] = pd.to_datetime(df_balanco['periodo'])
+
+    # Garante que todos os períodos do intervalo apareçam
+    inicio_calendario = {"D": inicio, "W-MON": inicio - timedelta(days=inicio.weekday()), "MS": inicio.replace(day=1)}[frequencia]
+    todos_os_periodos = pd.date_range(start=inicio_calendario, end=fim, freq=frequencia)
+    df_completo = pd.DataFrame(todos_os_periodos, columns=['periodo'])
+    df_balanco = pd.merge(df_completo, df_balanco, on='periodo', how='left').fillna(0)
+
+    # Transforma 'saidas' em valor negativo para plotagem
+    df_balanco['saidas'] = -df_balanco['saidas']
+
+    # Prepara o dataframe para o gráfico (formato longo)
+    df_plot = df_balanco.melt(
+        id_vars='periodo',
+        value_vars=['entradas', 'saidas'],
+        var_name='tipo',
+        value_name='valor'
+    )
+    # Remove os períodos com valor 0 para não poluir o gráfico
+    df_plot = df_plot[df_plot['valor'] != 0]
+
+    fig_balanco = px.bar(
+        df_plot,
+        x='periodo',
+        y='valor',
+        color='tipo',
+        title=titulo,
+        labels={'periodo': 'Data', 'valor': 'Valor (R$)', 'tipo': 'Tipo de Lançamento'},
+        color_discrete_map={'entradas': '#2ca02c', 'saidas': '#d62728'},
+        barmode='relative',
+        # Rótulos só com poucas barras: em períodos longos eles dominam o payload e o desenho
+        text=df_plot['valor'].apply(format_brl) if len(todos_os_periodos) <= MAX_BARRAS_COM_ROTULO else None
+    )
+
+    fig_balanco.update_traces(textposition='auto')
+    fig_balanco.update_layout(
+        showlegend=True,
+        xaxis=dict(
+            tickformat=formato, # ALTERADO: formato de data
+            title='Data',
+            type='date'
+        ),
+        yaxis=dict(title='Valor (R$)')
+    )
+    st.plotly_chart(fig_balanco, use_container_width=True)
+    return todos_os_periodos
+
+@st.fragment
+def secao_balanco():
+    """Gráfico de balanço com detalhamento: trocar agrupamento ou período reexecuta só esta seção."""
+    automatica = granularidade_automatica(data_inicio, data_fim)
+    opcoes = [f"Automático ({automatica})"] + list(GRANULARIDADES_BALANCO)
+    escolha = st.radio("Agrupamento", opcoes, horizontal=True, key="balanco_granularidade")
+    granularidade = automatica if escolha == opcoes[0] else escolha
+
+    df_balanco = buscar_balanco(data_inicio, data_fim, granularidade)
+    if df_balanco.empty:
+        st.info("Não há dados de lançamentos bancários para o período selecionado.")
+        return
+    rotulo = GRANULARIDADES_BALANCO[granularidade][3]
+    periodos = grafico_balanco(df_balanco, data_inicio, data_fim, granularidade, f'Entradas vs. Saídas {rotulo}')
+
+    if granularidade != "Diário":
+        # Detalhamento sob demanda: os dias de um mês/semana só são buscados quando pedidos
+        formato = GRANULARIDADES_BALANCO[granularidade][2]
+        periodo = st.selectbox("Detalhar período por dia", [None] + list(periodos), format_func=lambda p: "—" if p is None else p.strftime(formato), key="balanco_detalhe")
+        if periodo is not None:
+            fim_periodo = (periodo + (pd.offsets.MonthEnd(0) if granularidade == "Mensal" else pd.Timedelta(days=6))).date()
+            inicio_detalhe, fim_detalhe = max(periodo.date(), data_inicio), min(fim_periodo, data_fim)
+            df_dias = buscar_balanco(inicio_detalhe, fim_detalhe, "Diário")
+            if df_dias.empty:
+                st.info("Não há lançamentos nesse período.")
+            else:
+                grafico_balanco(df_dias, inicio_detalhe, fim_detalhe, "Diário", f"Entradas vs. Saídas Diárias ({periodo.strftime(formato)})")
+
+secao_balanco()
+
+st.markdown("---")
+
+# --- Tabelas lado a lado: Contas a Receber e Contas a Pagar ---
+col_receber, col_pagar = st.columns(2)
+
+# Chave única de CONTAS_FINANCEIRA, usada como desempate da paginação por keyset
+ID_CONTA_FINANCEIRA = "cf.IDCONTA_FINANCEIRA"
+
+with col_receber:
+    st.markdown("### Contas a Receber Detalhadas")
+    # MODIFICADO: Adicionado filtro (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
+    # Paginada no banco: só a página atual é buscada e enviada ao navegador
+    # PESSOAS fica no JOIN: o nome é coluna de ordenação e de filtro do keyset (trafega só uma página);
+    # NOME_PESSOA aceita nulo e o keyset exige coluna não nula, daí o COALESCE
+    tabela_paginada(
+        "receber", conn,
+        colunas={
+            "data_vencimento": "cf.DATA_VENCIMENTO",
+            "cliente": "COALESCE(p.NOME_PESSOA, '')",
+            "valor_pendente": "(cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0))",
+            "idpessoa": "cf.IDPESSOA",  # oculta: abre o perfil do cliente da linha selecionada
+        },
+        origem=f"""
+        FROM CONTAS_FINANCEIRA cf
+        JOIN PESSOAS p ON cf.IDPESSOA = p.IDPESSOA
+        WHERE cf.TIPO_CONTA IN('RE','RP')
+          AND cf.DATA_VENCIMENTO BETWEEN ? AND ?
+          AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0
+          { "AND " + filtro_cf_str if filtro_cf_str else ""}
+        """,
+        params=[data_inicio, data_fim] + filtro_contas_financeira_params,
+        id_coluna=ID_CONTA_FINANCEIRA,
+        ordenacao_padrao="data_vencimento",
+        coluna_filtro="cliente",
+        rotulo_filtro="Filtrar cliente",
+        detalhe=lambda linha: perfil_clientes.exibir(conn, linha["idpessoa"]),
+        # MODIFICADO: Usando column_config para formatar
+        column_config={
+            "idpessoa": None,
+            "data_vencimento": st.column_config.DateColumn("Vencimento", format="DD-MM-YYYY"),
+            "valor_pendente": st.column_config.NumberColumn(
+                "Valor Pendente",
+                format="R$ %.2f"
+            )
+        }
+    )
+
+with col_pagar:
+    st.markdown("### Contas a Pagar Detalhadas")
+    # MODIFICADO: Exibindo VALOR_NOMINAL, mas mantendo o filtro de valor pendente > 0
+    tabela_paginada(
+        "pagar", conn,
+        colunas={
+            "data_vencimento": "cf.DATA_VENCIMENTO",
+            "fornecedor": "COALESCE(p.NOME_PESSOA, '')",
+            "valor_nominal": "cf.VALOR_NOMINAL",
+        },
+        origem=f"""
+        FROM CONTAS_FINANCEIRA cf
+        JOIN PESSOAS p ON cf.IDPESSOA = p.IDPESSOA
+        WHERE cf.TIPO_CONTA='PA'
+          AND cf.DATA_VENCIMENTO BETWEEN ? AND ?
+          AND (cf.VALOR_NOMINAL - COALESCE(cf.VALOR_PAGO,0)) > 0 -- FILTRO DE PENDENTE > 0 MANTIDO
+          { "AND " + filtro_cf_str if filtro_cf_str else ""}
+        """,
+        params=[data_inicio, data_fim] + filtro_contas_financeira_params,
+        id_coluna=ID_CONTA_FINANCEIRA,
+        ordenacao_padrao="data_vencimento",
+        coluna_filtro="fornecedor",
+        rotulo_filtro="Filtrar fornecedor",
+        column_config={
+            "data_vencimento": st.column_config.DateColumn("Vencimento", format="DD-MM-YYYY"),
+            "valor_nominal": st.column_config.NumberColumn(
+                "Valor Nominal",
+                format="R$ %.2f"
+            )
+        }
+    )
+
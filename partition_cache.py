@@ -0,0 +1,74 @@
+"""
+Cache particionado por período (ano, mês ou dia) para queries filtradas por intervalo de datas.
+
+Uma janela [inicio, fim] é decomposta em partições alinhadas ao calendário: anos inteiros que
+cabem na janela viram partições anuais, e o restante vira partições mensais (ou diárias). Cada
+partição é uma entrada própria do query_cache, então janelas sobrepostas reaproveitam o que já
+foi buscado e deslocar o período em alguns dias custa no máximo uma partição nova. As partições
+das bordas são buscadas inteiras e recortadas no DataFrame pela coluna de data.
+
+A query deve ter `BETWEEN ? AND ?` na coluna de data como os dois primeiros parâmetros e trazer
+essa coluna no SELECT (para agregados, agrupe pela data e some as partições depois).
+"""
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import streamlit as st
+
+import query_cache
+from db_utils import run_query
+
+GRANULARIDADES = ("ano", "mes", "dia")
+
+def _como_data(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+def _fim_do_mes(dia):
+    return (dia.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+def particoes(inicio, fim, granularidade="mes"):
+    """Partições [(ini, fim)] alinhadas ao calendário que cobrem a janela, em ordem cronológica."""
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida: {granularidade}")
+    inicio, fim = _como_data(inicio), _como_data(fim)
+    resultado = []
+    cursor = inicio.replace(day=1) if granularidade != "dia" else inicio
+    while cursor <= fim:
+        fim_do_ano = date(cursor.year, 12, 31)
+        if granularidade != "dia" and cursor.month == 1 and cursor.day == 1 and fim_do_ano <= fim:
+            resultado.append((cursor, fim_do_ano))
+            cursor = fim_do_ano + timedelta(days=1)
+        elif granularidade == "dia":
+            resultado.append((cursor, cursor))
+            cursor += timedelta(days=1)
+        else:
+            resultado.append((cursor, _fim_do_mes(cursor)))
+            cursor = _fim_do_mes(cursor) + timedelta(days=1)
+    return resultado
+
+@query_cache.em_cache()
+def _particao(_conn, query, params, inicio, fim):
+    return run_query(_conn, query, params=[inicio, fim] + list(params))
+
+def buscar_periodo(conn, query, inicio, fim, params=(), coluna="DATA", granularidade="mes"):
+    """Resultado da query na janela [inicio, fim], montado a partir das partições em cache."""
+    inicio, fim = _como_data(inicio), _como_data(fim)
+    partes = [_particao(conn, query, tuple(params), ini, f) for ini, f in particoes(inicio, fim, granularidade)]
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame()
+    df = pd.concat(partes, ignore_index=True)
+    datas = pd.to_datetime(df[coluna]).dt.date
+    return df[(datas >= inicio) & (datas <= fim)].reset_index(drop=True)
+
+def fetch_data_periodo(_conn, query, inicio, fim, params=(), coluna="DATA", granularidade="mes"):
+    """Como db_utils.fetch_data, mas particionado por período (erros exibidos na página)."""
+    if _conn is None:
+        return pd.DataFrame()
+    try:
+        return buscar_periodo(_conn, query, inicio, fim, params, coluna, granularidade)
+    except Exception as e:
+        query_cache.nao_cachear()
+        st.error(f"Erro ao executar a query: {e}")
+        st.code(query, language="sql")
+        return pd.DataFrame()
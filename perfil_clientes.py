@@ -0,0 +1,270 @@
+"""
+Perfil por cliente (IDPESSOA) para o detalhamento das tabelas da Inadimplência e do Fluxo de Caixa.
+
+Ver o histórico de um cliente exigia varrer VENDAS, CONTRATOS e CONTAS_FINANCEIRA a cada clique.
+Aqui as partes do perfil ficam prontas, cada uma ordenada por IDPESSOA:
+
+- faturamento mensal (VENDAS por cliente × ano × mês) e último pagamento (CONTAS_FINANCEIRA):
+  guardados em disco e atualizados incrementalmente, como em saldo_diario.py (só os meses a partir
+  da última atualização menos MARGEM_DIAS), com reconstrução completa periódica;
+- títulos a receber em aberto (faixas de atraso), contratos e equipamentos ativos: das bases de
+  metricas.py já em memória, reordenadas por cliente só quando a base é recarregada.
+
+O perfil de um cliente é uma busca binária por parte, sem query. A busca por nome usa os nomes de
+PESSOAS (dimensoes.pessoas) ordenados sem acento e sem diferenciar maiúsculas: um prefixo é um
+intervalo contíguo desse índice.
+"""
+import os
+import pickle
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import datasets_compartilhados
+import dimensoes
+import metricas
+import query_cache
+from constantes import DIRETORIO_CACHE
+from db_utils import run_query
+
+ARQUIVO = os.path.join(DIRETORIO_CACHE, "perfil_clientes.pkl")
+MARGEM_DIAS = 7                     # vendas e pagamentos retroativos dentro da margem são recapturados
+INTERVALO_ATUALIZACAO = 3600        # segundos entre atualizações incrementais
+INTERVALO_RECONSTRUCAO = 7 * 86400  # reconstrução completa (cancelamentos e estornos fora da margem)
+MESES_HISTORICO = 24                # meses de faturamento exibidos no perfil
+LIMITE_BUSCA = 20                   # clientes listados por busca de nome
+FAIXAS_ATRASO = ["A vencer", "1-30 dias", "31-60 dias", "61-90 dias", "Mais de 90 dias"]
+_LIMITES_ATRASO = [-np.inf, 0, 30, 60, 90, np.inf]  # dias de atraso (pd.cut, fechado à direita)
+
+QUERY_FATURAMENTO = """
+SELECT v.IDPESSOA, EXTRACT(YEAR FROM v.DATA_VENDA) AS ANO, EXTRACT(MONTH FROM v.DATA_VENDA) AS MES, SUM(v.VALOR_VENDA) AS VALOR
+FROM VENDAS v
+WHERE v.DATA_CANCELAMENTO IS NULL AND v.IDPESSOA IS NOT NULL AND v.DATA_VENDA >= ?
+GROUP BY v.IDPESSOA, EXTRACT(YEAR FROM v.DATA_VENDA), EXTRACT(MONTH FROM v.DATA_VENDA)
+"""
+QUERY_PAGAMENTOS = """
+SELECT cf.IDPESSOA, MAX(cf.DATA_PAGAMENTO) AS ULTIMO_PAGAMENTO
+FROM CONTAS_FINANCEIRA cf
+WHERE cf.TIPO_CONTA IN ('RE', 'RP') AND cf.IDPESSOA IS NOT NULL AND cf.DATA_PAGAMENTO >= ?
+GROUP BY cf.IDPESSOA
+"""
+
+_lock = threading.Lock()
+_estado = {"faturamento": None, "pagamentos": None, "atualizado": 0.0, "reconstruido": 0.0, "sujo": False}
+_lock_indices = threading.Lock()
+_indices = {}  # nome -> (bases de origem, índice ordenado por IDPESSOA/nome)
+
+def _marcar_sujo(tabelas):
+    if "VENDAS" in tabelas or "CONTAS_FINANCEIRA" in tabelas:
+        _estado["sujo"] = True
+
+# Um evento do banco em VENDAS ou CONTAS_FINANCEIRA antecipa a próxima atualização incremental
+query_cache.ao_invalidar(_marcar_sujo)
+
+# --- Armazenamento (faturamento mensal e último pagamento) ---
+def _carregar():
+    if _estado["faturamento"] is None:
+        try:
+            if datasets_compartilhados.armazenamento_ignorado():
+                raise FileNotFoundError(ARQUIVO)  # começa vazio: a primeira atualização é completa
+            salvo = pd.read_pickle(ARQUIVO)
+            _estado.update({k: salvo[k] for k in ("faturamento", "pagamentos", "atualizado", "reconstruido")})
+        except (OSError, KeyError, ValueError, TypeError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            # Arquivo truncado, corrompido ou gravado por outra versão do pandas: reconstrução completa
+            _estado["faturamento"] = pd.DataFrame({col: pd.Series(dtype="int64") for col in ("IDPESSOA", "ANO", "MES")}).assign(VALOR=pd.Series(dtype="float64"))
+            _estado["pagamentos"] = pd.DataFrame({"IDPESSOA": pd.Series(dtype="int64"), "ULTIMO_PAGAMENTO": pd.Series(dtype="datetime64[ns]")})
+    return _estado["faturamento"], _estado["pagamentos"]
+
+def _salvar():
+    if datasets_compartilhados.armazenamento_ignorado():
+        return  # ex.: query_plans.py contra o banco de benchmark não sobrescreve a série do app
+    try:
+        os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+        pd.to_pickle({k: _estado[k] for k in ("faturamento", "pagamentos", "atualizado", "reconstruido")}, ARQUIVO + ".tmp")
+        os.replace(ARQUIVO + ".tmp", ARQUIVO)
+    except OSError:
+        pass
+
+def atualizar(conn, completo=False):
+    """Traz as vendas e pagamentos novos (ou todos, se `completo`) e atualiza o perfil em disco."""
+    with _lock:
+        faturamento, pagamentos = _carregar()
+        agora = time.time()
+        completo = completo or faturamento.empty or agora - _estado["reconstruido"] > INTERVALO_RECONSTRUCAO
+        # Meses inteiros a partir da última atualização (menos a margem): substituem os guardados
+        desde = date(1900, 1, 1) if completo else (date.fromtimestamp(_estado["atualizado"]) - timedelta(days=MARGEM_DIAS)).replace(day=1)
+        novos = run_query(conn, QUERY_FATURAMENTO, params=[desde], formato="arrow", classe="analitica")
+        novos = novos.astype({"IDPESSOA": "int64", "ANO": "int64", "MES": "int64"}).assign(VALOR=pd.to_numeric(novos["VALOR"]).astype("float64"))
+        mantidos = faturamento[faturamento["ANO"] * 12 + faturamento["MES"] < desde.year * 12 + desde.month] if not completo else faturamento.iloc[0:0]
+        _estado["faturamento"] = pd.concat([mantidos, novos], ignore_index=True).sort_values(["IDPESSOA", "ANO", "MES"], ignore_index=True)
+
+        pagos = run_query(conn, QUERY_PAGAMENTOS, params=[desde], formato="arrow", classe="analitica")
+        pagos = pagos.astype({"IDPESSOA": "int64"}).assign(ULTIMO_PAGAMENTO=pd.to_datetime(pagos["ULTIMO_PAGAMENTO"]))
+        anteriores = pagamentos if not completo else pagamentos.iloc[0:0]
+        _estado["pagamentos"] = pd.concat([anteriores, pagos], ignore_index=True).groupby("IDPESSOA", as_index=False)["ULTIMO_PAGAMENTO"].max()
+
+        _estado.update(atualizado=agora, sujo=False)
+        if completo:
+            _estado["reconstruido"] = agora
+        _salvar()
+        return len(novos)
+
+def garantir_atualizado(conn):
+    if _estado["sujo"] or time.time() - _estado["atualizado"] > INTERVALO_ATUALIZACAO or _estado["faturamento"] is None:
+        atualizar(conn)
+
+# --- Índices das bases em memória (refeitos só quando a base muda) ---
+def _indice(nome, origens, montar):
+    """montar(*origens), refeito só quando alguma das origens (bases em memória) é outro objeto."""
+    with _lock_indices:
+        atual = _indices.get(nome)
+        if atual is None or any(anterior is not origem for anterior, origem in zip(atual[0], origens)):
+            atual = _indices[nome] = (origens, montar(*origens))
+        return atual[1]
+
+def _por_cliente(df):
+    df = df[df["IDPESSOA"].notna()]
+    return df.astype({"IDPESSOA": "int64"}).sort_values("IDPESSOA", kind="stable", ignore_index=True)
+
+def _titulos(base):
+    return _por_cliente(base[base["TIPO_CONTA"].isin(["RE", "RP"]) & (base["VALOR_PENDENTE"] > 0)].sort_values("DATA_VENCIMENTO"))
+
+def _equipamentos(equipamentos, contratos):
+    equipamentos = equipamentos.drop(columns=["IDLOJA", "SITUACAO", "DATA_INICIO"])
+    return _por_cliente(equipamentos.merge(contratos[["IDCONTRATO", "IDPESSOA", "SITUACAO", "DATA_INICIO"]], on="IDCONTRATO"))
+
+def _normalizar(nomes):
+    return nomes.fillna("").str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii").str.upper().str.strip()
+
+def _nomes(pessoas):
+    nomes = _normalizar(pessoas["NOME_PESSOA"])
+    ordem = np.argsort(nomes.to_numpy(dtype=object), kind="stable")
+    return nomes.to_numpy(dtype=object)[ordem], pessoas.index.to_numpy()[ordem]
+
+def _do_cliente(df, idpessoa):
+    """Linhas de `idpessoa` em `df` ordenado por IDPESSOA (busca binária)."""
+    ids = df["IDPESSOA"].to_numpy()
+    return df.iloc[ids.searchsorted(idpessoa, "left"):ids.searchsorted(idpessoa, "right")]
+
+# --- Consultas ---
+def perfil(conn, idpessoa, hoje=None):
+    """
+    Perfil do cliente: NOME_PESSOA, IDGRUPO_PESSOA, FATURAMENTO (mensal dos últimos
+    MESES_HISTORICO meses), FATURAMENTO_12M, ATRASO (valor e títulos por faixa de FAIXAS_ATRASO),
+    TITULOS (a receber em aberto), CONTRATOS_ATIVOS, EQUIPAMENTOS_ATIVOS e ULTIMO_PAGAMENTO.
+    """
+    idpessoa, hoje = int(idpessoa), pd.Timestamp(hoje or date.today())
+    garantir_atualizado(conn)
+    faturamento, pagamentos = _carregar()
+    contratos = _indice("contratos", (metricas.base(conn, "contratos"),), _por_cliente)
+    equipamentos = _indice("equipamentos", (metricas.base(conn, "equipamentos"), contratos), _equipamentos)
+    titulos = _indice("titulos", (metricas.base(conn, "titulos_abertos"),), _titulos)
+    pessoa = dimensoes.decorar(conn, pd.DataFrame({"IDPESSOA": [idpessoa]})).iloc[0]
+
+    meses = pd.period_range(end=hoje.to_period("M"), periods=MESES_HISTORICO, freq="M")
+    mensal = _do_cliente(faturamento, idpessoa)
+    mensal = (pd.Series(mensal["VALOR"].to_numpy(), index=mensal["ANO"] * 12 + mensal["MES"])
+              .reindex(meses.year * 12 + meses.month, fill_value=0.0))
+    abertos = _do_cliente(titulos, idpessoa)
+    dias_atraso = (hoje - abertos["DATA_VENCIMENTO"]).dt.days
+    abertos = abertos.assign(DIAS_ATRASO=dias_atraso, FAIXA=pd.cut(dias_atraso, _LIMITES_ATRASO, labels=FAIXAS_ATRASO), JURIDICO=abertos["JURIDICO"] == 1)
+    do_cliente = _do_cliente(contratos, idpessoa)
+    ativos = (do_cliente["SITUACAO"] == "AB") & (do_cliente["DATA_INICIO"] <= hoje)
+    equipamentos = _do_cliente(equipamentos, idpessoa)
+    retirada = equipamentos["DATA_RETIRADA"]
+    equipamentos_ativos = (equipamentos["SITUACAO"] == "AB") & (equipamentos["DATA_INICIO"] <= hoje) & (retirada.isna() | (retirada > hoje))
+    pagamento = _do_cliente(pagamentos, idpessoa)["ULTIMO_PAGAMENTO"]
+    return {
+        "IDPESSOA": idpessoa,
+        "NOME_PESSOA": pessoa["NOME_PESSOA"],
+        "IDGRUPO_PESSOA": pessoa["IDGRUPO_PESSOA"],
+        "FATURAMENTO": pd.DataFrame({"PERIODO": meses.to_timestamp(), "VALOR": mensal.to_numpy()}),
+        "FATURAMENTO_12M": float(mensal.iloc[-12:].sum()),
+        "ATRASO": abertos.groupby("FAIXA", observed=False)["VALOR_PENDENTE"].agg(VALOR="sum", TITULOS="count").reset_index(),
+        "TITULOS": abertos[["IDCONTA_FINANCEIRA", "TIPO_CONTA", "DATA_VENCIMENTO", "DIAS_ATRASO", "FAIXA", "VALOR_PENDENTE", "JURIDICO"]].reset_index(drop=True),
+        "CONTRATOS_ATIVOS": int(ativos.sum()),
+        "EQUIPAMENTOS_ATIVOS": int(equipamentos_ativos.sum()),
+        "ULTIMO_PAGAMENTO": pagamento.iloc[0] if len(pagamento) else None,
+    }
+
+def buscar(conn, prefixo, limite=LIMITE_BUSCA):
+    """Clientes cujo nome começa com `prefixo` (sem acento/maiúsculas): DataFrame IDPESSOA, NOME_PESSOA."""
+    pessoas = dimensoes.pessoas(conn)
+    nomes, ids = _indice("nomes", (pessoas,), _nomes)
+    prefixo = _normalizar(pd.Series([prefixo])).iloc[0]
+    if not prefixo:
+        return pd.DataFrame({"IDPESSOA": pd.Series(dtype="int64"), "NOME_PESSOA": pd.Series(dtype=object)})
+    inicio = nomes.searchsorted(prefixo, "left")
+    fim = min(nomes.searchsorted(prefixo + "\U0010ffff", "left"), inicio + limite)
+    encontrados = ids[inicio:fim]
+    return pd.DataFrame({"IDPESSOA": encontrados, "NOME_PESSOA": pessoas.loc[encontrados, "NOME_PESSOA"].to_numpy()})
+
+# --- Exibição ---
+def _formatar_brl(valor):
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def exibir(conn, idpessoa):
+    """Perfil do cliente em um quadro (detalhamento das tabelas e resultado da busca)."""
+    try:
+        dados = perfil(conn, idpessoa)
+    except Exception as e:
+        st.error(f"Erro ao carregar o perfil do cliente: {e}")
+        return
+    with st.container(border=True):
+        st.markdown(f"#### {dados['NOME_PESSOA'] if pd.notna(dados['NOME_PESSOA']) else 'Cliente'} (ID {dados['IDPESSOA']})")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Faturamento 12 Meses", _formatar_brl(dados["FATURAMENTO_12M"]))
+        col2.metric("Em Atraso", _formatar_brl(float(dados["ATRASO"].loc[dados["ATRASO"]["FAIXA"] != FAIXAS_ATRASO[0], "VALOR"].sum())))
+        col3.metric("Contratos Ativos", dados["CONTRATOS_ATIVOS"])
+        col4.metric("Equipamentos Ativos", dados["EQUIPAMENTOS_ATIVOS"])
+        ultimo = dados["ULTIMO_PAGAMENTO"]
+        col5.metric("Último Pagamento", ultimo.strftime("%d/%m/%Y") if ultimo is not None and pd.notna(ultimo) else "—")
+
+        col_faturamento, col_atraso = st.columns([2, 1])
+        with col_faturamento:
+            st.caption(f"Faturamento mensal (últimos {MESES_HISTORICO} meses)")
+            st.bar_chart(dados["FATURAMENTO"], x="PERIODO", y="VALOR", x_label="Mês", y_label="Faturamento (R$)", height=220)
+        with col_atraso:
+            st.caption("Títulos a receber em aberto por faixa de atraso")
+            st.dataframe(
+                dados["ATRASO"], hide_index=True, use_container_width=True,
+                column_config={"FAIXA": "Faixa", "VALOR": st.column_config.NumberColumn("Valor", format="R$ %.2f"), "TITULOS": "Títulos"},
+            )
+        if not dados["TITULOS"].empty:
+            with st.expander(f"Títulos em aberto ({len(dados['TITULOS'])})"):
+                st.dataframe(
+                    dados["TITULOS"], hide_index=True, use_container_width=True,
+                    column_config={
+                        "IDCONTA_FINANCEIRA": "Título", "TIPO_CONTA": "Tipo", "FAIXA": "Faixa", "DIAS_ATRASO": "Dias de Atraso",
+                        "DATA_VENCIMENTO": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
+                        "VALOR_PENDENTE": st.column_config.NumberColumn("Valor Pendente", format="R$ %.2f"),
+                        "JURIDICO": st.column_config.CheckboxColumn("Jurídico"),
+                    },
+                )
+
+def busca(conn, chave):
+    """Busca de cliente pelo início do nome e perfil do escolhido (em fragmento: digitar não reexecuta a página)."""
+    @st.fragment
+    def _busca():
+        prefixo = st.text_input("Buscar cliente pelo início do nome", key=f"{chave}_prefixo").strip()
+        if not prefixo:
+            return
+        try:
+            encontrados = buscar(conn, prefixo)
+        except Exception as e:
+            st.error(f"Erro ao buscar clientes: {e}")
+            return
+        if encontrados.empty:
+            st.info("Nenhum cliente encontrado com esse início de nome.")
+            return
+        nomes = dict(zip(encontrados["IDPESSOA"], encontrados["NOME_PESSOA"]))
+        idpessoa = st.selectbox(
+            f"Clientes encontrados (até {LIMITE_BUSCA})", list(nomes),
+            format_func=lambda i: f"{nomes[i]} (ID {i})", key=f"{chave}_cliente",
+        )
+        exibir(conn, idpessoa)
+    _busca()
@@ -0,0 +1,86 @@
+"""
+Projeção diária de caixa a partir dos títulos em aberto de CONTAS_FINANCEIRA.
+
+Os títulos em aberto (base compartilhada de metricas.py) são convertidos uma vez (em cache) em
+colunas numéricas: dia de vencimento, valor pendente, sinal (+1 a receber, -1 a pagar), segmento
+do cliente, loja e flag de jurídico. A projeção é uma única passada vetorizada: cada título cai no balde do dia em que
+deve entrar/sair (vencimento + atraso do segmento), ponderado por (1 - inadimplência do segmento),
+e np.bincount soma os baldes; o saldo projetado é a soma acumulada a partir do saldo atual.
+Filtros (empresa, jurídico) são máscaras booleanas sobre as mesmas colunas, sem nova query.
+"""
+import numpy as np
+import pandas as pd
+
+import metricas
+import query_cache
+
+# Segmentos de cliente (mesma regra de IDGRUPO_PESSOA da Visão Geral)
+SEGMENTOS = {0: "Outros", 1: "Público", 2: "Privado"}
+GRUPO_PARA_SEGMENTO = {8: 1, 9: 2}
+HORIZONTE_MINIMO, HORIZONTE_MAXIMO = 30, 365
+
+@query_cache.em_cache()
+def carregar_titulos(_conn):
+    """Títulos em aberto já convertidos para colunas numéricas compactas."""
+    df = metricas.base(_conn, "titulos_abertos")
+    df = df[df["TIPO_CONTA"].isin(["RE", "RP", "PA"]) & (df["VALOR_PENDENTE"] > 0)]
+    dias = pd.to_datetime(df["DATA_VENCIMENTO"]).to_numpy().astype("datetime64[D]").astype(np.int32)
+    return pd.DataFrame({
+        "DIA": dias,
+        "VALOR": df["VALOR_PENDENTE"].to_numpy(dtype=np.float64),
+        "SINAL": np.where(df["TIPO_CONTA"].isin(["RE", "RP"]).to_numpy(), 1, -1).astype(np.int8),
+        "SEGMENTO": df["IDGRUPO_PESSOA"].map(GRUPO_PARA_SEGMENTO).fillna(0).to_numpy(dtype=np.int8),
+        "IDLOJA": pd.to_numeric(df["IDLOJA"]).fillna(-1).to_numpy(dtype=np.int64),
+        "JURIDICO": (df["JURIDICO"] == 1).to_numpy(dtype=bool),
+    })
+
+def mascara(titulos, lojas=None, status_juridico="Todos"):
+    """Filtro de empresa (lojas das contas selecionadas) e de jurídico, sem nova query."""
+    selecao = np.ones(len(titulos), dtype=bool)
+    if lojas is not None:
+        selecao &= np.isin(titulos["IDLOJA"].to_numpy(), np.asarray(list(lojas), dtype=np.int64))
+    if status_juridico == "Apenas Negativados":
+        selecao &= titulos["JURIDICO"].to_numpy()
+    elif status_juridico == "Excluir Negativados":
+        selecao &= ~titulos["JURIDICO"].to_numpy()
+    return selecao
+
+def projetar(titulos, saldo_inicial, hoje, horizonte=90, atraso_por_segmento=None, inadimplencia_por_segmento=None, selecao=None, incluir_vencidos=False):
+    """
+    Curva diária de [hoje, hoje + horizonte] com ENTRADAS, SAIDAS e SALDO projetados.
+
+    atraso_por_segmento: {segmento: dias} somados ao vencimento dos títulos a receber.
+    inadimplencia_por_segmento: {segmento: fração 0-1} do valor a receber que não entra.
+    Títulos a pagar vencidos entram hoje; a receber vencidos só entram com `incluir_vencidos`.
+    """
+    horizonte = int(np.clip(horizonte, HORIZONTE_MINIMO, HORIZONTE_MAXIMO))
+    atraso = np.zeros(len(SEGMENTOS), dtype=np.int32)
+    inadimplencia = np.zeros(len(SEGMENTOS), dtype=np.float64)
+    for segmento, valor in (atraso_por_segmento or {}).items():
+        atraso[segmento] = valor
+    for segmento, valor in (inadimplencia_por_segmento or {}).items():
+        inadimplencia[segmento] = valor
+
+    dia = titulos["DIA"].to_numpy()
+    valor = titulos["VALOR"].to_numpy()
+    sinal = titulos["SINAL"].to_numpy()
+    segmento = titulos["SEGMENTO"].to_numpy()
+    receber = sinal > 0
+    selecao = np.ones(len(titulos), dtype=bool) if selecao is None else selecao
+
+    # Dia relativo a hoje em que cada título movimenta o caixa
+    hoje_dia = np.datetime64(hoje, "D").astype(np.int32)
+    relativo = dia - hoje_dia + np.where(receber, atraso[segmento], 0)
+    vencido = dia < hoje_dia
+    selecao = selecao & ~(vencido & receber & (not incluir_vencidos)) & (relativo <= horizonte)
+    balde = np.maximum(relativo[selecao], 0)
+    ponderado = valor[selecao] * np.where(receber[selecao], 1.0 - inadimplencia[segmento[selecao]], 1.0)
+
+    entradas = np.bincount(balde, weights=np.where(receber[selecao], ponderado, 0.0), minlength=horizonte + 1)
+    saidas = np.bincount(balde, weights=np.where(receber[selecao], 0.0, ponderado), minlength=horizonte + 1)
+    return pd.DataFrame({
+        "DATA": pd.date_range(hoje, periods=horizonte + 1, freq="D"),
+        "ENTRADAS": entradas,
+        "SAIDAS": saidas,
+        "SALDO": float(saldo_inicial) + np.cumsum(entradas - saidas),
+    })
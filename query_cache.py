@@ -0,0 +1,406 @@
+"""
+Cache de resultados invalidado por eventos do Firebird, com TTL apenas como reserva.
+
+Triggers nas tabelas transacionais (ver db_migrations.py) fazem POST_EVENT a cada alteração
+confirmada. Uma thread por processo escuta esses eventos e remove só as entradas que leram a
+tabela alterada. As tabelas de cada entrada são registradas automaticamente: toda query
+executada (ou lida do cache) durante o cálculo de uma função em cache é atribuída a ela.
+
+Enquanto o canal de eventos está ativo, as entradas que dependem apenas de tabelas monitoradas
+valem até TTL_MAXIMO. Com o canal fora do ar, ou para tabelas sem trigger, vale o `ttl` da função.
+
+A memória do cache tem um orçamento global em bytes: ao passar dele, as entradas usadas há mais
+tempo são descartadas (LRU ponderado pelo tamanho de cada entrada). DataFrames grandes ficam
+guardados em Arrow IPC comprimido com zstd e são descomprimidos a cada leitura.
+"""
+import copy
+import functools
+import hashlib
+import inspect
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import pandas as pd
+import pyarrow as pa
+from firebird.driver import connect
+
+import instrumentacao
+
+# Evento disparado pelo trigger de cada tabela monitorada
+EVENTOS = {
+    "PLUG_ALTERACAO_VENDAS": "VENDAS",
+    "PLUG_ALTERACAO_CONTAS_FINANCEIRA": "CONTAS_FINANCEIRA",
+    "PLUG_ALTERACAO_LANCAMENTOS_BANCARIO": "LANCAMENTOS_BANCARIO",
+    "PLUG_ALTERACAO_CONTRATOS": "CONTRATOS",
+}
+TABELAS_MONITORADAS = frozenset(EVENTOS.values())
+TTL_PADRAO = 300            # reserva quando a entrada não está coberta por eventos
+TTL_MAXIMO = 24 * 3600      # rede de segurança mesmo com o canal de eventos ativo
+ESPERA_EVENTOS = 30         # segundos por espera no coletor (permite checar a conexão)
+
+# Orçamento de memória ([query_cache] no secrets.toml ajusta, ver configurar)
+CONFIG_PADRAO = {
+    "orcamento_mb": 512,           # soma dos tamanhos das entradas
+    "compressao_minima_kb": 256,   # DataFrames a partir deste tamanho são guardados comprimidos
+}
+
+_lock = threading.Lock()
+_entradas = OrderedDict()        # chave -> {"valor", "comprimido", "bytes", "tabelas", "criado", "ttl"}, da menos à mais recente
+_memoria = {"bytes": 0, "orcamento": CONFIG_PADRAO["orcamento_mb"] * 2**20, "compressao_minima": CONFIG_PADRAO["compressao_minima_kb"] * 2**10}
+_por_tabela = defaultdict(set)   # tabela -> chaves que a leram
+_geracoes = {"atual": 0, "por_tabela": {}}  # contador de invalidações e o valor dele na última de cada tabela
+_canal = {"ativo": False, "erro": None, "thread": None}
+_local = threading.local()
+_ao_invalidar = []               # callbacks chamados com as tabelas alteradas (ex.: cache_warmer)
+
+# Uso de cada chave, para o aquecimento do cache: contagem com decaimento (meia-vida em segundos)
+MEIA_VIDA_USO = 7 * 24 * 3600
+LIMITE_USOS = 5000               # chaves guardadas; acima disso saem as de menor uso com decaimento
+_usos = {}                       # chave -> {"contagem", "ultimo", "func", "argumentos"}
+
+# --- Dependências ---
+def tabelas_da_query(query):
+    """Tabelas citadas nas cláusulas FROM/JOIN da query."""
+    return {t.upper() for t in re.findall(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_$]*)", query, flags=re.IGNORECASE)}
+
+def _calculos_em_andamento():
+    if not hasattr(_local, "pilha"):
+        _local.pilha = []
+    return _local.pilha
+
+def registrar_leitura(tabelas):
+    """Atribui as tabelas lidas a todas as funções em cache sendo calculadas nesta thread."""
+    for calculo in _calculos_em_andamento():
+        calculo["tabelas"].update(tabelas)
+
+def nao_cachear():
+    """Chamado por quem trata um erro de query: o resultado em cálculo não deve ser guardado."""
+    for calculo in _calculos_em_andamento():
+        calculo["falhou"] = True
+
+# --- Armazenamento ---
+def _copiar(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy()
+    return copy.deepcopy(valor)
+
+def _congelar(valor):
+    """Versão hashable dos argumentos (listas viram tuplas, dicts viram tuplas ordenadas)."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        # Pelo conteúdo, como o st.cache_data faz (ex.: planilhas geradas a partir de DataFrames)
+        conteudo = hashlib.sha1(pd.util.hash_pandas_object(valor).to_numpy().tobytes())
+        conteudo.update(repr(list(valor.columns) if isinstance(valor, pd.DataFrame) else valor.name).encode())
+        return (type(valor).__name__, conteudo.hexdigest())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        itens = tuple(_congelar(v) for v in valor)
+        return tuple(sorted(itens, key=repr)) if isinstance(valor, (set, frozenset)) else itens
+    if isinstance(valor, dict):
+        return tuple(sorted((k, _congelar(v)) for k, v in valor.items()))
+    return valor
+
+def _tamanho(valor):
+    """Bytes aproximados ocupados pelo valor."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+def _comprimir(df):
+    tabela = pa.Table.from_pandas(df, preserve_index=True)
+    destino = pa.BufferOutputStream()
+    with pa.ipc.new_stream(destino, tabela.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as escritor:
+        escritor.write_table(tabela)
+    return destino.getvalue()
+
+def _descomprimir(buffer):
+    return pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+def _empacotar(valor):
+    """(valor guardado, comprimido?, bytes): DataFrames grandes viram Arrow IPC com zstd."""
+    tamanho = _tamanho(valor)
+    # Nomes de coluna não textuais não voltam iguais do Arrow: esses ficam sem comprimir
+    if isinstance(valor, pd.DataFrame) and tamanho >= _memoria["compressao_minima"] and all(isinstance(c, str) for c in valor.columns):
+        try:
+            buffer = _comprimir(valor)
+            return buffer, True, buffer.size
+        except (pa.ArrowException, TypeError, ValueError):
+            pass  # colunas de objetos que o Arrow não representa: guarda sem comprimir
+    return _copiar(valor), False, tamanho
+
+def _expirada(entrada, agora):
+    idade = agora - entrada["criado"]
+    # Sem leitura de tabela registrada, nenhum evento a invalida: vale o ttl da função
+    coberta = _canal["ativo"] and bool(entrada["tabelas"]) and entrada["tabelas"] <= TABELAS_MONITORADAS
+    return idade > (TTL_MAXIMO if coberta else entrada["ttl"])
+
+def _remover(chave):
+    entrada = _entradas.pop(chave, None)
+    if entrada:
+        _memoria["bytes"] -= entrada["bytes"]
+        for tabela in entrada["tabelas"]:
+            _por_tabela[tabela].discard(chave)
+
+def _despejar():
+    """Descarta as entradas menos recentes até caber no orçamento (chamado com _lock)."""
+    despejadas = 0
+    while _memoria["bytes"] > _memoria["orcamento"] and _entradas:
+        _remover(next(iter(_entradas)))
+        despejadas += 1
+    if despejadas:
+        instrumentacao.incrementar("cache.despejos", despejadas)
+
+def ler(chave):
+    """Retorna (True, cópia do valor) se houver entrada válida, senão (False, None)."""
+    with _lock:
+        entrada = _entradas.get(chave)
+        if entrada and _expirada(entrada, time.monotonic()):
+            _remover(chave)
+            entrada = None
+        if entrada is not None:
+            _entradas.move_to_end(chave)
+    if entrada is None:
+        instrumentacao.incrementar("cache.misses")
+        return False, None
+    instrumentacao.incrementar("cache.hits")
+    registrar_leitura(entrada["tabelas"])
+    if entrada["comprimido"]:
+        return True, _descomprimir(entrada["valor"])
+    return True, _copiar(entrada["valor"])
+
+def geracao():
+    """Marca do momento para `gravar(..., desde=)`: invalidações posteriores descartam a gravação."""
+    with _lock:
+        return _geracoes["atual"]
+
+def gravar(chave, valor, tabelas, ttl=TTL_PADRAO, desde=None):
+    """
+    Guarda o valor. Com `desde` (de `geracao()` antes do cálculo), não guarda se alguma das
+    tabelas foi invalidada depois disso: o valor foi calculado com dados anteriores ao evento.
+    """
+    guardado, comprimido, tamanho = _empacotar(valor)  # fora do lock: compressão pode demorar
+    with _lock:
+        _remover(chave)
+        if desde is not None and any(_geracoes["por_tabela"].get(t, 0) > desde for t in tabelas):
+            instrumentacao.incrementar("cache.descartados_por_evento")
+            return
+        if tamanho > _memoria["orcamento"]:
+            instrumentacao.incrementar("cache.grandes_demais")
+            return
+        _entradas[chave] = {"valor": guardado, "comprimido": comprimido, "bytes": tamanho, "tabelas": frozenset(tabelas), "criado": time.monotonic(), "ttl": ttl}
+        _memoria["bytes"] += tamanho
+        for tabela in tabelas:
+            _por_tabela[tabela].add(chave)
+        _despejar()
+
+def invalidar_tabelas(tabelas):
+    """Remove as entradas que leram alguma das tabelas; retorna quantas foram removidas."""
+    with _lock:
+        chaves = set().union(*(_por_tabela.get(t, set()) for t in tabelas)) if tabelas else set()
+        for chave in chaves:
+            _remover(chave)
+        if tabelas:
+            _geracoes["atual"] += 1
+            for tabela in tabelas:
+                _geracoes["por_tabela"][tabela] = _geracoes["atual"]
+    instrumentacao.incrementar("cache.invalidacoes", len(chaves))
+    if tabelas:
+        # Avisa mesmo sem entradas removidas aqui: os callbacks têm estado próprio (índices, datasets)
+        for callback in list(_ao_invalidar):
+            try:
+                callback(set(tabelas))
+            except Exception:
+                # Um callback com falha não derruba o canal de eventos nem impede os seguintes
+                instrumentacao.incrementar("cache.falhas_callback")
+    return len(chaves)
+
+def ao_invalidar(callback):
+    """Registra uma função chamada (com o conjunto de tabelas) sempre que entradas forem invalidadas."""
+    _ao_invalidar.append(callback)
+
+def limpar():
+    with _lock:
+        _entradas.clear()
+        _por_tabela.clear()
+        _memoria["bytes"] = 0
+
+def configurar(config=None):
+    """Ajusta orçamento e limiar de compressão (chaves de CONFIG_PADRAO), despejando se preciso."""
+    config = {**CONFIG_PADRAO, **(config or {})}
+    with _lock:
+        _memoria["orcamento"] = int(float(config["orcamento_mb"]) * 2**20)
+        _memoria["compressao_minima"] = int(float(config["compressao_minima_kb"]) * 2**10)
+        _despejar()
+
+def estatisticas():
+    """Tamanho atual do cache e contadores de acertos, faltas e despejos."""
+    contadores = instrumentacao.snapshot()["contadores"]
+    with _lock:
+        return {
+            "entradas": len(_entradas),
+            "comprimidas": sum(1 for e in _entradas.values() if e["comprimido"]),
+            "bytes": _memoria["bytes"],
+            "orcamento": _memoria["orcamento"],
+            **{nome: contadores.get(f"cache.{nome}", 0) for nome in ("hits", "misses", "despejos", "grandes_demais", "invalidacoes")},
+        }
+
+# --- Registro de uso ---
+def pontuacao_uso(uso, agora):
+    """Contagem do uso decaída até `agora` (mesma ordem do ranking do cache_warmer)."""
+    return uso["contagem"] * 0.5 ** ((agora - uso["ultimo"]) / MEIA_VIDA_USO)
+
+def _podar_usos(agora):
+    # Com o lock: volta a 90% do limite de uma vez, para não ordenar a cada chave nova
+    if len(_usos) <= LIMITE_USOS:
+        return
+    descartadas = sorted(_usos, key=lambda chave: pontuacao_uso(_usos[chave], agora))[:len(_usos) - int(LIMITE_USOS * 0.9)]
+    for chave in descartadas:
+        del _usos[chave]
+    instrumentacao.incrementar("cache.usos_descartados", len(descartadas))
+
+def registrar_uso(chave, func, argumentos):
+    """Conta o uso da chave (exceto durante o aquecimento) guardando como refazer a chamada."""
+    if getattr(_local, "aquecendo", False):
+        return
+    agora = time.time()
+    with _lock:
+        uso = _usos.get(chave)
+        contagem = pontuacao_uso(uso, agora) if uso else 0
+        _usos[chave] = {"contagem": contagem + 1, "ultimo": agora, "func": func, "argumentos": argumentos}
+        _podar_usos(agora)
+
+def restaurar_uso(func, argumentos, contagem, ultimo):
+    """Recoloca um uso gravado em disco (ver cache_warmer), sem sobrescrever usos desta execução."""
+    with _lock:
+        _usos.setdefault(func.chave_cache(argumentos), {"contagem": contagem, "ultimo": ultimo, "func": func, "argumentos": argumentos})
+        _podar_usos(time.time())
+
+def usos():
+    with _lock:
+        return {chave: dict(uso) for chave, uso in _usos.items()}
+
+def contem(chave):
+    with _lock:
+        entrada = _entradas.get(chave)
+        return entrada is not None and not _expirada(entrada, time.monotonic())
+
+def aquecendo(ativo):
+    """Marca a thread atual como aquecedora: suas chamadas não contam como uso."""
+    _local.aquecendo = ativo
+
+# --- Decorator ---
+def _resumir_codigo(codigo, resumo):
+    resumo.update(codigo.co_code)
+    resumo.update(repr(codigo.co_names).encode())  # co_code só guarda o índice do nome chamado
+    for constante in codigo.co_consts:
+        _resumir_constante(constante, resumo)
+
+def _resumir_constante(valor, resumo):
+    # Funções internas (lambdas, compreensões) entram pelo próprio código; o repr delas tem endereço.
+    # frozenset ordenado: a ordem de iteração de strings muda entre processos (PYTHONHASHSEED)
+    if inspect.iscode(valor):
+        _resumir_codigo(valor, resumo)
+    elif isinstance(valor, (tuple, frozenset)):
+        resumo.update(b"(" if isinstance(valor, tuple) else b"{")
+        for item in (valor if isinstance(valor, tuple) else sorted(valor, key=repr)):
+            _resumir_constante(item, resumo)
+        resumo.update(b")")
+    else:
+        resumo.update(repr(valor).encode() + b"\0")
+
+def identidade_funcao(func):
+    """
+    (arquivo, nome, resumo do código) de uma função: páginas são reexecutadas a cada rerun e
+    criam funções novas, então a identidade vem do código. O resumo cobre bytecode, nomes e
+    constantes (textos de SQL, números), inclusive de funções internas: editar um literal muda a chave.
+    """
+    codigo = func.__code__
+    resumo = hashlib.sha1()
+    _resumir_codigo(codigo, resumo)
+    return codigo.co_filename, func.__qualname__, resumo.hexdigest()
+
+def em_cache(ttl=TTL_PADRAO, aquecer=True):
+    """
+    Cache de processo para funções que consultam o banco (substitui st.cache_data).
+    Assim como no Streamlit, argumentos iniciados por "_" não entram na chave.
+    aquecer=False não registra o uso para o cache_warmer (ex.: argumentos grandes como DataFrames).
+    """
+    def decorator(func):
+        assinatura = inspect.signature(func)
+        prefixo = identidade_funcao(func)
+
+        def chave_cache(argumentos):
+            return prefixo + _congelar({k: v for k, v in argumentos.items() if not k.startswith("_")})
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            argumentos = assinatura.bind(*args, **kwargs)
+            argumentos.apply_defaults()
+            chave = chave_cache(argumentos.arguments)
+            if aquecer:
+                registrar_uso(chave, wrapper, dict(argumentos.arguments))
+            encontrado, valor = ler(chave)
+            if encontrado:
+                return valor
+            calculo = {"tabelas": set(), "falhou": False}
+            inicio = geracao()  # evento durante o cálculo: o resultado não é guardado
+            pilha = _calculos_em_andamento()
+            pilha.append(calculo)
+            try:
+                valor = func(*args, **kwargs)
+            finally:
+                pilha.pop()
+            registrar_leitura(calculo["tabelas"])
+            if calculo["falhou"]:
+                nao_cachear()
+            else:
+                gravar(chave, valor, calculo["tabelas"], ttl, desde=inicio)
+            return valor
+        wrapper.chave_cache = chave_cache
+        return wrapper
+    return decorator
+
+# --- Canal de eventos ---
+def canal_ativo():
+    return _canal["ativo"]
+
+def _ouvir(parametros_conexao):
+    espera = 1
+    while True:
+        try:
+            conn = connect(**parametros_conexao)
+            try:
+                with conn.event_collector(list(EVENTOS)) as coletor:
+                    # Eventos perdidos enquanto o canal esteve fora: descarta o que depende deles
+                    invalidar_tabelas(TABELAS_MONITORADAS)
+                    _canal.update(ativo=True, erro=None)
+                    espera = 1
+                    while True:
+                        ocorridos = coletor.wait(timeout=ESPERA_EVENTOS)
+                        if ocorridos:
+                            invalidar_tabelas({EVENTOS[nome] for nome, n in ocorridos.items() if n})
+                        else:
+                            conn.info.fetches  # mantém a conexão verificada; lança erro se caiu
+            finally:
+                conn.close()
+        except Exception as e:
+            _canal.update(ativo=False, erro=str(e))
+            instrumentacao.incrementar("cache.falhas_canal")
+            time.sleep(espera)
+            espera = min(espera * 2, 300)
+
+def iniciar_ouvinte(parametros_conexao):
+    """Inicia (uma vez por processo) a thread que escuta os eventos das triggers."""
+    with _lock:
+        if _canal["thread"] is not None:
+            return
+        _canal["thread"] = threading.Thread(target=_ouvir, args=(parametros_conexao,), name="query_cache-eventos", daemon=True)
+    _canal["thread"].start()
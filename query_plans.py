@@ -0,0 +1,196 @@
+"""
+Captura dos planos de execução (Firebird) de todas as formas de query emitidas pelo app.
+
+1. As páginas são executadas headless contra o banco de benchmark, variando os filtros;
+   cada query normalizada é registrada por db_utils.run_query. Os armazenamentos entre processos
+   (datasets em /dev/shm e pickles incrementais) são ignorados para que toda query seja executada.
+2. Cada forma é preparada para obter o PLAN e executada com os parâmetros de exemplo para
+   medir o custo (tempo, fetches, leituras de página e leituras sequenciais x indexadas por tabela).
+3. `baseline` grava o resultado; `check` compara com o baseline e falha (exit 1) quando uma forma
+   passa a fazer NATURAL scan em tabela grande ou quando o plano muda.
+
+Uso:
+    python query_plans.py baseline --secrets .streamlit/secrets_benchmark.toml
+    python query_plans.py check --secrets .streamlit/secrets_benchmark.toml
+    python query_plans.py report --secrets .streamlit/secrets_benchmark.toml
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import date
+
+from firebird.driver import connect
+
+import datasets_compartilhados
+import db_utils
+import headless
+from load_test import CENARIOS
+
+ARQUIVO_BASELINE = "query_plans_baseline.json"
+TABELAS_GRANDES = {"CONTAS_FINANCEIRA", "VENDAS", "LANCAMENTOS_BANCARIO", "CONTRATOS", "CONTRATOS_EQUIPAMENTO"}
+BOTOES_POR_PAGINA = {"Automacoes": ["Gerar Dados de Contas a Receber", "Gerar Dados de Contas a Pagar"]}
+
+# --- Coleta das formas de query ---
+def coletar_formas(secrets, variacoes=2, seed=0):
+    """Executa cada página com os filtros padrão e variações de cada filtro; retorna {sql: params}."""
+    r, hoje = random.Random(seed), date.today()
+    # Um dataset anexado do /dev/shm ou uma série lida do pickle não passa por run_query
+    os.environ[datasets_compartilhados.VARIAVEL_SEM_ARMAZENAMENTO] = "1"
+    for pagina in headless.PAGINAS:
+        at = headless.nova_sessao(pagina, secrets)
+        at.run()
+        for label, gerar in CENARIOS.get(pagina, {}).items():
+            for _ in range(variacoes):
+                headless.aplicar_filtros(at, {label: gerar(r, hoje)})
+                at.run()
+        for botao in BOTOES_POR_PAGINA.get(pagina, []):
+            headless.clicar(at, botao)
+    return db_utils.formas_registradas()
+
+# --- Planos e custos ---
+def conectar(secrets):
+    db = secrets["database"]
+    return connect(database=f"{db['host']}:{db['path']}", user=db["user"], password=db["password"], charset=db["charset"])
+
+def id_forma(sql):
+    return hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+def mapa_aliases(sql):
+    """{ALIAS: TABELA} a partir das cláusulas FROM/JOIN (tabela sem alias mapeia para si mesma)."""
+    mapa = {}
+    for tabela, alias in re.findall(r"\b(?:FROM|JOIN)\s+([A-Z_][A-Z0-9_$]*)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|INNER\b|GROUP\b|ORDER\b)([A-Z_][A-Z0-9_$]*))?", sql.upper()):
+        mapa[tabela] = tabela
+        if alias:
+            mapa[alias] = tabela
+    return mapa
+
+def varreduras_naturais(plano, sql):
+    """Tabelas lidas por NATURAL scan (varredura completa) segundo o plano."""
+    aliases = mapa_aliases(sql)
+    return sorted({aliases.get(alias, alias) for alias in re.findall(r"([A-Z_][A-Z0-9_$]*)\s+NATURAL", plano.upper())})
+
+def capturar_plano(conn, sql):
+    cur = conn.cursor()
+    try:
+        return cur.prepare(sql).plan.strip()
+    finally:
+        cur.close()
+
+def nomes_de_tabela(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT RDB$RELATION_ID, TRIM(RDB$RELATION_NAME) FROM RDB$RELATIONS")
+    nomes = dict(cur.fetchall())
+    cur.close()
+    return nomes
+
+def _leituras_por_tabela(conn, nomes):
+    return {nomes.get(s.table_id, str(s.table_id)): (s.sequential or 0, s.indexed or 0) for s in conn.info.get_table_access_stats()}
+
+def medir_custo(conn, sql, params, nomes):
+    """Executa a forma com os parâmetros de exemplo e mede o custo no banco de benchmark."""
+    info = conn.info
+    fetches, leituras, tabelas = info.fetches, info.reads, _leituras_por_tabela(conn, nomes)
+    cur = conn.cursor()
+    inicio = time.perf_counter()
+    cur.execute(sql, list(params))
+    linhas = len(cur.fetchall())
+    tempo = time.perf_counter() - inicio
+    cur.close()
+    conn.commit()
+    depois = _leituras_por_tabela(conn, nomes)
+    por_tabela = {}
+    for tabela, (seq, idx) in depois.items():
+        seq0, idx0 = tabelas.get(tabela, (0, 0))
+        if seq - seq0 or idx - idx0:
+            por_tabela[tabela] = {"sequenciais": seq - seq0, "indexadas": idx - idx0}
+    return {"tempo_s": round(tempo, 4), "linhas": linhas, "fetches": info.fetches - fetches, "leituras_pagina": info.reads - leituras, "tabelas": por_tabela}
+
+def capturar(secrets, formas, medir=True):
+    conn = conectar(secrets)
+    nomes = nomes_de_tabela(conn) if medir else {}
+    resultado = {}
+    try:
+        for sql, params in sorted(formas.items()):
+            entrada = {"sql": sql}
+            try:
+                entrada["plano"] = capturar_plano(conn, sql)
+                entrada["naturais"] = varreduras_naturais(entrada["plano"], sql)
+                if medir:
+                    entrada["custo"] = medir_custo(conn, sql, params, nomes)
+            except Exception as e:
+                entrada["erro"] = str(e)
+            resultado[id_forma(sql)] = entrada
+    finally:
+        conn.close()
+    return resultado
+
+# --- Comparação com o baseline ---
+def comparar(atual, baseline, tabelas_grandes=TABELAS_GRANDES):
+    """Retorna (falhas, avisos) comparando a captura atual com o baseline."""
+    falhas, avisos = [], []
+    for chave, entrada in atual.items():
+        if "erro" in entrada:
+            falhas.append(f"[{chave}] erro ao preparar: {entrada['erro']}")
+            continue
+        grandes = set(entrada["naturais"]) & tabelas_grandes
+        anterior = baseline.get(chave)
+        if anterior is None:
+            if grandes:
+                falhas.append(f"[{chave}] forma nova com NATURAL em {', '.join(sorted(grandes))}")
+            else:
+                avisos.append(f"[{chave}] forma nova (sem baseline)")
+            continue
+        novas = grandes - set(anterior.get("naturais", []))
+        if novas:
+            falhas.append(f"[{chave}] regrediu para NATURAL em {', '.join(sorted(novas))}")
+        elif entrada["plano"] != anterior.get("plano"):
+            falhas.append(f"[{chave}] plano mudou:\n    antes:  {anterior.get('plano')}\n    depois: {entrada['plano']}")
+    for chave in baseline.keys() - atual.keys():
+        avisos.append(f"[{chave}] forma do baseline não foi emitida nesta captura")
+    return falhas, avisos
+
+def imprimir_custos(captura, tabelas_grandes=TABELAS_GRANDES):
+    print(f"{'forma':<14}{'tempo (s)':>10}{'linhas':>9}{'fetches':>11}{'leituras':>10}  NATURAL em tabela grande")
+    for chave, entrada in sorted(captura.items(), key=lambda kv: -kv[1].get("custo", {}).get("tempo_s", 0)):
+        custo = entrada.get("custo", {})
+        grandes = ", ".join(sorted(set(entrada.get("naturais", [])) & tabelas_grandes)) or "-"
+        print(f"{chave:<14}{custo.get('tempo_s', 0):>10.3f}{custo.get('linhas', 0):>9}{custo.get('fetches', 0):>11}{custo.get('leituras_pagina', 0):>10}  {grandes}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Captura de planos e detecção de regressões para NATURAL scan.")
+    parser.add_argument("acao", choices=["baseline", "check", "report"])
+    parser.add_argument("--secrets", required=True, help="secrets.toml apontando para o banco de benchmark")
+    parser.add_argument("--baseline", default=ARQUIVO_BASELINE)
+    parser.add_argument("--tabelas-grandes", nargs="+", default=sorted(TABELAS_GRANDES))
+    parser.add_argument("--variacoes", type=int, default=2, help="valores sorteados por filtro na coleta")
+    parser.add_argument("--sem-custo", action="store_true", help="apenas prepara as queries, sem executá-las")
+    args = parser.parse_args()
+
+    secrets = headless.carregar_secrets(args.secrets)
+    tabelas_grandes = {t.upper() for t in args.tabelas_grandes}
+    captura = capturar(secrets, coletar_formas(secrets, args.variacoes), medir=not args.sem_custo)
+
+    if args.acao == "baseline":
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(captura, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Baseline gravado em {args.baseline} ({len(captura)} formas).")
+    if args.acao in ("baseline", "report") and not args.sem_custo:
+        imprimir_custos(captura, tabelas_grandes)
+    if args.acao == "check":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        falhas, avisos = comparar(captura, baseline, tabelas_grandes)
+        for aviso in avisos:
+            print(f"AVISO {aviso}")
+        for falha in falhas:
+            print(f"FALHA {falha}")
+        print(f"{len(captura)} formas verificadas, {len(falhas)} falha(s).")
+        sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Série diária de saldo por conta corrente (IDCONTA_CORRENTE), mantida incrementalmente.
+
+O movimento líquido diário de LANCAMENTOS_BANCARIO (entradas - saídas) por conta fica guardado
+em disco. Cada atualização busca só os dias a partir do último processado (menos uma margem
+para lançamentos retroativos); uma reconstrução completa é feita periodicamente. O saldo de um
+dia é ancorado no saldo atual de CONTAS_CORRENTE:
+
+    saldo(d) = saldo_atual - soma dos movimentos depois de d
+
+então o saldo em qualquer data passada sai da série sem varrer os lançamentos de novo.
+"""
+import os
+import pickle
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import datasets_compartilhados
+import query_cache
+from constantes import DIRETORIO_CACHE
+from db_utils import run_query
+
+ARQUIVO = os.path.join(DIRETORIO_CACHE, "saldo_diario.pkl")
+MARGEM_DIAS = 7                     # lançamentos retroativos dentro da margem são recapturados
+INTERVALO_ATUALIZACAO = 3600        # segundos entre atualizações incrementais
+INTERVALO_RECONSTRUCAO = 7 * 86400  # reconstrução completa (alterações fora da margem)
+
+QUERY_MOVIMENTOS = """
+SELECT lb.IDCONTA_CORRENTE, CAST(lb.DATA_OPERACAO AS DATE) AS DATA,
+       SUM(CASE WHEN lb.TIPO_LANCAMENTO = 'E' THEN lb.VALOR_LANCAMENTO
+                WHEN lb.TIPO_LANCAMENTO = 'S' THEN -lb.VALOR_LANCAMENTO ELSE 0 END) AS MOVIMENTO
+FROM LANCAMENTOS_BANCARIO lb
+WHERE lb.DATA_OPERACAO >= ?
+GROUP BY lb.IDCONTA_CORRENTE, CAST(lb.DATA_OPERACAO AS DATE)
+"""
+
+_lock = threading.Lock()
+_estado = {"movimentos": None, "atualizado": 0.0, "reconstruido": 0.0, "sujo": False}
+
+def _marcar_sujo(tabelas):
+    if "LANCAMENTOS_BANCARIO" in tabelas:
+        _estado["sujo"] = True
+
+# Um evento do banco em LANCAMENTOS_BANCARIO antecipa a próxima atualização incremental
+query_cache.ao_invalidar(_marcar_sujo)
+
+# --- Armazenamento ---
+def _carregar():
+    if _estado["movimentos"] is None:
+        try:
+            if datasets_compartilhados.armazenamento_ignorado():
+                raise FileNotFoundError(ARQUIVO)  # começa vazio: a primeira atualização é completa
+            salvo = pd.read_pickle(ARQUIVO)
+            _estado.update(movimentos=salvo["movimentos"], atualizado=salvo["atualizado"], reconstruido=salvo["reconstruido"])
+        except (OSError, KeyError, ValueError, TypeError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            # Arquivo truncado, corrompido ou gravado por outra versão do pandas: reconstrução completa
+            _estado["movimentos"] = pd.DataFrame({"IDCONTA_CORRENTE": pd.Series(dtype="int64"), "DATA": pd.Series(dtype="datetime64[ns]"), "MOVIMENTO": pd.Series(dtype="float64")})
+    return _estado["movimentos"]
+
+def _salvar():
+    if datasets_compartilhados.armazenamento_ignorado():
+        return  # ex.: query_plans.py contra o banco de benchmark não sobrescreve a série do app
+    try:
+        os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+        pd.to_pickle({k: _estado[k] for k in ("movimentos", "atualizado", "reconstruido")}, ARQUIVO + ".tmp")
+        os.replace(ARQUIVO + ".tmp", ARQUIVO)
+    except OSError:
+        pass
+
+def atualizar(conn, completo=False):
+    """Traz os movimentos novos (ou todos, se `completo`) e atualiza a série em disco."""
+    with _lock:
+        movimentos = _carregar()
+        agora = time.time()
+        completo = completo or movimentos.empty or agora - _estado["reconstruido"] > INTERVALO_RECONSTRUCAO
+        desde = date(1900, 1, 1) if completo else (movimentos["DATA"].max() - pd.Timedelta(days=MARGEM_DIAS)).date()
+        novos = run_query(conn, QUERY_MOVIMENTOS, params=[desde], formato="arrow")
+        novos["DATA"] = pd.to_datetime(novos["DATA"])
+        novos["MOVIMENTO"] = novos["MOVIMENTO"].astype("float64")
+        mantidos = movimentos[movimentos["DATA"] < pd.Timestamp(desde)] if not completo else movimentos.iloc[0:0]
+        _estado["movimentos"] = pd.concat([mantidos, novos], ignore_index=True).sort_values(["IDCONTA_CORRENTE", "DATA"], ignore_index=True)
+        _estado.update(atualizado=agora, sujo=False)
+        if completo:
+            _estado["reconstruido"] = agora
+        _salvar()
+        return len(novos)
+
+def garantir_atualizado(conn):
+    if _estado["sujo"] or time.time() - _estado["atualizado"] > INTERVALO_ATUALIZACAO or _estado["movimentos"] is None:
+        atualizar(conn)
+
+# --- Consultas ---
+def serie_saldo(conn, saldos_atuais, inicio, fim):
+    """
+    Saldo ao fim de cada dia de [inicio, fim] somando as contas de `saldos_atuais`
+    ({IDCONTA_CORRENTE: saldo atual}). Retorna DataFrame com DATA e SALDO.
+    """
+    garantir_atualizado(conn)
+    movimentos = _carregar()
+    movimentos = movimentos[movimentos["IDCONTA_CORRENTE"].isin(list(saldos_atuais))]
+    dias = pd.date_range(inicio, fim, freq="D")
+    if not len(dias):
+        return pd.DataFrame({"DATA": dias, "SALDO": pd.Series(dtype="float64")})
+    # Movimento líquido por dia (todas as contas) e movimento posterior ao fim da janela
+    por_dia = movimentos.groupby("DATA")["MOVIMENTO"].sum()
+    depois_do_fim = por_dia[por_dia.index > dias[-1]].sum()
+    na_janela = por_dia.reindex(dias, fill_value=0.0).to_numpy()
+    # saldo(d) = saldo_atual - movimentos posteriores a d (soma acumulada reversa)
+    posteriores = np.concatenate([np.cumsum(na_janela[::-1])[::-1][1:], [0.0]]) + depois_do_fim
+    saldo_atual = float(sum(float(v) for v in saldos_atuais.values()))
+    return pd.DataFrame({"DATA": dias, "SALDO": saldo_atual - posteriores})
+
+def saldo_em(conn, saldos_atuais, dia):
+    """Saldo ao fim de `dia` para as contas informadas."""
+    return float(serie_saldo(conn, saldos_atuais, dia, dia)["SALDO"].iloc[0])
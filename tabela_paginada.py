@@ -0,0 +1,177 @@
+"""
+Tabelas detalhadas paginadas: só a página atual é enviada ao navegador.
+
+- `tabela_paginada`: paginação por keyset no banco (ORDER BY coluna, id + WHERE a partir da
+  última linha vista), com ordenação e filtro de texto executados no SQL, contagem total em
+  query separada e pré-busca da próxima página em segundo plano.
+- `tabela_paginada_df`: mesma interface para DataFrames que a página já precisa ter inteiros
+  (ex.: base da inadimplência usada nos KPIs), paginando no servidor do Streamlit.
+
+As duas rodam em st.fragment: trocar de página, ordenação ou filtro reexecuta só a tabela.
+Com `detalhe`, clicar numa linha chama `detalhe(linha)` abaixo da tabela (ex.: perfil do cliente,
+perfil_clientes.exibir); colunas com column_config None (ex.: IDs) ficam ocultas e fora da ordenação.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+import query_cache
+from db_utils import fetch_data, run_query
+
+TAMANHOS_PAGINA = [50, 100, 250]
+DIRECOES = {"Crescente": "ASC", "Decrescente": "DESC"}
+_prebusca = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tabela_paginada")
+
+@query_cache.em_cache()
+def _pagina(_conn, query, params):
+    return run_query(_conn, query, params=list(params))
+
+def _valor_python(valor):
+    """Escalares numpy viram tipos Python, aceitos como parâmetro pelo driver."""
+    return valor.item() if hasattr(valor, "item") and not isinstance(valor, pd.Timestamp) else valor
+
+# --- Estado da paginação (por tabela, na sessão) ---
+def _estado(chave, assinatura):
+    """Cursores de início de cada página já visitada; zera quando ordenação/filtro/base mudam."""
+    estado = st.session_state.get(f"{chave}_paginacao")
+    if estado is None or estado["assinatura"] != assinatura:
+        estado = {"assinatura": assinatura, "cursores": [None], "proximo": None}
+        st.session_state[f"{chave}_paginacao"] = estado
+    return estado
+
+def _avancar(estado):
+    if estado["proximo"] is not None:
+        estado["cursores"].append(estado["proximo"])
+
+def _voltar(estado):
+    if len(estado["cursores"]) > 1:
+        estado["cursores"].pop()
+
+def _ordenaveis(colunas, column_config):
+    """Colunas exibidas (as ocultas com column_config None só servem ao detalhamento)."""
+    return [c for c in colunas if (column_config or {}).get(c, "") is not None]
+
+def _selecao(chave, estado, detalhe):
+    """Argumentos do st.dataframe para selecionar uma linha; a chave muda com a página (zera a seleção)."""
+    if detalhe is None:
+        return {}
+    return {"on_select": "rerun", "selection_mode": "single-row", "key": f"{chave}_selecao_{len(estado['cursores'])}"}
+
+def _detalhar(evento, pagina, detalhe):
+    linhas = evento.selection.rows if detalhe is not None else []
+    if linhas and linhas[0] < len(pagina):
+        detalhe(pagina.iloc[linhas[0]])
+
+def _controles(chave, colunas_ordenacao, ordenacao_padrao, rotulo_filtro):
+    col_filtro, col_ordem, col_direcao, col_tamanho = st.columns([3, 2, 2, 1])
+    filtro = col_filtro.text_input(rotulo_filtro, key=f"{chave}_filtro") if rotulo_filtro else ""
+    ordem = col_ordem.selectbox("Ordenar por", colunas_ordenacao, index=colunas_ordenacao.index(ordenacao_padrao), key=f"{chave}_ordem")
+    direcao = col_direcao.selectbox("Direção", list(DIRECOES), key=f"{chave}_direcao")
+    tamanho = col_tamanho.selectbox("Linhas", TAMANHOS_PAGINA, index=1, key=f"{chave}_tamanho")
+    return filtro.strip(), ordem, DIRECOES[direcao], tamanho
+
+def _navegacao(chave, estado, total, tamanho):
+    paginas = max(1, -(-total // tamanho))
+    col_anterior, col_info, col_proxima = st.columns([1, 3, 1])
+    col_anterior.button("◀ Anterior", key=f"{chave}_anterior", on_click=_voltar, args=(estado,), disabled=len(estado["cursores"]) == 1)
+    col_info.caption(f"Página {len(estado['cursores'])} de {paginas} · {total} registro(s)")
+    col_proxima.button("Próxima ▶", key=f"{chave}_proxima", on_click=_avancar, args=(estado,), disabled=estado["proximo"] is None)
+
+# --- Paginação no banco (keyset) ---
+def _condicao_cursor(ordem_expr, id_coluna, direcao, cursor):
+    """Linhas depois do cursor (valor da ordenação, id da última linha vista); retorna (condição, parâmetros)."""
+    comparador = ">" if direcao == "ASC" else "<"
+    return f"({ordem_expr} {comparador} ? OR ({ordem_expr} = ? AND {id_coluna} {comparador} ?))", [cursor[0], cursor[0], cursor[1]]
+
+def _sql_pagina(colunas, origem, id_coluna, ordem_expr, direcao, condicoes, tamanho):
+    selecao = ", ".join(f"{expr} AS {alias}" for alias, expr in colunas.items())
+    where = "".join(f" AND {c}" for c in condicoes)
+    return f"SELECT {selecao}, {id_coluna} AS ID_LINHA {origem}{where} ORDER BY {ordem_expr} {direcao}, {id_coluna} {direcao} ROWS {tamanho}"
+
+def tabela_paginada(chave, conn, colunas, origem, params, id_coluna, ordenacao_padrao, coluna_filtro=None, rotulo_filtro="Filtrar", column_config=None, detalhe=None):
+    """
+    Tabela paginada por keyset direto no banco.
+
+    colunas: {alias exibido: expressão SQL}; as colunas ordenáveis não podem ser nulas (o keyset
+    compara com = e >, que não casam NULL): use COALESCE nas que aceitam nulo.
+    origem: trecho "FROM ... WHERE ..." (com WHERE) cujos placeholders recebem `params`.
+    id_coluna: coluna única usada como desempate do keyset (ex.: a chave primária).
+    coluna_filtro: alias da coluna usada no filtro de texto (CONTAINING, sem diferenciar maiúsculas).
+    detalhe: função chamada com a linha selecionada (Series, colunas em minúsculas).
+    """
+    @st.fragment
+    def _tabela():
+        filtro, ordem, direcao, tamanho = _controles(chave, _ordenaveis(colunas, column_config), ordenacao_padrao, rotulo_filtro if coluna_filtro else None)
+        condicoes, params_filtro = [], []
+        if filtro:
+            condicoes.append(f"{colunas[coluna_filtro]} CONTAINING ?")
+            params_filtro.append(filtro)
+        estado = _estado(chave, (origem, tuple(params), filtro, ordem, direcao, tamanho))
+
+        df_total = fetch_data(conn, f"SELECT COUNT(*) AS TOTAL {origem}" + "".join(f" AND {c}" for c in condicoes), list(params) + params_filtro)
+        total = int(df_total.iloc[0, 0]) if not df_total.empty else 0
+
+        def consulta(cursor):
+            cond, prm = list(condicoes), list(params) + params_filtro
+            if cursor is not None:
+                condicao, params_cursor = _condicao_cursor(colunas[ordem], id_coluna, direcao, cursor)
+                cond.append(condicao)
+                prm += params_cursor
+            return _sql_pagina(colunas, origem, id_coluna, colunas[ordem], direcao, cond, tamanho), tuple(prm)
+
+        sql, prm = consulta(estado["cursores"][-1])
+        try:
+            df = _pagina(conn, sql, prm) if conn is not None else pd.DataFrame()
+        except Exception as e:
+            st.error(f"Erro ao executar a query: {e}")
+            st.code(sql, language="sql")
+            df = pd.DataFrame()
+        df = df.rename(columns=str.lower)
+
+        estado["proximo"] = None
+        if len(df) == tamanho:
+            ultima = df.iloc[-1]
+            estado["proximo"] = (_valor_python(ultima[ordem.lower()]), _valor_python(ultima["id_linha"]))
+            # Pré-busca: a próxima página já estará no cache quando o usuário clicar
+            _prebusca.submit(_prebuscar, conn, *consulta(estado["proximo"]))
+
+        df = df.drop(columns="id_linha", errors="ignore")
+        evento = st.dataframe(df, use_container_width=True, hide_index=True, column_config=column_config, **_selecao(chave, estado, detalhe))
+        _navegacao(chave, estado, total, tamanho)
+        _detalhar(evento, df, detalhe)
+    _tabela()
+
+def _prebuscar(conn, sql, params):
+    query_cache.aquecendo(True)
+    try:
+        _pagina(conn, sql, params)
+    except Exception:
+        pass  # a busca normal exibirá o erro se o usuário avançar
+    finally:
+        query_cache.aquecendo(False)
+
+# --- Paginação de DataFrame já carregado ---
+def _conteudo(df):
+    """Assinatura do conteúdo: outra base com o mesmo número de linhas também volta à página 1."""
+    return tuple(df.columns), len(df), int(pd.util.hash_pandas_object(df, index=False).sum())
+
+def tabela_paginada_df(chave, df, ordenacao_padrao, coluna_filtro=None, rotulo_filtro="Filtrar", direcao_padrao="ASC", column_config=None, detalhe=None):
+    """Mesma tabela para um DataFrame em memória: ordena, filtra e fatia no servidor."""
+    @st.fragment
+    def _tabela():
+        if direcao_padrao == "DESC" and f"{chave}_direcao" not in st.session_state:
+            st.session_state[f"{chave}_direcao"] = "Decrescente"
+        filtro, ordem, direcao, tamanho = _controles(chave, _ordenaveis(df.columns, column_config), ordenacao_padrao, rotulo_filtro if coluna_filtro else None)
+        dados = df
+        if filtro:
+            dados = dados[dados[coluna_filtro].astype(str).str.contains(filtro, case=False, regex=False)]
+        dados = dados.sort_values(ordem, ascending=direcao == "ASC", kind="stable")
+        estado = _estado(chave, (_conteudo(df), filtro, ordem, direcao, tamanho))
+        inicio = (len(estado["cursores"]) - 1) * tamanho
+        estado["proximo"] = inicio + tamanho if inicio + tamanho < len(dados) else None
+        pagina = dados.iloc[inicio:inicio + tamanho]
+        evento = st.dataframe(pagina, use_container_width=True, hide_index=True, column_config=column_config, **_selecao(chave, estado, detalhe))
+        _navegacao(chave, estado, len(dados), tamanho)
+        _detalhar(evento, pagina, detalhe)
+    _tabela()
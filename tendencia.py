@@ -0,0 +1,77 @@
+"""
+Modo tendência da Visão Geral: séries mensais de vários anos (faturamento, clientes, equipamentos e
+contratos ativos) numa janela de N meses terminada no último mês fechado.
+
+Ver cinco anos pela análise anual exigia navegar ano a ano, refazendo as buscas de cada par (ano,
+ano anterior). Aqui cada série sai de uma passada vetorizada sobre as bases de metricas.py, que já
+estão em memória:
+
+- faturamento: a base agrupada por ANO × MES, reindexada nos meses da janela;
+- contratos e clientes ativos: contagem acumulada das datas de início ordenadas (np.searchsorted
+  nos fins de mês), clientes pela primeira data de início de cada IDPESSOA;
+- equipamentos ativos: iniciados até o fim do mês menos retirados até ele, pela mesma busca.
+
+Sobre as séries: soma móvel de 12 meses do faturamento e variação anual (mês contra o mesmo mês do
+ano anterior) de todas. O custo cresce com os meses da janela, não com os anos comparados.
+"""
+import numpy as np
+import pandas as pd
+
+import metricas
+import query_cache
+
+HISTORICO_EXTRA = 23  # meses antes da janela: 11 para a soma móvel e 12 para a variação anual dela
+SERIES = {
+    "FATURAMENTO": "Faturamento",
+    "CLIENTES_ATIVOS": "Clientes Ativos",
+    "EQUIPAMENTOS_ATIVOS": "Equipamentos Ativos",
+    "CONTRATOS_ATIVOS": "Contratos Ativos",
+}
+
+def _fins_de_mes(ano, mes, meses):
+    return pd.date_range(end=pd.Timestamp(ano, mes, 1) + pd.offsets.MonthEnd(0), periods=meses, freq="ME")
+
+def _acumulado(datas, fins):
+    """Quantas `datas` (NaT = nunca) caem até cada fim de mês: uma ordenação e uma busca binária por mês."""
+    valores = np.sort(datas.dropna().to_numpy(dtype="datetime64[ns]"))
+    return np.searchsorted(valores, fins.to_numpy(dtype="datetime64[ns]"), side="right")
+
+def _variacao_anual(serie):
+    anterior = serie.shift(12)
+    return (serie - anterior) / anterior.where(anterior != 0) * 100
+
+@query_cache.em_cache(ttl=3600)
+def series(_conn, ano, mes, meses, empresas, situacoes, ids_produto):
+    """
+    Uma linha por mês da janela de `meses` terminada em (ano, mes): PERIODO (fim do mês), as
+    colunas de SERIES, FATURAMENTO_12M (soma móvel) e <coluna>_VAR_ANUAL (%, NaN sem base).
+    Mesmos critérios da análise anual: faturamento de contratos, ativos acumulados por início.
+    """
+    fins = _fins_de_mes(ano, mes, meses + HISTORICO_EXTRA)
+    chaves = (fins.year * 12 + fins.month).astype("int64")
+
+    faturamento = metricas.fatiar(
+        _conn, "faturamento", empresas,
+        filtros={"COM_CONTRATO": 1, "SITUACAO": situacoes or None, "ANO": sorted(set(fins.year))}, por=["ANO", "MES"],
+    )
+    chave_faturamento = faturamento["ANO"].astype("int64") * 12 + faturamento["MES"].astype("int64")
+    valores = pd.Series(faturamento["VALOR"].to_numpy(), index=chave_faturamento).reindex(chaves, fill_value=0.0)
+
+    filtro_contratos, filtro_equipamentos = metricas.filtros_ativos(_conn, situacoes, ids_produto)
+    contratos = metricas.fatiar(_conn, "contratos", empresas, filtros=filtro_contratos)
+    equipamentos = metricas.fatiar(_conn, "equipamentos", empresas, filtros=filtro_equipamentos)
+    inicio, retirada = equipamentos["DATA_INICIO"], equipamentos["DATA_RETIRADA"]
+    # Retirada anterior ao início conta no início (nunca ativo); sem início, o equipamento nunca entra
+    retirada = retirada.where(retirada.isna() | (retirada >= inicio), inicio)
+
+    df = pd.DataFrame({
+        "PERIODO": fins,
+        "FATURAMENTO": valores.to_numpy(dtype="float64"),
+        "CLIENTES_ATIVOS": _acumulado(contratos.groupby("IDPESSOA")["DATA_INICIO"].min(), fins),
+        "EQUIPAMENTOS_ATIVOS": _acumulado(inicio, fins) - _acumulado(retirada, fins),
+        "CONTRATOS_ATIVOS": _acumulado(contratos["DATA_INICIO"], fins),
+    })
+    df["FATURAMENTO_12M"] = df["FATURAMENTO"].rolling(12).sum()
+    for coluna in [*SERIES, "FATURAMENTO_12M"]:
+        df[f"{coluna}_VAR_ANUAL"] = _variacao_anual(df[coluna])
+    return df.iloc[HISTORICO_EXTRA:].reset_index(drop=True)
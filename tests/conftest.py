@@ -0,0 +1,132 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Os módulos do app ficam na raiz (sem pacote), como as páginas os importam
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+import query_cache  # noqa: E402
+
+
+class Relogio:
+    """Substitui o módulo time do query_cache: o teste avança o tempo com `avancar`."""
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def time(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo():
+    """Cada teste começa com o cache vazio e sem canal de eventos."""
+    query_cache.limpar()
+    query_cache._usos.clear()
+    ativo = query_cache._canal["ativo"]
+    query_cache._canal["ativo"] = False
+    yield
+    query_cache._canal["ativo"] = ativo
+    query_cache.limpar()
+    query_cache._usos.clear()
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(query_cache, "time", relogio)
+    return relogio
+
+
+# --- Banco falso para db_utils (pool, vigia e single-flight sem Firebird) ---
+class CursorFalso:
+    description = [("VALOR", int, None, None, None, 0, True)]
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+
+    def execute(self, sql, params=None):
+        banco = self.conexao.banco
+        banco.executadas.append(sql)
+        if "LENTA" in sql:
+            # Bloqueia até o teste liberar ou o vigia cancelar a operação da conexão
+            banco.em_execucao.release()
+            limite = time.monotonic() + 10
+            while not (banco.liberar.is_set() or self.conexao.cancelada.is_set()) and time.monotonic() < limite:
+                time.sleep(0.01)
+        if self.conexao.cancelada.is_set():
+            self.conexao.cancelada.clear()
+            raise RuntimeError("operação cancelada")
+        if "FALHA" in sql:
+            raise RuntimeError("erro do banco")
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def __init__(self, banco):
+        self.banco = banco
+        self.cancelada = threading.Event()
+        self._att = self
+
+    def cancel_operation(self, tipo):
+        self.cancelada.set()
+
+    def set_statement_timeout(self, milissegundos):
+        pass
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BancoFalso:
+    """Queries com "LENTA" no texto ficam em execução até `liberar` ou até o vigia cancelar."""
+    def __init__(self):
+        self.executadas = []
+        self.liberar = threading.Event()
+        self.em_execucao = threading.Semaphore(0)
+        self.sessoes = threading.local()
+
+    def entrar_na_sessao(self, requisicoes):
+        """A thread atual passa a executar como a sessão dona de `requisicoes`."""
+        self.sessoes.requisicoes = requisicoes
+
+    def esperar_execucoes(self, quantidade, timeout=5):
+        for _ in range(quantidade):
+            assert self.em_execucao.acquire(timeout=timeout), "query lenta não começou"
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    import db_utils
+
+    banco = BancoFalso()
+    monkeypatch.setattr(db_utils, "connect", lambda **parametros: ConexaoFalsa(banco))
+    monkeypatch.setattr(db_utils, "_pools", {})
+    monkeypatch.setattr(db_utils, "_vigia", {"thread": None, "timeout": 30})
+    monkeypatch.setattr(db_utils, "_em_execucao", {})
+    monkeypatch.setattr(db_utils, "_em_voo", {})
+    monkeypatch.setattr(db_utils, "_requisicoes_da_sessao", lambda: getattr(banco.sessoes, "requisicoes", None))
+    db_utils.configurar_pool({}, None, tamanho=4)
+    yield banco
+    banco.liberar.set()
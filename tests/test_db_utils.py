@@ -0,0 +1,166 @@
+import threading
+
+import pytest
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData, ScriptRequests
+
+import db_utils
+
+# O banco falso não é uma conexão do driver: a leitura "pandas" passa pelo pd.read_sql genérico
+pytestmark = pytest.mark.filterwarnings("ignore:pandas only supports SQLAlchemy")
+
+
+def em_thread(funcao, *args):
+    """Roda `funcao` numa thread; o dicionário devolvido recebe "resultado" ou "erro"."""
+    saida = {}
+
+    def rodar():
+        try:
+            saida["resultado"] = funcao(*args)
+        except Exception as e:
+            saida["erro"] = e
+
+    saida["thread"] = threading.Thread(target=rodar, daemon=True)
+    saida["thread"].start()
+    return saida
+
+
+def consultar_na_sessao(banco, requisicoes, query):
+    banco.entrar_na_sessao(requisicoes)
+    return db_utils.run_query(None, query)
+
+
+# --- Vigia de cancelamento ---
+def test_query_de_fundo_nao_derruba_o_vigia(banco):
+    requisicoes = ScriptRequests()
+    fundo = em_thread(db_utils.run_query, None, "SELECT LENTA_FUNDO FROM RDB$DATABASE")
+    sessao = em_thread(consultar_na_sessao, banco, requisicoes, "SELECT LENTA_SESSAO FROM RDB$DATABASE")
+    banco.esperar_execucoes(2)
+
+    requisicoes.request_stop()
+    sessao["thread"].join(5)
+    assert isinstance(sessao.get("erro"), db_utils.QueryCancelada)
+    assert sessao["erro"].motivo == "superada"
+    assert db_utils._vigia["thread"].is_alive()
+
+    # A de fundo só para pelo limite de tempo: segue até terminar
+    assert fundo["thread"].is_alive()
+    banco.liberar.set()
+    fundo["thread"].join(5)
+    assert "erro" not in fundo
+    assert fundo["resultado"]["VALOR"].tolist() == [1]
+
+
+def test_interessado_de_fundo_mantem_a_query_da_sessao(banco):
+    requisicoes = ScriptRequests()
+    query = "SELECT LENTA FROM RDB$DATABASE"
+    sessao = em_thread(consultar_na_sessao, banco, requisicoes, query)
+    banco.esperar_execucoes(1)
+    fundo = em_thread(db_utils.run_query, None, query)  # coalescida com a da sessão
+
+    requisicoes.request_stop()
+    fundo["thread"].join(1)
+    assert fundo["thread"].is_alive()  # a sessão saiu, mas a pré-busca ainda quer o resultado
+    banco.liberar.set()
+    fundo["thread"].join(5)
+    sessao["thread"].join(5)
+    assert fundo["resultado"]["VALOR"].tolist() == [1]
+    assert banco.executadas.count(query) == 1
+    assert db_utils._vigia["thread"].is_alive()
+
+
+def test_rerun_da_sessao_cancela_a_query(banco):
+    requisicoes = ScriptRequests()
+    sessao = em_thread(consultar_na_sessao, banco, requisicoes, "SELECT LENTA FROM RDB$DATABASE")
+    banco.esperar_execucoes(1)
+    requisicoes.request_rerun(RerunData())
+    sessao["thread"].join(5)
+    assert sessao["erro"].motivo == "superada"
+
+    # A conexão cancelada volta ao pool e atende a próxima query
+    banco.liberar.set()
+    assert db_utils.run_query(None, "SELECT LENTA FROM RDB$DATABASE")["VALOR"].tolist() == [1]
+
+
+def test_query_e_cancelada_so_quando_todas_as_sessoes_sairam(banco):
+    query = "SELECT LENTA FROM RDB$DATABASE"
+    primeira, segunda = ScriptRequests(), ScriptRequests()
+    lider = em_thread(consultar_na_sessao, banco, primeira, query)
+    banco.esperar_execucoes(1)
+    seguidora = em_thread(consultar_na_sessao, banco, segunda, query)
+
+    primeira.request_stop()
+    lider["thread"].join(1)
+    assert lider["thread"].is_alive()  # a segunda sessão ainda espera o resultado
+
+    segunda.request_stop()
+    lider["thread"].join(5)
+    seguidora["thread"].join(5)
+    assert lider["erro"].motivo == "superada"
+    assert isinstance(seguidora["erro"], db_utils.QueryCancelada)
+    assert len(banco.executadas) == 1
+
+
+def test_limite_de_tempo_cancela_query_de_fundo(banco):
+    db_utils._vigia["timeout"] = 0.5
+    with pytest.raises(db_utils.QueryCancelada) as erro:
+        db_utils.run_query(None, "SELECT LENTA FROM RDB$DATABASE")
+    assert erro.value.motivo == "timeout"
+    assert db_utils._vigia["thread"].is_alive()
+
+
+# --- Single-flight (coalescência de queries idênticas) ---
+def test_queries_identicas_simultaneas_executam_uma_vez(banco):
+    query = "SELECT LENTA FROM RDB$DATABASE WHERE ID = ?"
+    primeira = em_thread(db_utils.run_query, None, query, [1])
+    banco.esperar_execucoes(1)
+    seguidoras = [em_thread(db_utils.run_query, None, "SELECT   LENTA\n FROM RDB$DATABASE WHERE ID = ?", [1]) for _ in range(3)]
+    banco.liberar.set()
+    for chamada in [primeira, *seguidoras]:
+        chamada["thread"].join(5)
+        assert chamada["resultado"]["VALOR"].tolist() == [1]
+    assert len(banco.executadas) == 1
+
+    # Cada chamada recebe a sua cópia do DataFrame
+    seguidoras[0]["resultado"].loc[0, "VALOR"] = 99
+    assert primeira["resultado"]["VALOR"].tolist() == [1]
+
+
+def test_parametros_diferentes_nao_sao_coalescidos(banco):
+    query = "SELECT LENTA FROM RDB$DATABASE WHERE ID = ?"
+    chamadas = [em_thread(db_utils.run_query, None, query, [i]) for i in (1, 2)]
+    banco.esperar_execucoes(2)
+    banco.liberar.set()
+    for chamada in chamadas:
+        chamada["thread"].join(5)
+    assert len(banco.executadas) == 2
+
+
+def test_erro_da_execucao_chega_as_seguidoras(banco):
+    query = "SELECT LENTA_FALHA FROM RDB$DATABASE"
+    primeira = em_thread(db_utils.run_query, None, query)
+    banco.esperar_execucoes(1)
+    seguidora = em_thread(db_utils.run_query, None, query)
+    banco.liberar.set()
+    primeira["thread"].join(5)
+    seguidora["thread"].join(5)
+    assert "erro do banco" in str(primeira["erro"])
+    assert seguidora["erro"] is primeira["erro"]
+    assert len(banco.executadas) == 1
+
+
+def test_chamada_depois_do_fim_executa_de_novo(banco):
+    banco.liberar.set()
+    db_utils.run_query(None, "SELECT LENTA FROM RDB$DATABASE")
+    db_utils.run_query(None, "SELECT LENTA FROM RDB$DATABASE")
+    assert len(banco.executadas) == 2
+
+
+def test_seguidora_desiste_depois_do_timeout(banco):
+    query = "SELECT LENTA FROM RDB$DATABASE"
+    primeira = em_thread(db_utils.run_query, None, query)
+    banco.esperar_execucoes(1)
+    with pytest.raises(TimeoutError):
+        db_utils.run_query(None, query, timeout=0.3)
+    banco.liberar.set()
+    primeira["thread"].join(5)
+    assert primeira["resultado"]["VALOR"].tolist() == [1]
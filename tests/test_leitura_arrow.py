@@ -0,0 +1,94 @@
+import datetime
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import db_utils
+
+# cursor.description do driver: (nome, tipo, display_size, internal_size, precision, scale, null_ok)
+DESCRICAO = [
+    ("IDPESSOA", int, None, 4, 0, 0, False),
+    ("VALOR", Decimal, None, 8, 18, -2, True),
+    ("DATA_VENCIMENTO", datetime.date, None, 4, 0, 0, True),
+    ("DATA_OPERACAO", datetime.datetime, None, 8, 0, 0, True),
+    ("NOME", str, None, 60, 0, 0, True),
+    ("TAXA", float, None, 8, 0, 0, True),
+]
+LINHAS = [
+    (1, Decimal("10.50"), datetime.date(2024, 1, 31), datetime.datetime(2024, 1, 31, 8, 30), "Ana", 0.5),
+    (2, None, None, None, None, None),
+    (3, Decimal("-2.25"), datetime.date(2024, 2, 29), datetime.datetime(2024, 2, 29, 23, 59), "Ana", 1.0),
+]
+
+
+class CursorDriver:
+    def __init__(self, linhas, descricao):
+        self.linhas, self.description, self.lotes = list(linhas), descricao, 0
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchmany(self, tamanho):
+        lote, self.linhas = self.linhas[:tamanho], self.linhas[tamanho:]
+        self.lotes += bool(lote)
+        return lote
+
+    def close(self):
+        pass
+
+
+class ConexaoDriver:
+    def __init__(self, linhas, descricao=DESCRICAO):
+        self.cursor_aberto = CursorDriver(linhas, descricao)
+
+    def cursor(self):
+        return self.cursor_aberto
+
+
+@pytest.fixture(autouse=True)
+def driver(monkeypatch):
+    # A leitura em lotes só é usada com conexões do driver
+    monkeypatch.setattr(db_utils, "Connection", ConexaoDriver)
+    monkeypatch.setattr(db_utils, "TAMANHO_LOTE", 2)
+
+
+def test_tipos_declarados_pela_coluna():
+    conexao = ConexaoDriver(LINHAS)
+    tabela = db_utils._ler_arrow(conexao, "SELECT ...", [])
+    assert conexao.cursor_aberto.lotes == 2
+    assert tabela.schema.types == [pa.int64(), pa.float64(), pa.date32(), pa.timestamp("us"), pa.string(), pa.float64()]
+    assert tabela.column("VALOR").to_pylist() == [10.5, None, -2.25]
+
+
+def test_dataframe_com_tipos_numericos_e_datas():
+    df = db_utils._ler(ConexaoDriver(LINHAS), "SELECT ...", [], "arrow")
+    assert df["IDPESSOA"].dtype == "int64"
+    assert df["VALOR"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(df["DATA_VENCIMENTO"])
+    assert pd.api.types.is_datetime64_any_dtype(df["DATA_OPERACAO"])
+    assert df.loc[0, "DATA_VENCIMENTO"] == pd.Timestamp(2024, 1, 31)
+    assert df["VALOR"].isna().tolist() == [False, True, False]
+    assert df["NOME"].tolist()[::2] == ["Ana", "Ana"]
+
+
+def test_tabela_com_textos_como_dicionario():
+    tabela = db_utils._ler(ConexaoDriver(LINHAS), "SELECT ...", [], "tabela")
+    assert pa.types.is_dictionary(tabela.column("NOME").type)
+    assert tabela.column("NOME").to_pylist() == ["Ana", None, "Ana"]
+    assert tabela.column("IDPESSOA").type == pa.int64()
+
+
+def test_resultado_vazio_mantem_as_colunas():
+    tabela = db_utils._ler_arrow(ConexaoDriver([]), "SELECT ...", [])
+    assert tabela.num_rows == 0
+    assert tabela.column_names == [d[0] for d in DESCRICAO]
+    assert tabela.schema.field("VALOR").type == pa.float64()
+    assert tabela.schema.field("DATA_VENCIMENTO").type == pa.date32()
+
+
+def test_tipo_desconhecido_fica_para_o_pyarrow_inferir():
+    descricao = [("BLOB_TEXTO", object, None, 8, 0, 0, True)]
+    tabela = db_utils._ler_arrow(ConexaoDriver([("a",), ("b",)], descricao), "SELECT ...", [])
+    assert tabela.column("BLOB_TEXTO").to_pylist() == ["a", "b"]
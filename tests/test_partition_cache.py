@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import partition_cache
+
+QUERY = "SELECT DATA, VALOR FROM VENDAS WHERE DATA BETWEEN ? AND ?"
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    """Substitui run_query: uma linha por dia do intervalo pedido; guarda os intervalos buscados."""
+    pedidos = []
+
+    def run_query(_conn, query, params):
+        inicio, fim = params[0], params[1]
+        pedidos.append((inicio, fim))
+        dias = pd.date_range(inicio, fim, freq="D")
+        return pd.DataFrame({"DATA": dias, "VALOR": 1.0})
+
+    monkeypatch.setattr(partition_cache, "run_query", run_query)
+    return pedidos
+
+
+def test_particoes_usam_ano_inteiro_quando_cabe():
+    assert partition_cache.particoes(date(2023, 11, 15), date(2025, 2, 3)) == [
+        (date(2023, 11, 1), date(2023, 11, 30)),
+        (date(2023, 12, 1), date(2023, 12, 31)),
+        (date(2024, 1, 1), date(2024, 12, 31)),
+        (date(2025, 1, 1), date(2025, 1, 31)),
+        (date(2025, 2, 1), date(2025, 2, 28)),
+    ]
+
+
+def test_recorta_as_particoes_das_bordas(consultas):
+    df = partition_cache.buscar_periodo(None, QUERY, date(2024, 1, 20), date(2024, 3, 10))
+    datas = df["DATA"].dt.date
+    assert datas.min() == date(2024, 1, 20)
+    assert datas.max() == date(2024, 3, 10)
+    assert len(df) == (date(2024, 3, 10) - date(2024, 1, 20)).days + 1
+    assert datas.is_unique
+    assert consultas == [(date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 29)), (date(2024, 3, 1), date(2024, 3, 31))]
+
+
+def test_janela_deslocada_reaproveita_as_particoes(consultas):
+    partition_cache.buscar_periodo(None, QUERY, date(2024, 1, 20), date(2024, 3, 10))
+    df = partition_cache.buscar_periodo(None, QUERY, date(2024, 1, 25), date(2024, 4, 2))
+    assert consultas[3:] == [(date(2024, 4, 1), date(2024, 4, 30))]
+    assert df["DATA"].dt.date.min() == date(2024, 1, 25)
+    assert df["DATA"].dt.date.max() == date(2024, 4, 2)
+
+
+def test_janela_de_um_dia(consultas):
+    dia = date(2024, 2, 29)
+    df = partition_cache.buscar_periodo(None, QUERY, dia, dia, granularidade="dia")
+    assert df["DATA"].dt.date.tolist() == [dia]
+    assert consultas == [(dia, dia)]
+
+
+def test_sem_linhas_retorna_vazio(monkeypatch):
+    monkeypatch.setattr(partition_cache, "run_query", lambda _conn, query, params: pd.DataFrame(columns=["DATA", "VALOR"]))
+    assert partition_cache.buscar_periodo(None, QUERY, date(2024, 1, 1), date(2024, 1, 1) + timedelta(days=40)).empty
@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import query_cache
+
+
+def funcao_em_cache(tabelas, ttl=query_cache.TTL_PADRAO, durante=None):
+    """Função em cache que lê `tabelas` e conta as execuções; `durante` roda no meio do cálculo."""
+    chamadas = []
+
+    @query_cache.em_cache(ttl=ttl, aquecer=False)
+    def calcular(valor):
+        chamadas.append(valor)
+        query_cache.registrar_leitura(tabelas)
+        if durante is not None:
+            durante()
+        return valor * 2
+
+    return calcular, chamadas
+
+
+def test_repete_a_chamada_pelo_cache():
+    calcular, chamadas = funcao_em_cache({"VENDAS"})
+    assert calcular(1) == 2
+    assert calcular(1) == 2
+    assert calcular(2) == 4
+    assert chamadas == [1, 2]
+
+
+def test_invalidacao_remove_so_quem_leu_a_tabela():
+    vendas, chamadas_vendas = funcao_em_cache({"VENDAS"})
+    contratos, chamadas_contratos = funcao_em_cache({"CONTRATOS"})
+    # As duas saem do mesmo código (mesma identidade no cache): argumentos distintos, chaves distintas
+    vendas(1)
+    contratos(2)
+    assert query_cache.invalidar_tabelas({"VENDAS"}) == 1
+    vendas(1)
+    contratos(2)
+    assert chamadas_vendas == [1, 1]
+    assert chamadas_contratos == [2]
+
+
+def test_evento_durante_o_calculo_nao_e_guardado():
+    calcular, chamadas = funcao_em_cache({"VENDAS"}, durante=lambda: query_cache.invalidar_tabelas({"VENDAS"}))
+    assert calcular(1) == 2
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def test_evento_em_outra_tabela_durante_o_calculo_nao_impede_a_gravacao():
+    calcular, chamadas = funcao_em_cache({"VENDAS"}, durante=lambda: query_cache.invalidar_tabelas({"CONTRATOS"}))
+    calcular(1)
+    calcular(1)
+    assert chamadas == [1]
+
+
+def test_sem_canal_expira_pelo_ttl(relogio):
+    calcular, chamadas = funcao_em_cache({"VENDAS"}, ttl=60)
+    calcular(1)
+    relogio.avancar(59)
+    calcular(1)
+    relogio.avancar(2)
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def test_com_canal_tabela_monitorada_vale_ate_ttl_maximo(relogio):
+    query_cache._canal["ativo"] = True
+    calcular, chamadas = funcao_em_cache({"VENDAS"}, ttl=60)
+    calcular(1)
+    relogio.avancar(3600)
+    calcular(1)
+    assert chamadas == [1]
+    relogio.avancar(query_cache.TTL_MAXIMO)
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def test_com_canal_tabela_sem_trigger_expira_pelo_ttl(relogio):
+    query_cache._canal["ativo"] = True
+    calcular, chamadas = funcao_em_cache({"VENDAS", "PESSOAS"}, ttl=60)
+    calcular(1)
+    relogio.avancar(61)
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def test_com_canal_sem_tabelas_registradas_expira_pelo_ttl(relogio):
+    query_cache._canal["ativo"] = True
+    calcular, chamadas = funcao_em_cache(set(), ttl=60)
+    calcular(1)
+    relogio.avancar(61)
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def test_usos_ficam_limitados_mantendo_os_mais_usados(monkeypatch, relogio):
+    monkeypatch.setattr(query_cache, "LIMITE_USOS", 10)
+    funcao = object()
+    for _ in range(5):
+        query_cache.registrar_uso("frequente", funcao, {})
+    for i in range(20):
+        query_cache.registrar_uso(f"rara_{i}", funcao, {})
+    assert len(query_cache.usos()) <= 10
+    assert "frequente" in query_cache.usos()
+
+
+def test_callback_com_falha_nao_impede_os_seguintes(monkeypatch):
+    recebidas = []
+
+    def falha(tabelas):
+        raise KeyError("estado inconsistente")
+
+    monkeypatch.setattr(query_cache, "_ao_invalidar", [falha, recebidas.append])
+    calcular, chamadas = funcao_em_cache({"VENDAS"})
+    calcular(1)
+    assert query_cache.invalidar_tabelas({"VENDAS"}) == 1
+    assert recebidas == [{"VENDAS"}]
+    calcular(1)
+    assert chamadas == [1, 1]
+
+
+def compilar(fonte):
+    """Função `f` definida por `fonte`, no mesmo arquivo fictício (como uma página reexecutada)."""
+    escopo = {}
+    exec(compile(fonte, "pagina.py", "exec"), escopo)
+    return escopo["f"]
+
+
+def test_identidade_igual_para_o_mesmo_codigo():
+    fonte = "def f(x):\n    return [y for y in x if y in {'AB', 'BL'}] + ['SELECT 1']\n"
+    assert query_cache.identidade_funcao(compilar(fonte)) == query_cache.identidade_funcao(compilar(fonte))
+
+
+def test_identidade_muda_com_literal_nome_e_funcao_interna():
+    base = query_cache.identidade_funcao(compilar("def f(x):\n    return g('SELECT A FROM T', 10, lambda v: v * 2)\n"))
+    for fonte in (
+        "def f(x):\n    return g('SELECT B FROM T', 10, lambda v: v * 2)\n",
+        "def f(x):\n    return g('SELECT A FROM T', 20, lambda v: v * 2)\n",
+        "def f(x):\n    return h('SELECT A FROM T', 10, lambda v: v * 2)\n",
+        "def f(x):\n    return g('SELECT A FROM T', 10, lambda v: v * 3)\n",
+    ):
+        assert query_cache.identidade_funcao(compilar(fonte)) != base
+
+
+def test_literal_alterado_nao_reaproveita_a_entrada():
+    resultados = []
+    for fonte in ("def f(x):\n    return x + 1\n", "def f(x):\n    return x + 2\n"):
+        calcular = query_cache.em_cache(aquecer=False)(compilar(fonte))
+        resultados.append(calcular(1))
+    assert resultados == [2, 3]
+
+
+# --- Orçamento de memória e compressão ---
+@pytest.fixture
+def orcamento():
+    """configurar(bytes, bytes mínimos para comprimir); o padrão volta ao fim do teste."""
+    def ajustar(orcamento_bytes, compressao_minima_bytes=2**30):
+        query_cache.configurar({"orcamento_mb": orcamento_bytes / 2**20, "compressao_minima_kb": compressao_minima_bytes / 2**10})
+    yield ajustar
+    query_cache.configurar()
+
+
+def test_despeja_a_entrada_usada_ha_mais_tempo(orcamento):
+    orcamento(1000)
+    despejos = query_cache.estatisticas()["despejos"]
+    query_cache.gravar("a", b"a" * 400, set())
+    query_cache.gravar("b", b"b" * 400, set())
+    assert query_cache.ler("a")[0]  # "a" passa a ser a mais recente
+    query_cache.gravar("c", b"c" * 400, set())
+    assert [query_cache.contem(chave) for chave in "abc"] == [True, False, True]
+    assert query_cache.estatisticas()["bytes"] == 800
+    assert query_cache.estatisticas()["despejos"] == despejos + 1
+
+
+def test_entrada_maior_que_o_orcamento_nao_e_guardada(orcamento):
+    orcamento(1000)
+    grandes_demais = query_cache.estatisticas()["grandes_demais"]
+    query_cache.gravar("pequena", b"x" * 100, set())
+    query_cache.gravar("grande", b"x" * 1001, set())
+    assert query_cache.estatisticas()["grandes_demais"] == grandes_demais + 1
+    assert not query_cache.contem("grande")
+    assert query_cache.contem("pequena")
+
+
+def test_reduzir_o_orcamento_despeja_na_hora(orcamento):
+    orcamento(10_000)
+    for chave in "abcd":
+        query_cache.gravar(chave, b"x" * 1000, set())
+    orcamento(2500)
+    assert [query_cache.contem(chave) for chave in "abcd"] == [False, False, True, True]
+
+
+def test_invalidacao_libera_os_bytes(orcamento):
+    orcamento(10_000)
+    query_cache.gravar("vendas", b"x" * 1000, {"VENDAS"})
+    query_cache.gravar("contratos", b"x" * 500, {"CONTRATOS"})
+    query_cache.invalidar_tabelas({"VENDAS"})
+    assert query_cache.estatisticas()["bytes"] == 500
+
+
+def test_dataframe_grande_volta_igual_da_compressao(orcamento):
+    orcamento(2**30, compressao_minima_bytes=1)
+    df = pd.DataFrame({
+        "IDPESSOA": np.arange(5000, dtype="int64"),
+        "VALOR": np.tile([10.5, np.nan, -2.25, 0.0], 1250),
+        "DATA": pd.date_range("2024-01-01", periods=5000, freq="h"),
+        "NOME": np.tile(["Ana", "Bruno", None, "Carla", "Davi"], 1000),
+    }, index=pd.RangeIndex(10, 5010))
+    query_cache.gravar("df", df, set())
+    entrada = query_cache._entradas["df"]
+    assert entrada["comprimido"]
+    assert entrada["bytes"] < df.memory_usage(deep=True).sum()
+
+    encontrado, lido = query_cache.ler("df")
+    assert encontrado
+    pd.testing.assert_frame_equal(lido, df)
+    lido.loc[10, "VALOR"] = 99.0  # cada leitura é uma cópia
+    pd.testing.assert_frame_equal(query_cache.ler("df")[1], df)
+
+
+def test_colunas_nao_textuais_ficam_sem_comprimir(orcamento):
+    orcamento(2**30, compressao_minima_bytes=1)
+    df = pd.DataFrame({2024: [1.0, 2.0], 2025: [3.0, 4.0]})
+    query_cache.gravar("anos", df, set())
+    assert not query_cache._entradas["anos"]["comprimido"]
+    pd.testing.assert_frame_equal(query_cache.ler("anos")[1], df)
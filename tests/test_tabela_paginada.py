@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+import tabela_paginada
+
+# Nomes repetidos e nulos: o desempate pelo id e o COALESCE mantêm todas as linhas no keyset
+PESSOAS = [(1, "Bruno"), (2, None), (3, "Ana"), (4, "Bruno"), (5, None), (6, "Ana"), (7, "Carla"), (8, "Bruno"), (9, "")]
+COLUNAS = {"cliente": "COALESCE(p.NOME, '')"}
+ORIGEM = "FROM PESSOAS p WHERE p.ID > ?"
+
+
+@pytest.fixture
+def conexao():
+    conexao = sqlite3.connect(":memory:")
+    conexao.execute("CREATE TABLE PESSOAS (ID INTEGER PRIMARY KEY, NOME TEXT)")
+    conexao.executemany("INSERT INTO PESSOAS VALUES (?, ?)", PESSOAS)
+    yield conexao
+    conexao.close()
+
+
+def paginar(conexao, direcao, tamanho):
+    """Percorre as páginas como a tabela: cada uma a partir do cursor da última linha da anterior."""
+    paginas, cursor = [], None
+    while True:
+        condicoes, params = [], [0]
+        if cursor is not None:
+            condicao, params_cursor = tabela_paginada._condicao_cursor(COLUNAS["cliente"], "p.ID", direcao, cursor)
+            condicoes.append(condicao)
+            params += params_cursor
+        sql = tabela_paginada._sql_pagina(COLUNAS, ORIGEM, "p.ID", COLUNAS["cliente"], direcao, condicoes, tamanho)
+        linhas = conexao.execute(sql.replace(" ROWS ", " LIMIT "), params).fetchall()  # ROWS é do Firebird
+        paginas.append(linhas)
+        if len(linhas) < tamanho:
+            return paginas
+        cursor = linhas[-1]
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 4])
+@pytest.mark.parametrize("direcao", ["ASC", "DESC"])
+def test_keyset_percorre_todas_as_linhas_uma_vez(conexao, direcao, tamanho):
+    paginas = paginar(conexao, direcao, tamanho)
+    esperado = sorted(((nome or "", id_) for id_, nome in PESSOAS), reverse=direcao == "DESC")
+    assert [linha for pagina in paginas for linha in pagina] == esperado
+    assert all(len(pagina) == tamanho for pagina in paginas[:-1])
+
+
+def test_sem_coalesce_nome_nulo_some_do_keyset(conexao):
+    # Documenta por que as colunas ordenáveis não podem ser nulas: NULL não casa = nem >
+    colunas = {"cliente": "p.NOME"}
+    condicao, params = tabela_paginada._condicao_cursor(colunas["cliente"], "p.ID", "ASC", (None, 2))
+    sql = tabela_paginada._sql_pagina(colunas, ORIGEM, "p.ID", colunas["cliente"], "ASC", [condicao], 100)
+    ids = [linha[1] for linha in conexao.execute(sql.replace(" ROWS ", " LIMIT "), [0] + params)]
+    assert 5 not in ids